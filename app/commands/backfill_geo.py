@@ -0,0 +1,64 @@
+"""
+Agrega el campo GeoJSON "geo" a los análisis guardados antes de que
+existiera, a partir de location {lat, lng}.
+
+Uso:
+    python -m app.commands.backfill_geo [--batch 1000]
+
+Se puede volver a ejecutar: solo toca documentos sin "geo".
+"""
+import argparse
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from pymongo import UpdateOne
+
+from app.database.mongodb import connect_to_mongodb, close_mongodb, get_database
+from app.services.plant_analysis_service import location_to_geojson
+
+
+async def backfill(batch_size: int):
+    await connect_to_mongodb()
+    db = get_database()
+    collection = db["plant_analysis"]
+
+    updated = 0
+    ops = []
+
+    try:
+        cursor = collection.find(
+            {
+                "geo": {"$exists": False},
+                "location.lat": {"$type": "number"},
+                "location.lng": {"$type": "number"}
+            },
+            {"location": 1}
+        )
+        async for doc in cursor:
+            ops.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"geo": location_to_geojson(doc["location"])}}
+            ))
+            if len(ops) >= batch_size:
+                result = await collection.bulk_write(ops, ordered=False)
+                updated += result.modified_count
+                ops = []
+
+        if ops:
+            result = await collection.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+
+        print(f"Análisis actualizados con geo: {updated}")
+    finally:
+        await close_mongodb()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rellena el campo geo de los análisis existentes")
+    parser.add_argument("--batch", type=int, default=1000, help="Actualizaciones por bulk_write")
+    args = parser.parse_args()
+
+    asyncio.run(backfill(args.batch))
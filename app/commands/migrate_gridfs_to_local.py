@@ -0,0 +1,68 @@
+"""
+Copia las imágenes de GridFS al backend local conservando sus _id,
+así plant_analysis.image_url sigue apuntando al mismo archivo.
+
+Uso:
+    python -m app.commands.migrate_gridfs_to_local [--delete] [--root RUTA]
+
+Con --delete se borra cada archivo de GridFS después de copiarlo.
+Se puede volver a ejecutar: los archivos ya migrados se saltan.
+"""
+import argparse
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.database.mongodb import connect_to_mongodb, close_mongodb, get_database
+from app.services.blob_store import BLOB_LOCAL_ROOT, GridFSBlobStore, LocalBlobStore
+from app.services.image_storage import ensure_image_indexes
+
+
+async def migrate(root: str, delete: bool):
+    await connect_to_mongodb()
+    source = GridFSBlobStore()
+    target = LocalBlobStore(root)
+    db = get_database()
+
+    copied = skipped = 0
+    copied_bytes = 0
+
+    try:
+        # La app puede seguir con GridFS y no haber creado nunca los índices de "blobs"
+        await ensure_image_indexes(target)
+
+        async for doc in db["fs.files"].find({}, {"_id": 1, "filename": 1, "metadata": 1}):
+            blob_id = doc["_id"]
+
+            if await target.files.find_one({"_id": blob_id}, {"_id": 1}):
+                skipped += 1
+            else:
+                blob = await source.open(blob_id)
+                if blob is None:
+                    continue
+                await target.write(
+                    doc.get("filename") or str(blob_id),
+                    blob.iter_bytes(),
+                    doc.get("metadata") or {},
+                    blob_id=blob_id
+                )
+                copied += 1
+                copied_bytes += blob.length
+
+            if delete:
+                await source.delete(blob_id)
+
+        print(f"Migrados: {copied} ({copied_bytes} bytes), ya existían: {skipped}")
+    finally:
+        await close_mongodb()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra las imágenes de GridFS a disco local")
+    parser.add_argument("--root", default=BLOB_LOCAL_ROOT, help="Directorio destino")
+    parser.add_argument("--delete", action="store_true", help="Borrar de GridFS tras copiar")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.root, args.delete))
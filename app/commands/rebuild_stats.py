@@ -0,0 +1,36 @@
+"""
+Recalcula las estadísticas diarias de predicciones desde plant_analysis.
+Útil para poblarlas la primera vez o repararlas (p. ej. desde un cron).
+
+Uso:
+    python -m app.commands.rebuild_stats --from 2025-01-01 --to 2025-12-31
+"""
+import argparse
+import asyncio
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.database.mongodb import connect_to_mongodb, close_mongodb
+from app.services.stats_service import ensure_stats_indexes, rebuild_prediction_stats
+
+
+async def rebuild(start: datetime, end: datetime):
+    await connect_to_mongodb()
+    try:
+        await ensure_stats_indexes()
+        await rebuild_prediction_stats(start, end)
+        print(f"Estadísticas recalculadas del {start.date()} al {end.date()}")
+    finally:
+        await close_mongodb()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula las estadísticas de predicciones")
+    parser.add_argument("--from", dest="start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--to", dest="end", required=True, type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    asyncio.run(rebuild(args.start, args.end))
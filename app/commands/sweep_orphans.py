@@ -0,0 +1,167 @@
+"""
+Limpia datos huérfanos que quedaron antes del borrado en cascada de
+usuarios (o tras una caída a mitad de un borrado):
+
+  1. Análisis de usuarios que ya no existen.
+  2. Trabajos de borrado de usuarios pendientes o interrumpidos.
+  3. Imágenes que ningún análisis usa (y ref_count desajustados).
+  4. Variantes cuyo original ya no existe.
+  5. Chunks de GridFS sin su documento en fs.files.
+
+Uso:
+    python -m app.commands.sweep_orphans [--dry-run] [--grace-minutes 60]
+
+Las imágenes subidas o reutilizadas hace menos de --grace-minutes se
+ignoran, porque pueden pertenecer a una subida cuyo análisis aún no se
+guardó; también las del lote en curso de un trabajo de borrado.
+Se puede volver a ejecutar sin problema.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.database.mongodb import connect_to_mongodb, close_mongodb, get_database
+from app.services.blob_store import get_blob_store, init_blob_store
+from app.services.image_storage import reconcile_images
+from app.services.user_deletion import (
+    USER_DELETION_BATCH_SIZE,
+    USER_DELETION_JOBS,
+    claim_user_deletion_job,
+    process_user_deletion_job,
+    schedule_user_deletion
+)
+
+
+async def _missing_in(collection: str, local_collection: str, field: str, match: Optional[Dict] = None):
+    # Agrupa `field` de local_collection y devuelve los valores sin documento en `collection`
+    cursor = get_database()[local_collection].aggregate([
+        {"$match": match or {}},
+        {"$group": {"_id": f"${field}"}},
+        {"$lookup": {"from": collection, "localField": "_id", "foreignField": "_id", "as": "found"}},
+        {"$match": {"found": {"$size": 0}}},
+        {"$project": {"_id": 1}}
+    ], allowDiskUse=True)
+    return [doc["_id"] async for doc in cursor if doc["_id"] is not None]
+
+
+async def sweep(dry_run: bool, grace_minutes: int):
+    await connect_to_mongodb()
+    init_blob_store()
+    db = get_database()
+    store = get_blob_store()
+
+    try:
+        # 1. Análisis de usuarios borrados: se les crea su trabajo de borrado
+        orphan_users = await _missing_in("users", "plant_analysis", "user_id")
+        print(f"Usuarios inexistentes con análisis: {len(orphan_users)}")
+        if not dry_run:
+            for user_id in orphan_users:
+                await schedule_user_deletion(user_id)
+
+            # 2. Se ejecutan aquí todos los trabajos pendientes (incluidos los nuevos)
+            processed = 0
+            while True:
+                job = await claim_user_deletion_job()
+                if not job:
+                    break
+                await process_user_deletion_job(job)
+                processed += 1
+            print(f"Trabajos de borrado procesados: {processed}")
+
+        # 3. Imágenes originales sin análisis (también corrige ref_count).
+        # El recuento no ve una subida que reutilizó la imagen y aún no guardó
+        # su análisis: el periodo de gracia cuenta desde la última reutilización
+        cutoff = datetime.utcnow() - timedelta(minutes=grace_minutes)
+        cursor = store.files.find(
+            {
+                "metadata.variant_of": {"$exists": False},
+                "uploadDate": {"$lt": cutoff},
+                "$or": [
+                    {"metadata.last_reused_at": {"$exists": False}},
+                    {"metadata.last_reused_at": {"$lt": cutoff}}
+                ]
+            },
+            {"_id": 1}
+        ).batch_size(USER_DELETION_BATCH_SIZE)
+
+        # Un trabajo de borrado en curso descuenta sus propias referencias
+        in_progress = {
+            image["image_id"]
+            async for job in db[USER_DELETION_JOBS].find(
+                {"pending_batch": {"$exists": True}},
+                {"pending_batch.images": 1}
+            )
+            for image in job["pending_batch"]["images"]
+        }
+
+        checked = deleted = 0
+        batch = []
+        async for doc in cursor:
+            if doc["_id"] in in_progress:
+                continue
+            batch.append(doc["_id"])
+            if len(batch) >= USER_DELETION_BATCH_SIZE:
+                checked += len(batch)
+                deleted += await _sweep_images(batch, dry_run)
+                batch = []
+        if batch:
+            checked += len(batch)
+            deleted += await _sweep_images(batch, dry_run)
+        print(f"Imágenes revisadas: {checked}, sin uso {'encontradas' if dry_run else 'borradas'}: {deleted}")
+
+        # 4. Variantes sin original
+        variants = await store.files.find(
+            {"metadata.variant_of": {"$exists": True}},
+            {"metadata.variant_of": 1}
+        ).to_list(None)
+        originals = {v["metadata"]["variant_of"] for v in variants}
+        existing = {
+            doc["_id"]
+            async for doc in store.files.find({"_id": {"$in": list(originals)}}, {"_id": 1})
+        }
+        orphan_variants = [v["_id"] for v in variants if v["metadata"]["variant_of"] not in existing]
+        print(f"Variantes sin original: {len(orphan_variants)}")
+        if not dry_run:
+            await store.delete_many(orphan_variants)
+
+        # 5. Chunks de GridFS sin fs.files (p. ej. caída entre borrar metadata y datos).
+        # fs.files se escribe al cerrar la subida: se ignoran los ids recientes
+        orphan_chunks = await _missing_in(
+            "fs.files", "fs.chunks", "files_id",
+            {"files_id": {"$lt": ObjectId.from_datetime(cutoff)}}
+        )
+        print(f"Archivos de GridFS con chunks huérfanos: {len(orphan_chunks)}")
+        if not dry_run and orphan_chunks:
+            await db["fs.chunks"].delete_many({"files_id": {"$in": orphan_chunks}})
+
+    finally:
+        await close_mongodb()
+
+
+async def _sweep_images(image_ids, dry_run: bool) -> int:
+    if not dry_run:
+        return await reconcile_images(image_ids)
+
+    used = {
+        doc["_id"]
+        async for doc in get_database()["plant_analysis"].aggregate([
+            {"$match": {"image_url": {"$in": image_ids}}},
+            {"$group": {"_id": "$image_url"}}
+        ])
+    }
+    return sum(1 for image_id in image_ids if image_id not in used)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Limpia análisis e imágenes huérfanos")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar, sin borrar")
+    parser.add_argument("--grace-minutes", type=int, default=60, help="Ignorar imágenes más recientes")
+    args = parser.parse_args()
+
+    asyncio.run(sweep(args.dry_run, args.grace_minutes))
@@ -0,0 +1,68 @@
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE
+from pymongo.errors import OperationFailure
+
+from app.database.mongodb import get_database
+from app.services.ai_cache import ensure_ai_cache_indexes
+from app.services.image_storage import ensure_image_indexes
+from app.services.stats_service import ensure_stats_indexes
+from app.services.user_deletion import ensure_user_deletion_indexes
+
+
+# Si el índice único de users.email no se pudo crear (hay duplicados), el
+# registro y la actualización de usuarios vuelven a buscar el correo antes
+class IndexState:
+    users_email_unique: bool = False
+
+index_state = IndexState()
+
+
+async def _drop_obsolete(collection, name: str):
+    # Índices reemplazados por uno más completo: se borran si todavía existen
+    try:
+        await collection.drop_index(name)
+    except OperationFailure:
+        pass
+
+
+async def ensure_indexes():
+    """
+    Crea los índices al iniciar. create_index es idempotente: si el
+    índice ya existe con la misma definición no hace nada.
+    """
+    db = get_database()
+    analyses = db["plant_analysis"]
+
+    # Historial por usuario y listados paginados (keyset sobre created_at, _id)
+    await analyses.create_index([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    await analyses.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+    # Búsquedas por predicción y rango de fechas; con _id la exportación filtrada
+    # por predicción (orden created_at, _id) no necesita ordenar en memoria
+    await analyses.create_index([("prediction", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    await _drop_obsolete(analyses, "prediction_1_created_at_-1")
+    # Ubicación como punto GeoJSON en "geo" (location guarda {lat, lng} planos)
+    await analyses.create_index([("geo", GEOSPHERE)])
+    # Mapa de calor: rectángulo por rangos de latitud y longitud
+    await analyses.create_index([("location.lat", ASCENDING), ("location.lng", ASCENDING)])
+    # Permiso de lectura de imágenes (¿el usuario tiene un análisis con esta imagen?)
+    await analyses.create_index([("image_url", ASCENDING), ("user_id", ASCENDING)])
+    # Barrido de la cola de IA: solo los análisis que pidieron IA tienen ai_status
+    await analyses.create_index([("ai_status", ASCENDING)], sparse=True)
+
+    try:
+        await db["users"].create_index("email", unique=True)
+        index_state.users_email_unique = True
+    except OperationFailure as e:
+        # Hay correos duplicados: la app arranca pero hay que limpiarlos
+        index_state.users_email_unique = False
+        print(f"No se pudo crear el índice único users.email: {e}")
+
+    # GridFS crea estos índices en la primera escritura; se aseguran igual
+    await db["fs.files"].create_index([("filename", ASCENDING), ("uploadDate", ASCENDING)])
+    await db["fs.chunks"].create_index([("files_id", ASCENDING), ("n", ASCENDING)], unique=True)
+
+    await ensure_image_indexes()
+    await ensure_ai_cache_indexes()
+    await ensure_stats_indexes()
+    await ensure_user_deletion_indexes()
+
+    print("Índices de MongoDB verificados")
@@ -27,7 +27,9 @@ class PlantAnalysis(BaseModel):
     user_id: PyObjectId
     prediction: str
     location: Dict[str, float]
+    geo: Optional[Dict[str, Any]] = None  # GeoJSON Point [lng, lat] para consultas 2dsphere
     image_url: PyObjectId  
+    ai_status: Optional[str] = None  # pending | running | done | failed
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     model_config = {
@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from app.services.user_service import register_user, login_user, update_user, delete_user
 from app.schemas.user_schemas import UserRegisterSchema, UserLoginSchema, UserResponseSchema
+from app.utils.security import get_current_user_id, ensure_same_user
 from typing import Dict
 
 auth_router = APIRouter()
@@ -15,9 +16,11 @@ async def signin(data: UserLoginSchema):
 
 #Daniel Tamara Rivera
 @auth_router.put("/update/{user_id}", response_model=UserResponseSchema)
-async def update(user_id: str, data: Dict):
+async def update(user_id: str, data: Dict, current_user_id: str = Depends(get_current_user_id)):
+    ensure_same_user(user_id, current_user_id)
     return await update_user(user_id, data)
 
 @auth_router.delete("/delete/{user_id}")
-async def delete(user_id: str):
+async def delete(user_id: str, current_user_id: str = Depends(get_current_user_id)):
+    ensure_same_user(user_id, current_user_id)
     return await delete_user(user_id)
\ No newline at end of file
@@ -1,18 +1,134 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+import re
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from bson import ObjectId
-from io import BytesIO
-from app.database.mongodb import get_gridfs
+from app.services.blob_store import get_blob_store
+from app.services.image_variants import VARIANT_SIZES, get_or_create_variant
+from app.services.plant_analysis_service import user_has_image
+from app.utils.security import bearer_scheme, get_current_claims, user_id_from_token
 
 router = APIRouter()
 
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+# Las imágenes nunca cambian (cada subida tiene un _id nuevo); "private"
+# porque ahora requieren autenticación y no deben quedar en cachés compartidas
+_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+async def _image_user_id(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> str:
+    # <img src> no puede enviar Authorization: se acepta también ?token=
+    if credentials is None and token:
+        user_id = user_id_from_token(token)
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Token inválido o expirado")
+        return user_id
+    return (await get_current_claims(credentials))["user_id"]
+
+
+def _parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """
+    Devuelve (inicio, fin) inclusivo para un único rango "bytes=a-b".
+    None si no hay rango o si tiene varios (se sirve el archivo completo).
+    Lanza 416 si el rango no se puede satisfacer.
+    """
+    if not header or "," in header:
+        return None
+
+    match = _RANGE_RE.fullmatch(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # Rango sufijo: los últimos N bytes
+        start = max(0, length - int(last))
+        end = length - 1
+    else:
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+
+    if start >= length or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Rango no válido",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, end
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+# size: thumb | medium (variante redimensionada); sin size se sirve el original
 @router.get("/images/{image_id}")
-async def get_image(image_id: str):
-    fs = get_gridfs()
-
-    try:
-        grid_out = await fs.open_download_stream(ObjectId(image_id))
-        content = await grid_out.read()
-        return StreamingResponse(BytesIO(content), media_type="image/jpeg")
-    except Exception:
+async def get_image(
+    image_id: str,
+    request: Request,
+    size: Optional[str] = Query(None),
+    current_user_id: str = Depends(_image_user_id)
+):
+    if not ObjectId.is_valid(image_id):
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+
+    file_id = ObjectId(image_id)
+    # Solo se sirven imágenes de análisis del propio usuario (404 para no revelar si existe)
+    if not await user_has_image(current_user_id, file_id):
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+
+    if size is not None:
+        if size not in VARIANT_SIZES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tamaño no válido, usa: {', '.join(VARIANT_SIZES)}"
+            )
+        try:
+            file_id = await get_or_create_variant(file_id, size)
+        except Exception as e:
+            print(f"No se pudo generar la variante {size} de {image_id}: {e}")
+            raise HTTPException(status_code=422, detail="No se pudo procesar la imagen")
+        if file_id is None:
+            raise HTTPException(status_code=404, detail="Imagen no encontrada")
+
+    blob = await get_blob_store().open(file_id)
+    if blob is None:
         raise HTTPException(status_code=404, detail="Imagen no encontrada")
+
+    etag = f'"{blob.id}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": _CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # Backend en disco: FileResponse usa sendfile y resuelve Range por su cuenta
+    if blob.path is not None:
+        return FileResponse(blob.path, media_type=blob.content_type, headers=headers)
+
+    length = blob.length
+    byte_range = _parse_range(request.headers.get("range"), length)
+    if byte_range is None:
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(blob.iter_bytes(), media_type=blob.content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob.iter_bytes(start, end - start + 1),
+        status_code=206,
+        media_type=blob.content_type,
+        headers=headers
+    )
@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends
+from app.services.ai_cache import get_ai_cache_stats
+from app.services.analysis_orchestrator import get_ai_flight_stats
+from app.services.ai_jobs import get_ai_job_stats
+from app.services.analysis_events import analysis_hub
+from app.services.gemini_client import get_gemini_client
+from app.services.image_storage import get_dedup_report
+from app.services.analysis_cache import get_analysis_cache_stats
+from app.services.user_deletion import get_user_deletion_stats
+from app.utils.security import get_password_pool_stats, get_token_cache_stats, require_admin
+
+# Métricas internas del proceso: solo administradores
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+###Endpoint: contadores de la caché de respuestas de IA
+@router.get("/metrics/ai-cache")
+async def ai_cache_metrics():
+    return get_ai_cache_stats()
+
+
+###Endpoint: generaciones de IA agrupadas (single-flight)
+@router.get("/metrics/ai-inflight")
+async def ai_inflight_metrics():
+    return get_ai_flight_stats()
+
+
+###Endpoint: estado de la cola de IA en segundo plano
+@router.get("/metrics/ai-jobs")
+async def ai_jobs_metrics():
+    return get_ai_job_stats()
+
+
+###Endpoint: WebSockets conectados y modo de notificación
+@router.get("/metrics/ws")
+async def ws_metrics():
+    return analysis_hub.stats()
+
+
+###Endpoint: estado del circuito, concurrencia y hedging de Gemini
+@router.get("/metrics/gemini")
+async def gemini_metrics():
+    return get_gemini_client().stats()
+
+
+###Endpoint: almacenamiento ahorrado por la deduplicación de imágenes
+@router.get("/metrics/image-dedup")
+async def image_dedup_metrics():
+    return await get_dedup_report()
+
+
+###Endpoint: aciertos de la caché de lecturas de análisis
+@router.get("/metrics/analysis-cache")
+async def analysis_cache_metrics():
+    return get_analysis_cache_stats()
+
+
+###Endpoint: cola del pool de hashing de contraseñas
+@router.get("/metrics/password-pool")
+async def password_pool_metrics():
+    return get_password_pool_stats()
+
+
+###Endpoint: caché de tokens JWT ya verificados
+@router.get("/metrics/auth-tokens")
+async def auth_token_metrics():
+    return get_token_cache_stats()
+
+
+###Endpoint: trabajos de borrado en cascada de usuarios por estado
+@router.get("/metrics/user-deletions")
+async def user_deletion_metrics():
+    return await get_user_deletion_stats()
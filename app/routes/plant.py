@@ -1,34 +1,66 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, Request
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from typing import List, Optional
+from pydantic import TypeAdapter, ValidationError
+from datetime import datetime
+from fastapi.responses import StreamingResponse
 from bson import ObjectId
 from app.services.analysis_orchestrator import create_analysis_with_ai
+from app.services.gemini_client import GeminiClient, get_gemini_client
+from app.services.ai_jobs import AI_ASYNC_MODE, submit_analysis_with_ai
+from app.services.ai_stream import stream_analysis_with_ai
+from app.services.analysis_batch import BATCH_MAX_BYTES, BATCH_MAX_ITEMS, save_analysis_batch
+from app.schemas.plant_schemas import BatchItemSchema
+from app.utils.security import (
+    get_active_user_id,
+    get_current_claims,
+    get_current_user_id,
+    ensure_same_user,
+    is_admin,
+    require_admin
+)
 
 
 from app.services.plant_analysis_service import (
     save_analysis_record,
     get_analysis_by_id,
+    get_analysis_owner,
     get_analyses_by_user,
     get_all_analyses,
     delete_analysis,
     get_ai_response_by_analysis_id,
-    get_ai_summary_by_analysis_id
+    get_ai_summary_by_analysis_id,
+    get_ai_status_by_analysis_id
 )
-from app.database.mongodb import get_gridfs, get_database
+from app.services.image_storage import store_upload
+from app.services.export_service import iter_analyses_export
+from app.services.geo_service import MAX_HEATMAP_CELLS, get_analyses_nearby, get_heatmap, heatmap_cell_count
 
 router = APIRouter()
 
+_batch_items = TypeAdapter(List[BatchItemSchema])
+_form_bool = TypeAdapter(bool)
+
+
+async def _ensure_owner(analysis_id: str, current_user_id: str):
+    owner = await get_analysis_owner(analysis_id)
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Análisis no encontrado")
+    ensure_same_user(owner, current_user_id)
+
+
 @router.post("/analysis/")
 async def upload_analysis(
-    user_id: str = Form(...),
     prediction: str = Form(...),
-    lat: float = Form(...),
-    lng: float = Form(...),
-    image: UploadFile = File(...)
+    lat: float = Form(..., ge=-90, le=90),
+    lng: float = Form(..., ge=-180, le=180),
+    image: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    current_user_id: str = Depends(get_active_user_id)
 ):
-    fs = get_gridfs()
-
-    image_data = await image.read()
-    filename = image.filename or "uploaded_file"
-    image_id = await fs.upload_from_stream(filename, image_data)
+    # El usuario sale del token; user_id en el formulario se acepta solo si coincide
+    user_id = ensure_same_user(user_id, current_user_id)
+    image_id = await store_upload(image)
 
     location = {"lat": lat, "lng": lng}
 
@@ -42,40 +74,160 @@ async def upload_analysis(
         "id": record_id
     }
 
+def _too_many_images() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Máximo {BATCH_MAX_ITEMS} imágenes por lote")
+
+
+###Endpoint: subida en lote (sincronización de fotos tomadas sin conexión)
+# Campos multipart: images (archivos), items (JSON con [{"prediction", "lat", "lng"}, ...]
+# en el mismo orden que images) y with_ai. El formulario se lee a mano para cortar
+# antes de recibir y guardar en disco más de BATCH_MAX_ITEMS archivos.
+@router.post("/analysis/batch")
+async def upload_analysis_batch(
+    request: Request,
+    current_user_id: str = Depends(get_active_user_id)
+):
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > BATCH_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"El lote supera el tamaño máximo de {BATCH_MAX_BYTES} bytes")
+
+    try:
+        async with request.form(max_files=BATCH_MAX_ITEMS) as form:
+            images = [image for image in form.getlist("images") if not isinstance(image, str)]
+            items = form.get("items")
+            if not images or not isinstance(items, str):
+                raise HTTPException(status_code=422, detail="Se requieren images e items")
+
+            try:
+                parsed_items = _batch_items.validate_json(items)
+                with_ai = _form_bool.validate_python(form.get("with_ai") or False)
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=f"items inválido: {e}")
+
+            if len(parsed_items) != len(images):
+                raise HTTPException(status_code=400, detail="items debe tener un elemento por imagen")
+
+            result = await save_analysis_batch(current_user_id, images, parsed_items, with_ai)
+    except HTTPException:
+        raise
+    except StarletteHTTPException as e:
+        # El parser se detiene en cuanto llega el archivo BATCH_MAX_ITEMS + 1
+        if str(e.detail).startswith("Too many files"):
+            raise _too_many_images()
+        raise
+
+    return {
+        "message": "Lote procesado",
+        **result
+    }
+
+###Endpoint: exportación completa en NDJSON o CSV (streaming desde el cursor)
+# Incluye user_id y ubicación exacta de todos los usuarios: solo administradores.
+# Debe declararse antes de /analysis/{analysis_id}
+@router.get("/analysis/export")
+async def export_analysis(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    prediction: Optional[str] = None,
+    include_images: bool = False,
+    admin: dict = Depends(require_admin)
+):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"plant_analysis.{'csv' if format == 'csv' else 'ndjson'}"
+
+    return StreamingResponse(
+        iter_analyses_export(format, batch_size, start, end, prediction, include_images),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+###Endpoint: análisis cercanos a un punto (radio en metros)
+@router.get("/analysis/nearby")
+async def get_nearby_analysis(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(5000, gt=0, le=500000),
+    prediction: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user_id: str = Depends(get_current_user_id)
+):
+    return await get_analyses_nearby(lat, lng, radius_m, prediction, limit)
+
+###Endpoint: mapa de calor, conteo de análisis por celda de la cuadrícula
+@router.get("/analysis/heatmap")
+async def get_analysis_heatmap(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    cell_deg: float = Query(0.1, gt=0, le=10),
+    prediction: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    current_user_id: str = Depends(get_current_user_id)
+):
+    if min_lat >= max_lat or min_lng >= max_lng:
+        raise HTTPException(status_code=400, detail="Rectángulo inválido")
+
+    if heatmap_cell_count(min_lat, min_lng, max_lat, max_lng, cell_deg) > MAX_HEATMAP_CELLS:
+        raise HTTPException(status_code=400, detail="Demasiadas celdas, aumenta cell_deg")
+
+    cells = await get_heatmap(min_lat, min_lng, max_lat, max_lng, cell_deg, prediction, start, end)
+    return {"cell_deg": cell_deg, "cells": cells}
+
 #Funciona
 @router.get("/analysis/{analysis_id}")
-async def get_analysis(analysis_id: str):
+async def get_analysis(analysis_id: str, current_user_id: str = Depends(get_current_user_id)):
     if not ObjectId.is_valid(analysis_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
     analysis = await get_analysis_by_id(analysis_id)
     if not analysis:
         raise HTTPException(status_code=404, detail="Análisis no encontrado")
+    ensure_same_user(analysis["user_id"], current_user_id)
 
     return analysis  
 
 #Funciona
+# Paginado: se pide la siguiente página con ?cursor=<next_cursor>
 @router.get("/user/{user_id}/analysis")
-async def get_user_analysis_history(user_id: str):
+async def get_user_analysis_history(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user_id: str = Depends(get_current_user_id)
+):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="ID de usuario inválido")
+    ensure_same_user(user_id, current_user_id)
 
-    analyses = await get_analyses_by_user(user_id)
-
-    if not analyses:
-        return {"message": "El usuario no tiene análisis guardados."}
-
-    return analyses
+    try:
+        return await get_analyses_by_user(user_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
+# Un administrador ve todos los análisis; cualquier otro usuario, solo los suyos
 @router.get("/analysis/")
-async def get_all_analysis():
-    return await get_all_analyses()
+async def get_all_analysis(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    claims: dict = Depends(get_current_claims)
+):
+    try:
+        if is_admin(claims):
+            return await get_all_analyses(limit, cursor)
+        return await get_analyses_by_user(claims["user_id"], limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
 
 @router.delete("/analysis/{analysis_id}")
-async def remove_analysis(analysis_id: str):
+async def remove_analysis(analysis_id: str, current_user_id: str = Depends(get_current_user_id)):
     if not ObjectId.is_valid(analysis_id):
         raise HTTPException(status_code=400, detail="ID inválido")
+    await _ensure_owner(analysis_id, current_user_id)
 
     success = await delete_analysis(analysis_id)
     if not success:
@@ -85,18 +237,18 @@ async def remove_analysis(analysis_id: str):
 
 @router.post("/analysis/with-ai")
 async def upload_analysis_with_ai(
-    user_id: str = Form(...),
     prediction: str = Form(...),
-    lat: float = Form(...),
-    lng: float = Form(...),
-    image: UploadFile = File(...)
+    lat: float = Form(..., ge=-90, le=90),
+    lng: float = Form(..., ge=-180, le=180),
+    image: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    gemini: GeminiClient = Depends(get_gemini_client),
+    current_user_id: str = Depends(get_active_user_id)
 ):
+    user_id = ensure_same_user(user_id, current_user_id)
 
-    # 1. Guardar imagen en GridFS
-    fs = get_gridfs()
-    image_data = await image.read()
-    filename = image.filename or "uploaded_file"
-    image_id = await fs.upload_from_stream(filename, image_data)
+    # 1. Guardar imagen en GridFS (por bloques)
+    image_id = await store_upload(image)
 
     # 2. Construir ubicación
     location = {
@@ -104,8 +256,22 @@ async def upload_analysis_with_ai(
         "lng": lng
     }
 
+    # 3a. Modo en segundo plano: se responde apenas se guarda el análisis
+    if AI_ASYNC_MODE:
+        result = await submit_analysis_with_ai(
+            user_id=user_id,
+            prediction=prediction,
+            location=location,
+            image_id=str(image_id)
+        )
+        return {
+            "message": "Análisis guardado, la IA se está generando",
+            **result
+        }
+
     # 3. Llamar al orquestador
     result = await create_analysis_with_ai(
+        gemini=gemini,
         user_id=user_id,
         prediction=prediction,
         location=location,
@@ -117,11 +283,41 @@ async def upload_analysis_with_ai(
         **result
     }
 
+###Endpoint: análisis con IA transmitido por Server-Sent Events
+# Eventos: analysis (id), mensaje (texto parcial), done (respuesta final)
+@router.post("/analysis/with-ai/stream")
+async def upload_analysis_with_ai_stream(
+    prediction: str = Form(...),
+    lat: float = Form(..., ge=-90, le=90),
+    lng: float = Form(..., ge=-180, le=180),
+    image: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    gemini: GeminiClient = Depends(get_gemini_client),
+    current_user_id: str = Depends(get_active_user_id)
+):
+    user_id = ensure_same_user(user_id, current_user_id)
+    image_id = await store_upload(image)
+
+    location = {"lat": lat, "lng": lng}
+
+    return StreamingResponse(
+        stream_analysis_with_ai(
+            gemini=gemini,
+            user_id=user_id,
+            prediction=prediction,
+            location=location,
+            image_id=str(image_id)
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 ###Endpoint: obtener respuesta completa de la IA
 @router.get("/analysis/{analysis_id}/ai")
-async def get_analysis_ai_response(analysis_id: str):
+async def get_analysis_ai_response(analysis_id: str, current_user_id: str = Depends(get_current_user_id)):
         if not ObjectId.is_valid(analysis_id):
             raise HTTPException(status_code=400, detail="ID inválido")
+        await _ensure_owner(analysis_id, current_user_id)
 
         result = await get_ai_response_by_analysis_id(analysis_id)
 
@@ -138,9 +334,10 @@ async def get_analysis_ai_response(analysis_id: str):
 
 ###Endpoint: obtener solo el resumen (historial / listas)
 @router.get("/analysis/{analysis_id}/ai/summary")
-async def get_analysis_ai_summary(analysis_id: str):
+async def get_analysis_ai_summary(analysis_id: str, current_user_id: str = Depends(get_current_user_id)):
         if not ObjectId.is_valid(analysis_id):
             raise HTTPException(status_code=400, detail="ID inválido")
+        await _ensure_owner(analysis_id, current_user_id)
 
         result = await get_ai_summary_by_analysis_id(analysis_id)
 
@@ -154,20 +351,16 @@ async def get_analysis_ai_summary(analysis_id: str):
 
 ###Endpoint opcional (muy útil): estado de IA
 @router.get("/analysis/{analysis_id}/ai/status")
-async def get_analysis_ai_status(analysis_id: str):
+async def get_analysis_ai_status(analysis_id: str, current_user_id: str = Depends(get_current_user_id)):
         if not ObjectId.is_valid(analysis_id):
             raise HTTPException(status_code=400, detail="ID inválido")
+        await _ensure_owner(analysis_id, current_user_id)
 
-        db = get_database()
-        analysis = await db["plant_analysis"].find_one(
-            {"_id": ObjectId(analysis_id)},
-            {"_id": 0, "ai_generated": 1}
-        )
+        # status: pending | running | done | failed (not_requested si nunca se pidió IA)
+        status = await get_ai_status_by_analysis_id(analysis_id)
 
-        if not analysis:
+        if not status:
             raise HTTPException(status_code=404, detail="Análisis no encontrado")
 
-        return {
-            "ai_generated": analysis.get("ai_generated", False)
-        }
+        return status
 
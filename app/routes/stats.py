@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.services.stats_service import get_prediction_stats
+from app.utils.security import get_current_user_id
+
+# Conteos agregados (sin datos de usuarios): basta con estar autenticado
+router = APIRouter(dependencies=[Depends(get_current_user_id)])
+
+MAX_STATS_DAYS = 366
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # Las fechas se guardan en UTC sin zona (datetime.utcnow()): una fecha con
+    # zona se convierte a UTC para poder compararla con una sin zona
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+###Endpoint: conteos diarios por predicción (opcionalmente por región)
+@router.get("/stats/predictions")
+async def prediction_stats(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    by_region: bool = False,
+    region: Optional[str] = None
+):
+    start, end = _naive_utc(start), _naive_utc(end)
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+    if end - start > timedelta(days=MAX_STATS_DAYS):
+        raise HTTPException(status_code=400, detail=f"El rango máximo es de {MAX_STATS_DAYS} días")
+
+    return await get_prediction_stats(start, end, by_region, region)
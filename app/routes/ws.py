@@ -0,0 +1,37 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+from bson import ObjectId
+from app.services.analysis_events import analysis_hub
+from app.utils.security import user_id_from_token
+
+router = APIRouter()
+
+
+async def _forward_events(queue: asyncio.Queue, websocket: WebSocket):
+    while True:
+        event = await queue.get()
+        await websocket.send_json(event)
+
+
+###WebSocket: avisa cuando la IA de un análisis del usuario está lista
+# El navegador no puede enviar Authorization en el handshake: el token va en ?token=
+@router.websocket("/ws/analysis/{user_id}")
+async def analysis_events(websocket: WebSocket, user_id: str, token: Optional[str] = Query(None)):
+    if not ObjectId.is_valid(user_id) or user_id_from_token(token) != user_id:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    queue = analysis_hub.subscribe(user_id)
+    sender = asyncio.create_task(_forward_events(queue, websocket))
+
+    try:
+        # Se leen los mensajes del cliente solo para detectar la desconexión
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        analysis_hub.unsubscribe(user_id, queue)
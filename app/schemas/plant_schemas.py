@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+
+
+# Metadatos de cada imagen en POST /analysis/batch (mismo orden que los archivos)
+class BatchItemSchema(BaseModel):
+    prediction: str = Field(..., min_length=1)
+    lat: float = Field(..., ge=-90, le=90)
+    lng: float = Field(..., ge=-180, le=180)
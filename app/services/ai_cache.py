@@ -0,0 +1,108 @@
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from pymongo.errors import OperationFailure
+
+from app.database.mongodb import get_database
+from app.utils.geohash import encode_geohash
+
+# Caché de respuestas de IA: LRU en memoria + colección compartida en MongoDB.
+# La clave es la predicción normalizada y la celda geohash de la ubicación,
+# así usuarios de la misma región con la misma condición reutilizan la respuesta.
+AI_CACHE_COLLECTION = "ai_cache"
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+AI_CACHE_GEOHASH_PRECISION = int(os.getenv("AI_CACHE_GEOHASH_PRECISION", "4"))
+AI_CACHE_MEMORY_SIZE = int(os.getenv("AI_CACHE_MEMORY_SIZE", "1024"))
+
+_memory_cache: TTLCache = TTLCache(maxsize=AI_CACHE_MEMORY_SIZE, ttl=AI_CACHE_TTL_SECONDS)
+
+_stats = {
+    "memory_hits": 0,
+    "mongo_hits": 0,
+    "misses": 0,
+    "stores": 0,
+}
+
+
+def normalize_prediction(prediction: str) -> str:
+    # "Tomato___Septoria leaf-spot" -> "tomato_septoria_leaf_spot"
+    return re.sub(r"[\s\-_]+", "_", prediction.strip().lower()).strip("_")
+
+
+def build_cache_key(prediction: str, location: dict) -> str:
+    key = normalize_prediction(prediction)
+
+    lat = location.get("lat")
+    lng = location.get("lng")
+    if lat is not None and lng is not None:
+        key += ":" + encode_geohash(lat, lng, AI_CACHE_GEOHASH_PRECISION)
+
+    return key
+
+
+async def ensure_ai_cache_indexes():
+    db = get_database()
+    collection = db[AI_CACHE_COLLECTION]
+    try:
+        await collection.create_index("created_at", expireAfterSeconds=AI_CACHE_TTL_SECONDS)
+    except OperationFailure:
+        # El índice ya existe con otro TTL: se actualiza en lugar de recrearlo
+        await db.command(
+            "collMod",
+            AI_CACHE_COLLECTION,
+            index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": AI_CACHE_TTL_SECONDS}
+        )
+
+
+async def get_cached_ai_content(key: str) -> Optional[Tuple[Dict, Dict]]:
+    entry = _memory_cache.get(key)
+    if entry is not None:
+        _stats["memory_hits"] += 1
+        return entry
+
+    db = get_database()
+    # El monitor TTL de MongoDB corre cada ~60 s, así que se filtra también por fecha
+    doc = await db[AI_CACHE_COLLECTION].find_one({
+        "_id": key,
+        "created_at": {"$gte": datetime.utcnow() - timedelta(seconds=AI_CACHE_TTL_SECONDS)}
+    })
+    if doc is None:
+        _stats["misses"] += 1
+        return None
+
+    _stats["mongo_hits"] += 1
+    entry = (doc["ai_response"], doc["ai_summary"])
+    _memory_cache[key] = entry
+    return entry
+
+
+async def set_cached_ai_content(key: str, ai_response: Dict, ai_summary: Dict):
+    _memory_cache[key] = (ai_response, ai_summary)
+
+    db = get_database()
+    await db[AI_CACHE_COLLECTION].replace_one(
+        {"_id": key},
+        {
+            "ai_response": ai_response,
+            "ai_summary": ai_summary,
+            "created_at": datetime.utcnow()
+        },
+        upsert=True
+    )
+    _stats["stores"] += 1
+
+
+def get_ai_cache_stats() -> Dict:
+    lookups = _stats["memory_hits"] + _stats["mongo_hits"] + _stats["misses"]
+    hits = _stats["memory_hits"] + _stats["mongo_hits"]
+    return {
+        **_stats,
+        "lookups": lookups,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        "memory_entries": len(_memory_cache),
+        "geohash_precision": AI_CACHE_GEOHASH_PRECISION,
+        "ttl_seconds": AI_CACHE_TTL_SECONDS,
+    }
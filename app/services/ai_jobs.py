@@ -0,0 +1,206 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.database.mongodb import get_database
+from app.services.analysis_orchestrator import get_or_generate_ai_content, store_ai_result
+from app.services.gemini_client import get_gemini_client, is_fallback_response
+from app.services.plant_analysis_service import save_analysis_record
+from app.services.analysis_cache import invalidate_analysis
+
+# Cola de generación de IA en segundo plano.
+# El estado del trabajo vive en el propio documento de plant_analysis
+# (ai_status, ai_attempts, ai_lease_until, ai_retry_at), así que si el
+# proceso muere los trabajos pendientes se recuperan al reiniciar.
+AI_ASYNC_MODE = os.getenv("AI_ASYNC_MODE", "false").lower() in ("1", "true", "yes")
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "4"))
+AI_JOB_QUEUE_SIZE = int(os.getenv("AI_JOB_QUEUE_SIZE", "1000"))
+AI_JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+AI_JOB_LEASE_SECONDS = int(os.getenv("AI_JOB_LEASE_SECONDS", "120"))
+AI_JOB_SWEEP_INTERVAL = int(os.getenv("AI_JOB_SWEEP_INTERVAL", "30"))
+
+
+class AIJobQueue:
+    queue: Optional[asyncio.Queue] = None
+    tasks: List[asyncio.Task] = []
+
+ai_jobs = AIJobQueue()
+
+
+def _claimable_filter(now: datetime) -> Dict:
+    return {
+        "$or": [
+            {
+                "ai_status": "pending",
+                "$or": [
+                    {"ai_retry_at": {"$exists": False}},
+                    {"ai_retry_at": {"$lte": now}}
+                ]
+            },
+            # Trabajos que quedaron "running" porque el proceso murió
+            {"ai_status": "running", "ai_lease_until": {"$lte": now}}
+        ]
+    }
+
+
+def enqueue_ai_job(analysis_id: str):
+    if ai_jobs.queue is None:
+        return
+    try:
+        ai_jobs.queue.put_nowait(analysis_id)
+    except asyncio.QueueFull:
+        # El documento sigue "pending" en MongoDB, el barrido lo recogerá
+        pass
+
+
+async def submit_analysis_with_ai(
+    user_id: str,
+    prediction: str,
+    location: dict,
+    image_id: str
+) -> Dict:
+    """
+    Guarda el análisis con ai_status="pending" y delega la generación
+    a la cola. El cliente consulta /analysis/{id}/ai/status.
+    """
+    analysis_id = await save_analysis_record(
+        user_id=user_id,
+        prediction=prediction,
+        location=location,
+        image_id=image_id,
+        ai_status="pending"
+    )
+    enqueue_ai_job(analysis_id)
+
+    return {
+        "analysis_id": analysis_id,
+        "ai_status": "pending"
+    }
+
+
+async def claim_ai_job(analysis_id: str) -> Optional[Dict]:
+    db = get_database()
+    now = datetime.utcnow()
+    invalidate_analysis(analysis_id)
+    return await db["plant_analysis"].find_one_and_update(
+        {"_id": ObjectId(analysis_id), **_claimable_filter(now)},
+        {
+            "$set": {
+                "ai_status": "running",
+                "ai_lease_until": now + timedelta(seconds=AI_JOB_LEASE_SECONDS)
+            },
+            "$inc": {"ai_attempts": 1}
+        },
+        projection={"prediction": 1, "location": 1, "ai_attempts": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _process(analysis_id: str):
+    # Sin cliente de Gemini el trabajo no se toma: sigue "pending" sin gastar intentos
+    gemini = get_gemini_client()
+    doc = await claim_ai_job(analysis_id)
+    if not doc:
+        return  # ya lo tomó otro worker o ya terminó
+
+    try:
+        ai_response, ai_summary = await get_or_generate_ai_content(
+            gemini, doc["prediction"], doc["location"]
+        )
+        if is_fallback_response(ai_response):
+            raise RuntimeError("Gemini devolvió la respuesta de respaldo")
+
+        await store_ai_result(doc["_id"], ai_response, ai_summary, True)
+
+    except Exception as e:
+        await fail_ai_job(doc, e)
+
+
+async def fail_ai_job(doc: Dict, error: Exception) -> str:
+    """
+    Registra el fallo de un trabajo ya tomado con claim_ai_job: lo
+    devuelve a la cola con backoff o, si agotó los intentos, lo marca
+    como fallido. Devuelve el nuevo ai_status (pending | failed).
+    """
+    analysis_id = str(doc["_id"])
+    attempts = doc.get("ai_attempts", 1)
+    if attempts >= AI_JOB_MAX_ATTEMPTS:
+        print(f"Trabajo de IA {analysis_id} falló definitivamente: {error}")
+        await store_ai_result(doc["_id"], None, None, False, ai_error=str(error))
+        return "failed"
+
+    # Backoff exponencial antes del siguiente intento
+    delay = 2 ** attempts
+    db = get_database()
+    await db["plant_analysis"].update_one(
+        {"_id": doc["_id"]},
+        {
+            "$set": {
+                "ai_status": "pending",
+                "ai_error": str(error),
+                "ai_retry_at": datetime.utcnow() + timedelta(seconds=delay)
+            },
+            "$unset": {"ai_lease_until": ""}
+        }
+    )
+    invalidate_analysis(analysis_id)
+    asyncio.get_running_loop().call_later(delay, enqueue_ai_job, analysis_id)
+    return "pending"
+
+
+async def _worker():
+    while True:
+        analysis_id = await ai_jobs.queue.get()
+        try:
+            await _process(analysis_id)
+        except Exception as e:
+            print(f"Error procesando trabajo de IA {analysis_id}: {e}")
+        finally:
+            ai_jobs.queue.task_done()
+
+
+async def _sweeper():
+    # Recupera trabajos pendientes (al iniciar y luego periódicamente)
+    while True:
+        try:
+            free = AI_JOB_QUEUE_SIZE - ai_jobs.queue.qsize()
+            if free > 0:
+                db = get_database()
+                cursor = db["plant_analysis"].find(
+                    _claimable_filter(datetime.utcnow()), {"_id": 1}
+                ).limit(free)
+                async for doc in cursor:
+                    enqueue_ai_job(str(doc["_id"]))
+        except Exception as e:
+            print(f"Error recuperando trabajos de IA: {e}")
+
+        await asyncio.sleep(AI_JOB_SWEEP_INTERVAL)
+
+
+async def start_ai_workers():
+    ai_jobs.queue = asyncio.Queue(maxsize=AI_JOB_QUEUE_SIZE)
+    ai_jobs.tasks = [asyncio.create_task(_worker()) for _ in range(AI_JOB_WORKERS)]
+    ai_jobs.tasks.append(asyncio.create_task(_sweeper()))
+    print(f"Cola de IA iniciada con {AI_JOB_WORKERS} workers")
+
+
+async def stop_ai_workers():
+    for task in ai_jobs.tasks:
+        task.cancel()
+    await asyncio.gather(*ai_jobs.tasks, return_exceptions=True)
+    ai_jobs.tasks = []
+    ai_jobs.queue = None
+    print("Cola de IA detenida")
+
+
+def get_ai_job_stats() -> Dict:
+    return {
+        "async_mode": AI_ASYNC_MODE,
+        "workers": AI_JOB_WORKERS,
+        "queued": ai_jobs.queue.qsize() if ai_jobs.queue is not None else 0,
+        "queue_size": AI_JOB_QUEUE_SIZE,
+    }
@@ -0,0 +1,130 @@
+import json
+import re
+from typing import AsyncIterator, Dict, Optional
+
+from app.services.ai_cache import build_cache_key, get_cached_ai_content, set_cached_ai_content
+from app.services.ai_jobs import claim_ai_job, fail_ai_job
+from app.services.analysis_orchestrator import is_single_call_mode, store_ai_result
+from app.services.gemini_client import (
+    GeminiClient,
+    is_fallback_content,
+    split_combined_response,
+)
+from app.services.plant_analysis_service import save_analysis_record
+from app.services.prompt_service import build_plant_prompt
+
+_MENSAJE_RE = re.compile(r'"mensaje"\s*:\s*"')
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _partial_mensaje(buffer: str) -> Optional[str]:
+    """
+    Extrae el valor (posiblemente incompleto) del campo "mensaje"
+    de un JSON que todavía se está generando.
+    """
+    match = _MENSAJE_RE.search(buffer)
+    if not match:
+        return None
+
+    out = []
+    i = match.end()
+    while i < len(buffer):
+        c = buffer[i]
+        if c == "\\":
+            if i + 1 >= len(buffer):
+                break  # escape cortado, se espera al siguiente fragmento
+            nxt = buffer[i + 1]
+            if nxt == "u":
+                if i + 6 > len(buffer):
+                    break
+                out.append(chr(int(buffer[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            out.append(_ESCAPES.get(nxt, nxt))
+            i += 2
+            continue
+        if c == '"':
+            break
+        out.append(c)
+        i += 1
+
+    return "".join(out)
+
+
+async def stream_analysis_with_ai(
+    gemini: GeminiClient,
+    user_id: str,
+    prediction: str,
+    location: dict,
+    image_id: str
+) -> AsyncIterator[str]:
+    """
+    Guarda el análisis y transmite por SSE el "mensaje" de Gemini a
+    medida que llega. Al final persiste el JSON completo igual que el
+    orquestador. Si falla, el trabajo vuelve a la cola de IA con sus
+    reintentos; si el cliente se desconecta, el lease del trabajo vence
+    y la cola termina la generación.
+    """
+    analysis_id = await save_analysis_record(
+        user_id=user_id,
+        prediction=prediction,
+        location=location,
+        image_id=image_id,
+        ai_status="pending"
+    )
+    yield _sse("analysis", {"analysis_id": analysis_id})
+
+    job = await claim_ai_job(analysis_id)
+    if not job:
+        # Otro worker ya lo tomó: el cliente debe consultar /ai/status
+        yield _sse("queued", {"analysis_id": analysis_id})
+        return
+
+    key = build_cache_key(prediction, location)
+    cached = await get_cached_ai_content(key)
+
+    if cached is not None:
+        ai_response, ai_summary = cached
+        yield _sse("mensaje", {"delta": ai_response.get("mensaje", "")})
+        await store_ai_result(job["_id"], ai_response, ai_summary, True)
+        yield _sse("done", {"analysis_id": analysis_id, "ai_response": ai_response})
+        return
+
+    combined = is_single_call_mode()
+    prompt = build_plant_prompt(prediction, location)
+    buffer = ""
+    sent = ""
+
+    try:
+        async for text in gemini.generate_stream(prompt, combined=combined):
+            buffer += text
+            mensaje = _partial_mensaje(buffer)
+            if mensaje and len(mensaje) > len(sent):
+                yield _sse("mensaje", {"delta": mensaje[len(sent):]})
+                sent = mensaje
+
+        data = json.loads(buffer.strip("` \n"))
+        if combined:
+            ai_response, ai_summary = split_combined_response(data)
+        else:
+            ai_response = data
+            ai_summary = await gemini.generate_summary(ai_response)
+
+        if not is_fallback_content(ai_response, ai_summary):
+            await set_cached_ai_content(key, ai_response, ai_summary)
+        await store_ai_result(job["_id"], ai_response, ai_summary, True)
+
+    except Exception as e:
+        print(f"Error transmitiendo respuesta: {e}")
+        status = await fail_ai_job(job, e)
+        if status == "pending":
+            # Se reintenta en segundo plano: el cliente consulta /ai/status
+            yield _sse("queued", {"analysis_id": analysis_id})
+            return
+        ai_response = None
+
+    yield _sse("done", {"analysis_id": analysis_id, "ai_response": ai_response})
@@ -0,0 +1,100 @@
+import asyncio
+import os
+from typing import Dict, List
+
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+
+from app.schemas.plant_schemas import BatchItemSchema
+from app.services.ai_jobs import enqueue_ai_job
+from app.services.image_storage import MAX_UPLOAD_BYTES, release_image, store_upload
+from app.services.plant_analysis_service import save_analysis_records
+
+# Sincronización de muchas fotos tomadas sin conexión en una sola petición
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+# Tope del cuerpo multipart: todas las imágenes al máximo más 1 MB para items y separadores
+BATCH_MAX_BYTES = BATCH_MAX_ITEMS * MAX_UPLOAD_BYTES + 1024 * 1024
+
+
+async def _store_all(images: List[UploadFile]) -> List:
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+
+    async def store(image: UploadFile):
+        async with semaphore:
+            return await store_upload(image)
+
+    # Un error en una imagen no detiene las demás
+    return await asyncio.gather(*(store(image) for image in images), return_exceptions=True)
+
+
+def _error_message(error: BaseException) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    return "No se pudo guardar la imagen"
+
+
+async def save_analysis_batch(
+    user_id: str,
+    images: List[UploadFile],
+    items: List[BatchItemSchema],
+    with_ai: bool = False
+) -> Dict:
+    """
+    Sube las imágenes en paralelo (hasta BATCH_UPLOAD_CONCURRENCY a la vez),
+    guarda los análisis con un solo insert_many y devuelve el resultado de
+    cada item. Con with_ai los análisis quedan "pending" en la cola de IA.
+    """
+    uploads = await _store_all(images)
+
+    results: List[Dict] = [
+        {"index": i, "filename": image.filename, "status": "error", "id": None}
+        for i, image in enumerate(images)
+    ]
+    to_save = []
+    for i, (item, upload) in enumerate(zip(items, uploads)):
+        if isinstance(upload, BaseException):
+            print(f"Error guardando la imagen {i} del lote: {upload}")
+            results[i]["error"] = _error_message(upload)
+            continue
+        to_save.append((i, {
+            "prediction": item.prediction,
+            "location": {"lat": item.lat, "lng": item.lng},
+            "image_id": str(upload)
+        }))
+
+    ai_status = "pending" if with_ai else None
+    try:
+        ids = await save_analysis_records(user_id, [record for _, record in to_save], ai_status)
+    except Exception as e:
+        # No se pudo guardar el lote (ni saber qué parte se guardó): ningún análisis se da por guardado
+        print(f"Error guardando los análisis del lote: {e}")
+        ids = [None] * len(to_save)
+
+    queued = []
+    for (i, record), analysis_id in zip(to_save, ids):
+        if analysis_id is None:
+            # La imagen ya se guardó: se suelta para no dejarla huérfana
+            try:
+                await release_image(ObjectId(record["image_id"]))
+            except Exception as e:
+                print(f"No se pudo liberar la imagen {record['image_id']}: {e}")
+            results[i]["error"] = "No se pudo guardar el análisis"
+            continue
+
+        results[i].update({"status": "saved", "id": analysis_id})
+        if with_ai:
+            results[i]["ai_status"] = ai_status
+            queued.append((record["prediction"], analysis_id))
+
+    # En orden de predicción: los trabajos iguales llegan juntos a los workers y
+    # comparten una sola llamada a Gemini (single-flight + caché de IA)
+    for _, analysis_id in sorted(queued):
+        enqueue_ai_job(analysis_id)
+
+    saved = sum(1 for result in results if result["status"] == "saved")
+    return {
+        "saved": saved,
+        "failed": len(results) - saved,
+        "items": results
+    }
@@ -0,0 +1,47 @@
+import copy
+import os
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+# Caché en memoria (por worker) de lecturas de un solo análisis.
+# Se invalida en cada escritura de este proceso; entre workers la
+# desactualización máxima es ANALYSIS_CACHE_TTL segundos.
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "2048"))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", "30"))
+
+_KINDS = ("analysis", "ai_response", "ai_summary", "ai_status", "owner")
+
+_cache: TTLCache = TTLCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL)
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def get_cached(kind: str, analysis_id: str) -> Optional[Any]:
+    value = _cache.get((kind, str(analysis_id)))
+    if value is None:
+        _stats["misses"] += 1
+        return None
+
+    _stats["hits"] += 1
+    # Copia para que quien llama no modifique la entrada cacheada
+    return copy.deepcopy(value)
+
+
+def set_cached(kind: str, analysis_id: str, value: Any):
+    _cache[(kind, str(analysis_id))] = copy.deepcopy(value)
+
+
+def invalidate_analysis(analysis_id):
+    _stats["invalidations"] += 1
+    for kind in _KINDS:
+        _cache.pop((kind, str(analysis_id)), None)
+
+
+def get_analysis_cache_stats() -> Dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "entries": len(_cache),
+        "ttl_seconds": ANALYSIS_CACHE_TTL,
+    }
@@ -0,0 +1,167 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.database.mongodb import get_database
+
+# Notificaciones de IA lista para los WebSockets.
+# Cada worker abre un solo change stream sobre plant_analysis y reparte
+# los eventos a los sockets suscritos. Si MongoDB no es replica set
+# (mongod standalone) se cae a un sondeo periódico por ai_updated_at.
+WS_POLL_INTERVAL = float(os.getenv("WS_POLL_INTERVAL", "3"))
+WS_QUEUE_SIZE = 100
+
+# Errores que indican que el servidor no soporta change streams (mongod
+# standalone): solo con estos se pasa al sondeo
+_CHANGE_STREAMS_UNSUPPORTED = {40573, 20}  # 20: IllegalOperation
+_CHANGE_STREAMS_UNSUPPORTED_NAMES = {"IllegalOperation"}
+
+_CHANGE_STREAM_PIPELINE = [
+    {
+        "$match": {
+            "operationType": "update",
+            "$or": [
+                {"updateDescription.updatedFields.ai_generated": True},
+                {"updateDescription.updatedFields.ai_status": "failed"}
+            ]
+        }
+    },
+    {
+        "$project": {
+            "documentKey": 1,
+            "fullDocument.user_id": 1,
+            "fullDocument.ai_status": 1,
+            "fullDocument.ai_generated": 1
+        }
+    }
+]
+
+
+def _change_streams_unsupported(error: OperationFailure) -> bool:
+    code_name = (error.details or {}).get("codeName")
+    return error.code in _CHANGE_STREAMS_UNSUPPORTED or code_name in _CHANGE_STREAMS_UNSUPPORTED_NAMES
+
+
+class AnalysisEventHub:
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.mode: Optional[str] = None  # change_stream | polling
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[user_id]
+
+    def _publish(self, doc: Dict):
+        user_id = str(doc.get("user_id"))
+        queues = self.subscribers.get(user_id)
+        if not queues:
+            return
+
+        event = {
+            "type": "ai_ready",
+            "analysis_id": str(doc["_id"]),
+            "ai_status": doc.get("ai_status"),
+            "ai_generated": doc.get("ai_generated", False)
+        }
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # cliente lento: se descarta el evento
+
+    async def _watch_change_stream(self):
+        db = get_database()
+        resume_token = None
+
+        while True:
+            try:
+                async with db["plant_analysis"].watch(
+                    _CHANGE_STREAM_PIPELINE,
+                    full_document="updateLookup",
+                    resume_after=resume_token
+                ) as stream:
+                    self.mode = "change_stream"
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        doc = change.get("fullDocument")
+                        if doc:
+                            self._publish({**doc, "_id": change["documentKey"]["_id"]})
+            except OperationFailure as e:
+                if _change_streams_unsupported(e):
+                    raise
+                # p. ej. ChangeStreamHistoryLost o un resume token inválido:
+                # se vuelve a abrir desde ahora, sin el token
+                print(f"Change stream inválido, se reabre sin resume token: {e}")
+                resume_token = None
+                await asyncio.sleep(1)
+            except PyMongoError as e:
+                print(f"Change stream interrumpido, reintentando: {e}")
+                await asyncio.sleep(1)
+
+    async def _poll(self):
+        self.mode = "polling"
+        db = get_database()
+        last_seen = datetime.utcnow()
+
+        while True:
+            await asyncio.sleep(WS_POLL_INTERVAL)
+            if not self.subscribers:
+                last_seen = datetime.utcnow()
+                continue
+
+            try:
+                user_ids = [ObjectId(uid) for uid in self.subscribers]
+                cursor = db["plant_analysis"].find(
+                    {
+                        "user_id": {"$in": user_ids},
+                        "ai_status": {"$in": ["done", "failed"]},
+                        "ai_updated_at": {"$gt": last_seen}
+                    },
+                    {"user_id": 1, "ai_status": 1, "ai_generated": 1, "ai_updated_at": 1}
+                )
+                async for doc in cursor:
+                    last_seen = max(last_seen, doc["ai_updated_at"])
+                    self._publish(doc)
+            except PyMongoError as e:
+                print(f"Error sondeando análisis: {e}")
+
+    async def _run(self):
+        try:
+            await self._watch_change_stream()
+        except OperationFailure as e:
+            print(f"Change streams no disponibles ({e}), usando sondeo")
+            await self._poll()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "users": len(self.subscribers),
+            "sockets": sum(len(q) for q in self.subscribers.values()),
+        }
+
+
+analysis_hub = AnalysisEventHub()
@@ -1,9 +1,14 @@
 from bson import ObjectId
-from typing import Dict, TypedDict,Dict, Optional, Any
+from datetime import datetime
+from typing import Dict, TypedDict,Dict, Optional, Any, Tuple
+import os
 
 from app.services.plant_analysis_service import save_analysis_record
 from app.services.prompt_service import build_plant_prompt
-from app.services.gemini_client import GeminiClient
+from app.services.gemini_client import GeminiClient, is_fallback_content
+from app.services.ai_cache import build_cache_key, get_cached_ai_content, set_cached_ai_content
+from app.services.single_flight import SingleFlight
+from app.services.analysis_cache import invalidate_analysis
 from app.database.mongodb import get_database
 
 
@@ -12,11 +17,91 @@ class AIAnalysisResult(TypedDict):
     ai_response: Optional[Dict[str, Any]]
 
 
-def get_gemini_client() -> GeminiClient:
-    return GeminiClient()
+# Generaciones en curso por clave de caché (una sola llamada a Gemini por clave)
+_ai_flight = SingleFlight()
+
+
+# Modo de una sola llamada (respuesta + resumen juntos), se elige por despliegue
+def is_single_call_mode() -> bool:
+    return os.getenv("GEMINI_SINGLE_CALL", "false").lower() in ("1", "true", "yes")
+
+
+async def generate_ai_content(gemini: GeminiClient, prompt: str) -> Tuple[Dict, Dict]:
+    if is_single_call_mode():
+        return await gemini.generate_combined(prompt)
+
+    ai_response = await gemini.generate(prompt)
+    ai_summary = await gemini.generate_summary(ai_response)
+    return ai_response, ai_summary
+
+
+async def get_or_generate_ai_content(
+    gemini: GeminiClient,
+    prediction: str,
+    location: dict
+) -> Tuple[Dict, Dict]:
+    """
+    Busca la respuesta en la caché (predicción + región) y solo
+    llama a Gemini si no existe. Las peticiones concurrentes con la
+    misma clave comparten una única generación. Las respuestas (o
+    resúmenes) de respaldo no se cachean.
+    """
+    key = build_cache_key(prediction, location)
+    return await _ai_flight.do(
+        key, lambda: _lookup_or_generate(gemini, key, prediction, location)
+    )
+
+
+async def _lookup_or_generate(
+    gemini: GeminiClient,
+    key: str,
+    prediction: str,
+    location: dict
+) -> Tuple[Dict, Dict]:
+    cached = await get_cached_ai_content(key)
+    if cached is not None:
+        return cached
+
+    prompt = build_plant_prompt(prediction, location)
+    ai_response, ai_summary = await generate_ai_content(gemini, prompt)
+
+    if not is_fallback_content(ai_response, ai_summary):
+        await set_cached_ai_content(key, ai_response, ai_summary)
+
+    return ai_response, ai_summary
+
+
+def get_ai_flight_stats() -> Dict[str, Any]:
+    return _ai_flight.stats()
+
+
+async def store_ai_result(
+    analysis_id: ObjectId,
+    ai_response: Optional[Dict],
+    ai_summary: Optional[Dict],
+    ai_generated: bool,
+    ai_error: Optional[str] = None
+):
+    db = get_database()
+    await db["plant_analysis"].update_one(
+        {"_id": analysis_id},
+        {
+            "$set": {
+                "ai_response": ai_response,
+                "ai_summary": ai_summary,
+                "ai_generated": ai_generated,
+                "ai_status": "done" if ai_generated else "failed",
+                "ai_error": ai_error,
+                "ai_updated_at": datetime.utcnow()
+            },
+            "$unset": {"ai_lease_until": "", "ai_retry_at": ""}
+        }
+    )
+    invalidate_analysis(analysis_id)
 
 
 async def create_analysis_with_ai(
+    gemini: GeminiClient,
     user_id: str,
     prediction: str,
     location: dict,
@@ -27,8 +112,6 @@ async def create_analysis_with_ai(
     de contenido explicativo usando IA generativa.
     """
 
-    gemini = get_gemini_client()
-
     analysis_id_str = await save_analysis_record(
         user_id=user_id,
         prediction=prediction,
@@ -38,28 +121,15 @@ async def create_analysis_with_ai(
 
     analysis_id = ObjectId(analysis_id_str)
 
-    prompt = build_plant_prompt(prediction, location)
-
     try:
-        ai_response = gemini.generate(prompt)
-        ai_summary = gemini.generate_summary(ai_response)
+        ai_response, ai_summary = await get_or_generate_ai_content(gemini, prediction, location)
         ai_generated = True
     except Exception:
         ai_response = None
         ai_summary = None
         ai_generated = False
 
-    db = get_database()
-    await db["plant_analysis"].update_one(
-        {"_id": analysis_id},
-        {
-            "$set": {
-                "ai_response": ai_response,
-                "ai_summary": ai_summary,
-                "ai_generated": ai_generated
-            }
-        }
-    )
+    await store_ai_result(analysis_id, ai_response, ai_summary, ai_generated)
 
     return {
         "analysis_id": str(analysis_id),
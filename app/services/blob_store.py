@@ -0,0 +1,258 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from bson import ObjectId
+from gridfs.errors import FileExists, NoFile
+from pymongo.errors import DuplicateKeyError
+
+from app.database.mongodb import get_database, get_gridfs
+
+# Almacenamiento de imágenes intercambiable.
+# Ambos backends guardan la metadata con el mismo formato que fs.files
+# (filename, length, uploadDate, metadata{...}), así la deduplicación,
+# el ref_count y las variantes funcionan igual con cualquiera de los dos.
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "gridfs")  # gridfs | local
+BLOB_LOCAL_ROOT = os.getenv("BLOB_LOCAL_ROOT", "./data/blobs")
+_READ_SIZE = 255 * 1024
+
+
+class BlobExistsError(Exception):
+    """Ya existe un blob con el mismo sha256 (índice único)."""
+
+
+class StoredBlob(ABC):
+    def __init__(self, blob_id: ObjectId, length: int, metadata: Optional[Dict]):
+        self.id = blob_id
+        self.length = length
+        self.metadata = metadata or {}
+        # Ruta en disco si el backend la tiene (permite servir con FileResponse)
+        self.path: Optional[str] = None
+
+    @property
+    def content_type(self) -> str:
+        return self.metadata.get("content_type") or "image/jpeg"  # las imágenes antiguas son JPEG
+
+    @abstractmethod
+    def iter_bytes(self, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        ...
+
+    async def read_all(self) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_bytes()])
+
+
+class BlobStore(ABC):
+    name: str
+
+    @property
+    @abstractmethod
+    def files(self):
+        """Colección con la metadata de los blobs."""
+
+    @abstractmethod
+    async def write(
+        self,
+        filename: str,
+        chunks: AsyncIterator[bytes],
+        metadata: Dict,
+        blob_id: Optional[ObjectId] = None
+    ) -> ObjectId:
+        """Guarda los bytes; lanza BlobExistsError si el sha256 ya existe."""
+
+    @abstractmethod
+    async def open(self, blob_id: ObjectId) -> Optional[StoredBlob]:
+        ...
+
+    @abstractmethod
+    async def delete_data(self, blob_id: ObjectId):
+        """Borra solo los bytes (la metadata ya se borró)."""
+
+    async def delete_data_many(self, blob_ids: List[ObjectId]):
+        for blob_id in blob_ids:
+            await self.delete_data(blob_id)
+
+    async def delete(self, blob_id: ObjectId):
+        await self.files.delete_one({"_id": blob_id})
+        await self.delete_data(blob_id)
+
+    async def delete_many(self, blob_ids: List[ObjectId]):
+        if not blob_ids:
+            return
+        await self.files.delete_many({"_id": {"$in": blob_ids}})
+        await self.delete_data_many(blob_ids)
+
+
+# ---------------------------------------------------------------- GridFS
+
+class GridFSBlob(StoredBlob):
+    def __init__(self, grid_out):
+        super().__init__(grid_out._id, grid_out.length, grid_out.metadata)
+        self._grid_out = grid_out
+
+    async def iter_bytes(self, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        remaining = self.length - start if length is None else length
+        self._grid_out.seek(start)
+        while remaining > 0:
+            chunk = await self._grid_out.read(min(_READ_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class GridFSBlobStore(BlobStore):
+    name = "gridfs"
+
+    @property
+    def files(self):
+        return get_database()["fs.files"]
+
+    async def write(self, filename, chunks, metadata, blob_id=None) -> ObjectId:
+        fs = get_gridfs()
+        if blob_id is None:
+            grid_in = fs.open_upload_stream(filename, metadata=metadata)
+        else:
+            grid_in = fs.open_upload_stream_with_id(blob_id, filename, metadata=metadata)
+
+        try:
+            async for chunk in chunks:
+                await grid_in.write(chunk)
+        except BaseException:
+            # Borra los chunks ya escritos
+            await grid_in.abort()
+            raise
+
+        try:
+            await grid_in.close()
+        except FileExists:
+            await get_database()["fs.chunks"].delete_many({"files_id": grid_in._id})
+            raise BlobExistsError(metadata.get("sha256"))
+
+        return grid_in._id
+
+    async def open(self, blob_id: ObjectId) -> Optional[StoredBlob]:
+        try:
+            return GridFSBlob(await get_gridfs().open_download_stream(blob_id))
+        except NoFile:
+            return None
+
+    async def delete_data(self, blob_id: ObjectId):
+        await get_database()["fs.chunks"].delete_many({"files_id": blob_id})
+
+    async def delete_data_many(self, blob_ids: List[ObjectId]):
+        # Un solo delete_many para los chunks de todos los archivos
+        if blob_ids:
+            await get_database()["fs.chunks"].delete_many({"files_id": {"$in": blob_ids}})
+
+
+# ---------------------------------------------------------------- Disco local
+
+class LocalBlob(StoredBlob):
+    def __init__(self, doc: Dict, path: str):
+        super().__init__(doc["_id"], doc["length"], doc.get("metadata"))
+        self.path = path
+
+    async def iter_bytes(self, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        remaining = self.length - start if length is None else length
+        f = await asyncio.to_thread(open, self.path, "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(_READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Guarda los bytes en disco (root/ab/cd/<id>) y la metadata en la
+    colección "blobs". Los archivos se sirven con FileResponse.
+    """
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @property
+    def files(self):
+        return get_database()["blobs"]
+
+    def path_for(self, blob_id: ObjectId) -> str:
+        key = str(blob_id)
+        return os.path.join(self.root, key[-2:], key[-4:-2], key)
+
+    async def write(self, filename, chunks, metadata, blob_id=None) -> ObjectId:
+        blob_id = blob_id or ObjectId()
+        path = self.path_for(blob_id)
+        tmp_path = path + ".tmp"
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+
+        length = 0
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(f.write, chunk)
+                length += len(chunk)
+        except BaseException:
+            f.close()
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise
+        f.close()
+        await asyncio.to_thread(os.replace, tmp_path, path)
+
+        try:
+            await self.files.insert_one({
+                "_id": blob_id,
+                "filename": filename,
+                "length": length,
+                "uploadDate": datetime.utcnow(),
+                "metadata": metadata
+            })
+        except BaseException as e:
+            # Sin su documento el archivo quedaría en disco sin que nadie lo conozca
+            await asyncio.to_thread(os.remove, path)
+            if isinstance(e, DuplicateKeyError):
+                raise BlobExistsError(metadata.get("sha256"))
+            raise
+
+        return blob_id
+
+    async def open(self, blob_id: ObjectId) -> Optional[StoredBlob]:
+        doc = await self.files.find_one({"_id": blob_id})
+        if not doc:
+            return None
+        return LocalBlob(doc, self.path_for(blob_id))
+
+    async def delete_data(self, blob_id: ObjectId):
+        try:
+            await asyncio.to_thread(os.remove, self.path_for(blob_id))
+        except FileNotFoundError:
+            pass
+
+
+class BlobStoreHolder:
+    store: Optional[BlobStore] = None
+
+blob_holder = BlobStoreHolder()
+
+
+def init_blob_store():
+    if BLOB_STORE_BACKEND == "local":
+        blob_holder.store = LocalBlobStore(BLOB_LOCAL_ROOT)
+    elif BLOB_STORE_BACKEND == "gridfs":
+        blob_holder.store = GridFSBlobStore()
+    else:
+        raise RuntimeError(f"BLOB_STORE_BACKEND desconocido: {BLOB_STORE_BACKEND}")
+    print(f"Almacenamiento de imágenes: {blob_holder.store.name}")
+
+
+def get_blob_store() -> BlobStore:
+    if blob_holder.store is None:
+        raise RuntimeError("El almacenamiento de imágenes no está inicializado. Debes ejecutar init_blob_store() primero.")
+    return blob_holder.store
@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.database.mongodb import get_database
+
+# Columnas de la exportación (para reentrenar el clasificador)
+EXPORT_FIELDS = ["id", "user_id", "prediction", "created_at", "lat", "lng", "ai_generated", "tema"]
+
+
+def _row(doc: Dict, include_images: bool) -> Dict:
+    location = doc.get("location") or {}
+    row = {
+        "id": str(doc["_id"]),
+        "user_id": str(doc.get("user_id", "")),
+        "prediction": doc.get("prediction"),
+        "created_at": doc["created_at"].isoformat() if doc.get("created_at") else None,
+        "lat": location.get("lat"),
+        "lng": location.get("lng"),
+        "ai_generated": doc.get("ai_generated", False),
+        "tema": (doc.get("ai_summary") or {}).get("tema")
+    }
+    if include_images:
+        row["image_id"] = str(doc["image_url"]) if doc.get("image_url") else None
+    return row
+
+
+def _csv_chunk(rows: List[Dict], fields: List[str], header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def iter_analyses_export(
+    fmt: str,
+    batch_size: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    prediction: Optional[str] = None,
+    include_images: bool = False
+) -> AsyncIterator[str]:
+    """
+    Recorre el cursor de Motor por lotes y emite NDJSON o CSV a medida
+    que llegan los documentos. La memoria usada depende de batch_size,
+    no del tamaño de la colección.
+    """
+    query: Dict = {}
+    if prediction:
+        query["prediction"] = prediction
+    if start or end:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = start
+        if end:
+            query["created_at"]["$lte"] = end
+
+    projection = {
+        "user_id": 1, "prediction": 1, "created_at": 1,
+        "location": 1, "ai_generated": 1, "ai_summary.tema": 1
+    }
+    if include_images:
+        projection["image_url"] = 1
+
+    fields = EXPORT_FIELDS + (["image_id"] if include_images else [])
+
+    db = get_database()
+    cursor = db["plant_analysis"].find(query, projection) \
+        .sort([("created_at", 1), ("_id", 1)]) \
+        .batch_size(batch_size)
+
+    if fmt == "csv":
+        yield _csv_chunk([], fields, header=True)
+
+    rows = []
+    async for doc in cursor:
+        rows.append(_row(doc, include_images))
+        if len(rows) >= batch_size:
+            yield _format(rows, fields, fmt)
+            rows = []
+
+    if rows:
+        yield _format(rows, fields, fmt)
+
+
+def _format(rows: List[Dict], fields: List[str], fmt: str) -> str:
+    if fmt == "csv":
+        return _csv_chunk(rows, fields, header=False)
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
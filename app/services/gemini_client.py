@@ -1,10 +1,27 @@
+import asyncio
 import json
-from typing import Dict, Iterator, Optional
+from typing import AsyncIterator, Dict, Optional, Tuple
 import google.genai as genai
-from google.genai import types
+from google.genai import errors, types
+import httpx
+from fastapi import HTTPException
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+from app.services.resilience import Bulkhead, CircuitBreaker, CircuitOpenError, hedged
 
 import os
 
+# Resiliencia (configurable por entorno)
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "20"))
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", "1"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "5"))
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", "30"))
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER")) if os.getenv("GEMINI_HEDGE_AFTER") else None
+# Máximo de espera entre dos fragmentos de generate_stream
+GEMINI_STREAM_IDLE_TIMEOUT = float(os.getenv("GEMINI_STREAM_IDLE_TIMEOUT", "10"))
+
 # Esquema para el frontend
 _response_schema_frontend = {
     "type": "object",
@@ -29,6 +46,17 @@ _response_schema_db = {
     "required": ["tema", "resumen", "descargo"]
 }
 
+# Esquema combinado (frontend + BD) para generar todo en una sola llamada
+_response_schema_combined = {
+    "type": "object",
+    "properties": {
+        **_response_schema_frontend["properties"],
+        "tema": {"type": "string"},
+        "resumen": {"type": "string"},
+    },
+    "required": ["mensaje", "descargo", "tema", "resumen"]
+}
+
 # Instrucciones para PLANTAS (frontend)
 _SYSTEM_INSTRUCTIONS_FRONTEND = (
     "Eres un asistente especializado en salud de plantas. "
@@ -50,11 +78,99 @@ _SYSTEM_INSTRUCTIONS_DB = (
     "Siempre incluye: 'Información educativa. No reemplaza asesoría agrícola profesional.'"
 )
 
+# Instrucciones para PLANTAS (respuesta + resumen en una sola llamada)
+_SYSTEM_INSTRUCTIONS_COMBINED = (
+    _SYSTEM_INSTRUCTIONS_FRONTEND
+    + " Además incluye en el mismo JSON: "
+    "'tema' (máximo 3 palabras) y "
+    "'resumen' (1-2 párrafos) que resuman la respuesta."
+)
+
+_DESCARGO = "Información educativa. No reemplaza asesoría agrícola profesional."
+
+_SUMMARY_KEYS = ("tema", "resumen")
+
+
+def _attempt_timeout() -> float:
+    # GEMINI_TIMEOUT es el presupuesto total: cada intento recibe su parte,
+    # así un intento lento no se come el tiempo de los reintentos
+    return GEMINI_TIMEOUT / (1 + GEMINI_RETRIES)
+
+
+def _build_http_options() -> types.HttpOptions:
+    # Límites del pool de conexiones HTTP hacia Gemini (configurables por entorno)
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("GEMINI_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "60")),
+    )
+    return types.HttpOptions(
+        timeout=int(_attempt_timeout() * 1000),
+        client_args={"limits": limits},
+        async_client_args={"limits": limits},
+    )
+
+
+_FALLBACK_MENSAJE = "No pude generar una respuesta en este momento. Por favor intenta nuevamente."
+
+
+def _is_transient_error(e: BaseException) -> bool:
+    if isinstance(e, (errors.ServerError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return isinstance(e, errors.APIError) and e.code == 429
+
+
+def fallback_response() -> Dict:
+    return {
+        "mensaje": _FALLBACK_MENSAJE,
+        "autocuidado": [],
+        "banderas_rojas": [],
+        "cuando_buscar_atencion": "",
+        "descargo": _DESCARGO
+    }
+
+
+def is_fallback_response(ai_response: Optional[Dict]) -> bool:
+    # Permite distinguir una respuesta real de la respuesta de respaldo
+    return not ai_response or ai_response.get("mensaje") == _FALLBACK_MENSAJE
+
+
+def fallback_summary(full_response: Dict) -> Dict:
+    return {
+        "tema": "Salud vegetal",
+        "resumen": full_response.get("mensaje", "")[:500],
+        "descargo": _DESCARGO
+    }
+
+
+def is_fallback_summary(ai_summary: Optional[Dict], full_response: Dict) -> bool:
+    # generate_summary devuelve fallback_summary(full_response) si la llamada falla
+    return not ai_summary or ai_summary == fallback_summary(full_response)
+
+
+def is_fallback_content(ai_response: Optional[Dict], ai_summary: Optional[Dict]) -> bool:
+    # Una respuesta solo se puede cachear si ni ella ni su resumen son de respaldo
+    return is_fallback_response(ai_response) or is_fallback_summary(ai_summary, ai_response)
+
+
+def split_combined_response(data: Dict) -> Tuple[Dict, Dict]:
+    # Separa el JSON combinado en ai_response (frontend) y ai_summary (BD)
+    ai_response = {k: v for k, v in data.items() if k not in _SUMMARY_KEYS}
+    ai_summary = {
+        "tema": data.get("tema", "Salud vegetal"),
+        "resumen": data.get("resumen", ""),
+        "descargo": data.get("descargo", _DESCARGO)
+    }
+    return ai_response, ai_summary
+
 
 class GeminiClient:
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.client = genai.Client(api_key=api_key or os.getenv("GEMINI_API_KEY"))
-        self.model = model or "gemini-2.5-flash"
+        self.client = genai.Client(
+            api_key=api_key or os.getenv("GEMINI_API_KEY"),
+            http_options=_build_http_options(),
+        )
+        self.model = model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
         # Config frontend
         self.config_frontend = types.GenerateContentConfig(
@@ -91,32 +207,117 @@ class GeminiClient:
             safety_settings=self.config_frontend.safety_settings,
         )
 
+        # Resiliencia: límite de concurrencia, circuito y hedging
+        self.hedge_model = os.getenv("GEMINI_HEDGE_MODEL") or None
+        self.bulkhead = Bulkhead(GEMINI_MAX_CONCURRENCY, GEMINI_QUEUE_TIMEOUT)
+        self.breaker = CircuitBreaker(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET)
+        self.metrics = {
+            "calls": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+        }
+
+        # Config combinada (una sola llamada)
+        self.config_combined = types.GenerateContentConfig(
+            system_instruction=_SYSTEM_INSTRUCTIONS_COMBINED,
+            temperature=0.3,
+            response_mime_type="application/json",
+            response_schema=_response_schema_combined,
+            safety_settings=self.config_frontend.safety_settings,
+        )
 
-    def generate(self, prompt: str) -> Dict:
-        try:
-            res = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=self.config_frontend
-            )
 
-            if not res.text:
-                raise ValueError("Respuesta vacía desde Gemini")
+    async def _generate_json(self, contents: str, config: types.GenerateContentConfig, model: str) -> Dict:
+        # Usa la superficie async del SDK (client.aio) para no bloquear el event loop.
+        # Los errores transitorios (5xx, 429, red, intento lento) se reintentan con tenacity.
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(1 + GEMINI_RETRIES),
+            wait=wait_exponential_jitter(initial=0.2, max=2),
+            retry=retry_if_exception(_is_transient_error),
+            reraise=True
+        ):
+            with attempt:
+                res = await asyncio.wait_for(
+                    self.client.aio.models.generate_content(
+                        model=model,
+                        contents=contents,
+                        config=config
+                    ),
+                    _attempt_timeout()
+                )
 
-            return json.loads(res.text.strip("` \n"))
+                if not res.text:
+                    raise ValueError("Respuesta vacía desde Gemini")
+
+                return json.loads(res.text.strip("` \n"))
+
+
+    async def _call(self, contents: str, config: types.GenerateContentConfig) -> Dict:
+        """
+        Capa de resiliencia: falla rápido si el circuito está abierto,
+        limita la concurrencia, aplica el timeout total y, si está
+        configurado, lanza una segunda llamada al modelo de respaldo
+        cuando la primera tarda más de GEMINI_HEDGE_AFTER segundos.
+        """
+        if self.breaker.is_open():
+            self.metrics["short_circuited"] += 1
+            raise CircuitOpenError("Circuito de Gemini abierto")
+
+        async with self.bulkhead:
+            if not self.breaker.allow():
+                self.metrics["short_circuited"] += 1
+                raise CircuitOpenError("Circuito de Gemini abierto")
+
+            self.metrics["calls"] += 1
+            hedge = None
+            if self.hedge_model:
+                hedge = lambda: self._generate_json(contents, config, self.hedge_model)
+
+            try:
+                result = await asyncio.wait_for(
+                    hedged(
+                        lambda: self._generate_json(contents, config, self.model),
+                        hedge,
+                        GEMINI_HEDGE_AFTER,
+                        self._record_hedge
+                    ),
+                    GEMINI_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self.metrics["timeouts"] += 1
+                self.breaker.record_failure()
+                raise
+            except asyncio.CancelledError:
+                self.breaker.cancel_probe()
+                raise
+            except Exception:
+                self.metrics["failures"] += 1
+                self.breaker.record_failure()
+                raise
+
+            self.breaker.record_success()
+            return result
+
+
+    def _record_hedge(self, hedge_won: bool):
+        self.metrics["hedged"] += 1
+        if hedge_won:
+            self.metrics["hedge_wins"] += 1
+
+
+    async def generate(self, prompt: str) -> Dict:
+        try:
+            return await self._call(prompt, self.config_frontend)
 
         except Exception as e:
-            print(f"Error generando respuesta: {e}")
-            return {
-                "mensaje": "No pude generar una respuesta en este momento. Por favor intenta nuevamente.",
-                "autocuidado": [],
-                "banderas_rojas": [],
-                "cuando_buscar_atencion": "",
-                "descargo": "Información educativa. No reemplaza asesoría agrícola profesional."
-            }
+            print(f"Error generando respuesta: {e!r}")
+            return fallback_response()
 
 
-    def generate_summary(self, full_response: Dict) -> Dict:
+    async def generate_summary(self, full_response: Dict) -> Dict:
         """
         Genera una versión resumida para guardar en la base de datos.
         """
@@ -132,21 +333,120 @@ class GeminiClient:
         """
 
         try:
-            res = self.client.models.generate_content(
-                model=self.model,
-                contents=summary_prompt,
-                config=self.config_db
-            )
+            return await self._call(summary_prompt, self.config_db)
+
+        except Exception as e:
+            print(f"Error generando resumen: {e!r}")
+            return fallback_summary(full_response)
+
 
-            if res.text is not None:
-                return json.loads(res.text)
-            else:
-                raise ValueError("Respuesta vacía desde Gemini")
+    async def generate_combined(self, prompt: str) -> Tuple[Dict, Dict]:
+        """
+        Genera la respuesta para el frontend y el resumen para la BD
+        en una sola llamada. Devuelve (ai_response, ai_summary) con la
+        misma forma que generate() y generate_summary().
+        """
+        try:
+            return split_combined_response(await self._call(prompt, self.config_combined))
 
         except Exception as e:
-            print(f"Error generando resumen: {e}")
-            return {
-                "tema": "Salud vegetal",
-                "resumen": full_response.get("mensaje", "")[:500],
-                "descargo": "Información educativa. No reemplaza asesoría agrícola profesional."
-            }
+            print(f"Error generando respuesta combinada: {e!r}")
+            ai_response = fallback_response()
+            return ai_response, fallback_summary(ai_response)
+
+
+    async def generate_stream(self, prompt: str, combined: bool = False) -> AsyncIterator[str]:
+        """
+        Devuelve el texto del JSON a medida que Gemini lo genera.
+        Con combined=True usa el esquema combinado (incluye tema y resumen).
+        Respeta el circuito y el límite de concurrencia, sin hedging.
+        """
+        config = self.config_combined if combined else self.config_frontend
+
+        async with self.bulkhead:
+            if not self.breaker.allow():
+                self.metrics["short_circuited"] += 1
+                raise CircuitOpenError("Circuito de Gemini abierto")
+
+            self.metrics["calls"] += 1
+            try:
+                stream = await asyncio.wait_for(
+                    self.client.aio.models.generate_content_stream(
+                        model=self.model,
+                        contents=prompt,
+                        config=config
+                    ),
+                    GEMINI_TIMEOUT
+                )
+                chunks = stream.__aiter__()
+                while True:
+                    # Un stream que deja de enviar fragmentos se corta igual que una llamada lenta
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), GEMINI_STREAM_IDLE_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        yield chunk.text
+            except (GeneratorExit, asyncio.CancelledError):
+                self.breaker.cancel_probe()
+                raise
+            except asyncio.TimeoutError:
+                self.metrics["timeouts"] += 1
+                self.breaker.record_failure()
+                raise
+            except Exception:
+                self.metrics["failures"] += 1
+                self.breaker.record_failure()
+                raise
+
+            self.breaker.record_success()
+
+
+    def stats(self) -> Dict:
+        return {
+            **self.metrics,
+            "model": self.model,
+            "hedge_model": self.hedge_model,
+            "timeout_seconds": GEMINI_TIMEOUT,
+            "attempt_timeout_seconds": round(_attempt_timeout(), 3),
+            "stream_idle_timeout_seconds": GEMINI_STREAM_IDLE_TIMEOUT,
+            "circuit": self.breaker.stats(),
+            "concurrency": self.bulkhead.stats(),
+        }
+
+
+    async def aclose(self):
+        await self.client.aio.aclose()
+        self.client.close()
+
+
+class GeminiHolder:
+    client: Optional[GeminiClient] = None
+
+gemini_holder = GeminiHolder()
+
+# Se crea un solo cliente por proceso (pool HTTP y configs reutilizados).
+# Sin GEMINI_API_KEY la app arranca igual: solo fallan las rutas de IA (503)
+async def init_gemini_client():
+    if gemini_holder.client is None:
+        try:
+            gemini_holder.client = GeminiClient()
+        except ValueError as e:
+            print(f"Cliente de Gemini no disponible: {e}")
+            return
+        print("Cliente de Gemini inicializado")
+
+async def close_gemini_client():
+    if gemini_holder.client is not None:
+        await gemini_holder.client.aclose()
+        gemini_holder.client = None
+        print("Cliente de Gemini cerrado")
+
+# Dependencia de FastAPI
+def get_gemini_client() -> GeminiClient:
+    if gemini_holder.client is None:
+        raise HTTPException(
+            status_code=503,
+            detail="El servicio de IA no está disponible (revisa GEMINI_API_KEY)"
+        )
+    return gemini_holder.client
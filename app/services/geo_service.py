@@ -0,0 +1,109 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.database.mongodb import get_database
+from app.services.plant_analysis_service import LIST_PROJECTION, serialize_list_item
+
+# Límite de celdas por consulta del mapa de calor
+MAX_HEATMAP_CELLS = int(os.getenv("MAX_HEATMAP_CELLS", "10000"))
+
+
+async def get_analyses_nearby(
+    lat: float,
+    lng: float,
+    radius_m: float,
+    prediction: Optional[str] = None,
+    limit: int = 50
+) -> List[Dict]:
+    """
+    Análisis dentro de `radius_m` metros del punto, del más cercano al
+    más lejano. Usa el índice 2dsphere sobre "geo".
+    """
+    query = {"prediction": prediction} if prediction else {}
+
+    db = get_database()
+    cursor = db["plant_analysis"].aggregate([
+        {
+            "$geoNear": {
+                "near": {"type": "Point", "coordinates": [lng, lat]},
+                "key": "geo",
+                "distanceField": "distance_m",
+                "maxDistance": radius_m,
+                "query": query,
+                "spherical": True
+            }
+        },
+        {"$limit": limit},
+        {"$project": {**LIST_PROJECTION, "distance_m": 1}}
+    ])
+
+    items = []
+    async for doc in cursor:
+        item = serialize_list_item(doc)
+        item["distance_m"] = round(doc["distance_m"], 1)
+        items.append(item)
+    return items
+
+
+def heatmap_cell_count(min_lat: float, min_lng: float, max_lat: float, max_lng: float, cell_deg: float) -> int:
+    rows = int((max_lat - min_lat) / cell_deg) + 1
+    cols = int((max_lng - min_lng) / cell_deg) + 1
+    return rows * cols
+
+
+async def get_heatmap(
+    min_lat: float,
+    min_lng: float,
+    max_lat: float,
+    max_lng: float,
+    cell_deg: float,
+    prediction: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Dict]:
+    """
+    Cuenta análisis por celda de `cell_deg` grados dentro del rectángulo.
+    Devuelve solo las celdas con datos, con su centro y conteo.
+    El rectángulo se filtra por rangos de lat/lng y no con un Polygon
+    GeoJSON: sus lados siguen círculos máximos (no paralelos) y un
+    rectángulo de todo el mundo es un polígono degenerado.
+    """
+    match: Dict = {
+        "location.lat": {"$gte": min_lat, "$lte": max_lat},
+        "location.lng": {"$gte": min_lng, "$lte": max_lng}
+    }
+    if prediction:
+        match["prediction"] = prediction
+    if start or end:
+        match["created_at"] = {}
+        if start:
+            match["created_at"]["$gte"] = start
+        if end:
+            match["created_at"]["$lte"] = end
+
+    lng_expr = "$location.lng"
+    lat_expr = "$location.lat"
+
+    db = get_database()
+    cursor = db["plant_analysis"].aggregate([
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {
+                    "x": {"$floor": {"$divide": [lng_expr, cell_deg]}},
+                    "y": {"$floor": {"$divide": [lat_expr, cell_deg]}}
+                },
+                "count": {"$sum": 1}
+            }
+        }
+    ])
+
+    cells = []
+    async for doc in cursor:
+        cells.append({
+            "lat": round((doc["_id"]["y"] + 0.5) * cell_deg, 6),
+            "lng": round((doc["_id"]["x"] + 0.5) * cell_deg, 6),
+            "count": doc["count"]
+        })
+    return cells
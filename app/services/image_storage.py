@@ -0,0 +1,285 @@
+import hashlib
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+from pymongo import ReturnDocument, UpdateOne
+
+from app.database.mongodb import get_database
+from app.services.blob_store import BlobExistsError, BlobStore, get_blob_store
+from app.services.image_variants import delete_variants, delete_variants_many
+
+# Tamaño máximo por imagen y tamaño de cada lectura del spool de UploadFile
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(255 * 1024)))
+
+# Las imágenes se identifican por el sha256 de su contenido: si el mismo
+# archivo ya existe se reutiliza y se incrementa metadata.ref_count
+_dedup_stats = {
+    "uploads": 0,
+    "dedup_hits": 0,
+    "bytes_deduplicated": 0,
+}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"La imagen supera el tamaño máximo de {MAX_UPLOAD_BYTES} bytes"
+    )
+
+
+async def ensure_image_indexes(store: Optional[BlobStore] = None):
+    # Por defecto el backend activo; la migración lo usa con el backend destino
+    files = (store or get_blob_store()).files
+    await files.create_index(
+        "metadata.sha256",
+        unique=True,
+        partialFilterExpression={"metadata.sha256": {"$exists": True}}
+    )
+    await files.create_index("metadata.variant_of", sparse=True)
+
+
+async def _hash_upload(image: UploadFile) -> Tuple[str, int]:
+    # Primera pasada sobre el spool local: sha256 y control de tamaño
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await image.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise _too_large()
+        digest.update(chunk)
+    await image.seek(0)
+    return digest.hexdigest(), size
+
+
+async def _iter_upload(image: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await image.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def _reuse_existing(sha256: str) -> Optional[ObjectId]:
+    doc = await get_blob_store().files.find_one_and_update(
+        {"metadata.sha256": sha256},
+        # last_reused_at: el barrido de huérfanos no recuenta imágenes recién
+        # reutilizadas cuyo análisis quizá aún no se guardó
+        {"$inc": {"metadata.ref_count": 1}, "$set": {"metadata.last_reused_at": datetime.utcnow()}},
+        projection={"_id": 1, "length": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not doc:
+        return None
+
+    _dedup_stats["dedup_hits"] += 1
+    _dedup_stats["bytes_deduplicated"] += doc.get("length", 0)
+    return doc["_id"]
+
+
+async def store_upload(image: UploadFile) -> ObjectId:
+    """
+    Copia la imagen al almacenamiento por bloques, sin cargar el archivo completo
+    en memoria. Si ya existe una imagen con el mismo contenido se reutiliza
+    (se incrementa su ref_count) en lugar de guardar otra copia.
+    """
+    if image.size is not None and image.size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+
+    _dedup_stats["uploads"] += 1
+    sha256, size = await _hash_upload(image)
+
+    existing = await _reuse_existing(sha256)
+    if existing:
+        return existing
+
+    filename = image.filename or "uploaded_file"
+    metadata = {
+        "content_type": image.content_type or "application/octet-stream",
+        "length": size,
+        "sha256": sha256,
+        "ref_count": 1
+    }
+
+    try:
+        return await get_blob_store().write(filename, _iter_upload(image), metadata)
+    except BlobExistsError:
+        # Otra petición guardó el mismo contenido al mismo tiempo (índice único)
+        existing = await _reuse_existing(sha256)
+        if existing:
+            return existing
+        raise
+
+
+async def release_image(image_id: ObjectId) -> bool:
+    """
+    Quita una referencia a la imagen. Solo borra el archivo (y sus
+    variantes) cuando era la última. Devuelve True si se borró.
+    """
+    store = get_blob_store()
+    files = store.files
+
+    for _ in range(3):
+        doc = await files.find_one_and_update(
+            {"_id": image_id, "metadata.ref_count": {"$gt": 1}},
+            {"$inc": {"metadata.ref_count": -1}},
+            projection={"_id": 1}
+        )
+        if doc:
+            return False
+
+        # Las imágenes anteriores a la deduplicación no tienen ref_count
+        result = await files.delete_one({
+            "_id": image_id,
+            "$or": [
+                {"metadata.ref_count": {"$lte": 1}},
+                {"metadata.ref_count": {"$exists": False}}
+            ]
+        })
+        if result.deleted_count:
+            await store.delete_data(image_id)
+            await delete_variants(image_id)
+            return True
+
+        if not await files.find_one({"_id": image_id}, {"_id": 1}):
+            return False  # ya no existe
+
+    return False
+
+
+async def _delete_unused(image_ids: List[ObjectId], unused: Dict) -> List[ObjectId]:
+    # Borra las imágenes de image_ids que cumplen `unused` (con sus datos y
+    # variantes) y devuelve las que se borraron de verdad
+    store = get_blob_store()
+    files = store.files
+
+    await files.delete_many({"_id": {"$in": image_ids}, **unused})
+    remaining = {doc["_id"] async for doc in files.find({"_id": {"$in": image_ids}}, {"_id": 1})}
+    deleted = [image_id for image_id in image_ids if image_id not in remaining]
+
+    await store.delete_data_many(deleted)
+    await delete_variants_many(deleted)
+    return deleted
+
+
+async def release_images(release_id: ObjectId, counts: Dict[ObjectId, int]) -> int:
+    """
+    Quita a cada imagen `count` referencias (los análisis que se borraron)
+    con un $inc atómico y borra las que quedan en 0 o menos. Una subida
+    concurrente que reutiliza la imagen solo suma, así que nunca se borra
+    una imagen en uso. release_id queda marcado en cada archivo: repetir la
+    misma liberación tras una caída no descuenta dos veces. Devuelve cuántas borró.
+    """
+    if not counts:
+        return 0
+
+    files = get_blob_store().files
+    await files.bulk_write([
+        UpdateOne(
+            {
+                "_id": image_id,
+                "metadata.variant_of": {"$exists": False},
+                "metadata.released_by": {"$ne": release_id}
+            },
+            {
+                # Las imágenes anteriores a la deduplicación no tienen ref_count
+                # (una por análisis): quedan en -count y se borran igual
+                "$inc": {"metadata.ref_count": -count},
+                "$addToSet": {"metadata.released_by": release_id}
+            }
+        )
+        for image_id, count in counts.items()
+    ], ordered=False)
+
+    unused = {"metadata.ref_count": {"$lte": 0}}
+    candidates = [doc["_id"] async for doc in files.find({"_id": {"$in": list(counts)}, **unused}, {"_id": 1})]
+    if not candidates:
+        return 0
+    # El filtro se repite en el borrado: si una subida la reutilizó entre medio, se conserva
+    return len(await _delete_unused(candidates, unused))
+
+
+async def clear_release_marks(release_id: ObjectId, image_ids: List[ObjectId]):
+    # Se llama cuando el trabajo ya no va a repetir esta liberación
+    if image_ids:
+        await get_blob_store().files.update_many(
+            {"_id": {"$in": image_ids}, "metadata.released_by": release_id},
+            {"$pull": {"metadata.released_by": release_id}}
+        )
+
+
+async def reconcile_images(image_ids: List[ObjectId]) -> int:
+    """
+    Ajusta metadata.ref_count al número real de análisis que usan cada
+    imagen y borra en bloque las que ya no usa ninguno. Solo para el
+    barrido de huérfanos: una subida que reutilizó la imagen y todavía no
+    guardó su análisis no aparece en el recuento, así que quien llama debe
+    excluir las imágenes reutilizadas hace poco (metadata.last_reused_at).
+    Devuelve cuántas borró.
+    """
+    if not image_ids:
+        return 0
+
+    files = get_blob_store().files
+
+    refs = {}
+    async for doc in get_database()["plant_analysis"].aggregate([
+        {"$match": {"image_url": {"$in": image_ids}}},
+        {"$group": {"_id": "$image_url", "count": {"$sum": 1}}}
+    ]):
+        refs[doc["_id"]] = doc["count"]
+
+    updates = []
+    unused = []
+    async for doc in files.find(
+        {"_id": {"$in": image_ids}, "metadata.variant_of": {"$exists": False}},
+        {"metadata.ref_count": 1}
+    ):
+        current = (doc.get("metadata") or {}).get("ref_count")
+        count = refs.get(doc["_id"], 0)
+        # Se condiciona al ref_count leído: si una subida concurrente lo cambió, no se toca
+        guard = {
+            "_id": doc["_id"],
+            "metadata.ref_count": current if current is not None else {"$exists": False}
+        }
+        if count == 0:
+            unused.append(guard)
+        elif current != count:
+            updates.append(UpdateOne(guard, {"$set": {"metadata.ref_count": count}}))
+
+    if updates:
+        await files.bulk_write(updates, ordered=False)
+    if not unused:
+        return 0
+
+    return len(await _delete_unused([guard["_id"] for guard in unused], {"$or": unused}))
+
+
+async def get_dedup_report() -> Dict:
+    cursor = get_blob_store().files.aggregate([
+        {"$match": {"metadata.ref_count": {"$gt": 1}}},
+        {
+            "$group": {
+                "_id": None,
+                "shared_files": {"$sum": 1},
+                "references": {"$sum": "$metadata.ref_count"},
+                "bytes_saved": {
+                    "$sum": {"$multiply": [{"$subtract": ["$metadata.ref_count", 1]}, "$length"]}
+                }
+            }
+        }
+    ])
+    totals = {"shared_files": 0, "references": 0, "bytes_saved": 0}
+    async for doc in cursor:
+        totals.update({k: doc[k] for k in totals})
+
+    return {
+        **totals,
+        "backend": get_blob_store().name,
+        "process": dict(_dedup_stats)
+    }
@@ -0,0 +1,123 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from bson import ObjectId
+from PIL import Image, ImageOps
+
+from app.services.blob_store import get_blob_store
+from app.services.single_flight import SingleFlight
+
+# Variantes redimensionadas (lado mayor en píxeles) que se generan
+# bajo demanda la primera vez que se piden y quedan guardadas en el almacenamiento
+VARIANT_SIZES = {
+    "thumb": int(os.getenv("IMAGE_THUMB_SIZE", "256")),
+    "medium": int(os.getenv("IMAGE_MEDIUM_SIZE", "1024")),
+}
+VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "WEBP").upper()  # WEBP | JPEG
+VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_variant_flight = SingleFlight()
+
+
+def _resize(data: bytes, max_side: int, fmt: str, quality: int) -> bytes:
+    # Corre en otro proceso: decodificar y redimensionar es CPU puro
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if fmt == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        img.save(out, format=fmt, quality=quality)
+        return out.getvalue()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_variant_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _single_chunk(data: bytes):
+    yield data
+
+
+async def _find_variant(image_id: ObjectId, size: str) -> Optional[ObjectId]:
+    doc = await get_blob_store().files.find_one(
+        {"metadata.variant_of": image_id, "metadata.variant": size},
+        {"_id": 1}
+    )
+    return doc["_id"] if doc else None
+
+
+async def _create_variant(image_id: ObjectId, size: str) -> Optional[ObjectId]:
+    existing = await _find_variant(image_id, size)
+    if existing:
+        return existing
+
+    store = get_blob_store()
+    blob = await store.open(image_id)
+    if blob is None:
+        return None
+    original = await blob.read_all()
+
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(
+        _get_pool(), _resize, original, VARIANT_SIZES[size], VARIANT_FORMAT, VARIANT_QUALITY
+    )
+
+    return await store.write(
+        f"{image_id}_{size}.{VARIANT_FORMAT.lower()}",
+        _single_chunk(data),
+        metadata={
+            "content_type": f"image/{VARIANT_FORMAT.lower()}",
+            "length": len(data),
+            "variant_of": image_id,
+            "variant": size
+        }
+    )
+
+
+async def get_or_create_variant(image_id: ObjectId, size: str) -> Optional[ObjectId]:
+    """
+    Devuelve el _id de la variante `size` de la imagen, generándola si
+    no existe. Peticiones simultáneas de la misma variante comparten el trabajo.
+    """
+    existing = await _find_variant(image_id, size)
+    if existing:
+        return existing
+
+    return await _variant_flight.do(
+        (image_id, size), lambda: _create_variant(image_id, size)
+    )
+
+
+async def delete_variants(image_id: ObjectId):
+    store = get_blob_store()
+    cursor = store.files.find({"metadata.variant_of": image_id}, {"_id": 1})
+    async for doc in cursor:
+        await store.delete(doc["_id"])
+
+
+async def delete_variants_many(image_ids: List[ObjectId]):
+    if not image_ids:
+        return
+    store = get_blob_store()
+    docs = await store.files.find({"metadata.variant_of": {"$in": image_ids}}, {"_id": 1}).to_list(None)
+    await store.delete_many([doc["_id"] for doc in docs])
@@ -1,45 +1,217 @@
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from app.models.plant import PlantAnalysis, PyObjectId
-from app.database.mongodb import get_database, get_gridfs
+from app.database.mongodb import get_database
+from app.services.image_storage import release_image
+from app.services.stats_service import record_analysis, record_analyses_bulk
+from app.services.analysis_cache import get_cached, set_cached, invalidate_analysis
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, PyMongoError
 from bson import ObjectId
 from datetime import datetime
-
-
-async def save_analysis_record(user_id: str, prediction: str, location: dict, image_id: str):
+import base64
+import json
+
+# Proyección liviana para listados (historial): sin ai_response ni ai_summary completos
+LIST_PROJECTION = {
+    "_id": 1,
+    "prediction": 1,
+    "created_at": 1,
+    "image_url": 1,
+    "ai_summary.tema": 1
+}
+LIST_SORT = [("created_at", -1), ("_id", -1)]
+
+
+def location_to_geojson(location: dict) -> Optional[Dict]:
+    lat = location.get("lat")
+    lng = location.get("lng")
+    if lat is None or lng is None:
+        return None
+    # GeoJSON usa el orden [longitud, latitud]
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+async def save_analysis_record(
+    user_id: str,
+    prediction: str,
+    location: dict,
+    image_id: str,
+    ai_status: Optional[str] = None
+):
     db = get_database()
 
     record = PlantAnalysis(
         user_id=PyObjectId(user_id),
         prediction=prediction,
         location=location,
-        image_url=PyObjectId(image_id)
+        geo=location_to_geojson(location),
+        image_url=PyObjectId(image_id),
+        ai_status=ai_status
     )
 
     result = await db["plant_analysis"].insert_one(
         record.model_dump(by_alias=True, exclude_none=True)
     )
+    await record_analysis(prediction, location, record.created_at)
     return str(result.inserted_id)
 
 
+async def save_analysis_records(
+    user_id: str,
+    items: List[Dict],
+    ai_status: Optional[str] = None
+) -> List[Optional[str]]:
+    """
+    Guarda varios análisis con un solo insert_many (ordered=False).
+    Cada item trae prediction, location e image_id. Devuelve el id de
+    cada análisis en el mismo orden, o None si ese documento falló.
+    """
+    db = get_database()
+
+    records = [
+        PlantAnalysis(
+            user_id=PyObjectId(user_id),
+            prediction=item["prediction"],
+            location=item["location"],
+            geo=location_to_geojson(item["location"]),
+            image_url=PyObjectId(item["image_id"]),
+            ai_status=ai_status
+        ).model_dump(by_alias=True, exclude_none=True)
+        for item in items
+    ]
+    if not records:
+        return []
+
+    for record in records:
+        record.setdefault("_id", ObjectId())
+
+    failed = set()
+    try:
+        await db["plant_analysis"].insert_many(records, ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+    except PyMongoError as e:
+        # Error de red o timeout: el servidor pudo guardar parte del lote.
+        # Si tampoco se puede consultar qué se guardó, se propaga el error original
+        try:
+            ids = [record["_id"] for record in records]
+            found = {
+                doc["_id"]
+                async for doc in db["plant_analysis"].find({"_id": {"$in": ids}}, {"_id": 1})
+            }
+        except PyMongoError:
+            raise e
+        failed = {i for i, record in enumerate(records) if record["_id"] not in found}
+
+    saved = [record for i, record in enumerate(records) if i not in failed]
+    try:
+        await record_analyses_bulk(saved)
+    except PyMongoError as e:
+        # Los análisis ya están guardados; rebuild_stats corrige los conteos
+        print(f"No se pudieron actualizar las estadísticas del lote: {e}")
+
+    return [None if i in failed else str(record["_id"]) for i, record in enumerate(records)]
+
+
 async def get_analysis_by_id(analysis_id: str):
+    cached = get_cached("analysis", analysis_id)
+    if cached is not None:
+        return cached
+
     db = get_database()
     doc = await db["plant_analysis"].find_one({"_id": ObjectId(analysis_id)})
 
     if doc:
-        return _serialize(doc)
+        analysis = _serialize(doc)
+        # Mientras la IA se genera el documento cambia: no se cachea
+        if _is_ai_settled(doc):
+            set_cached("analysis", analysis_id, analysis)
+        return analysis
     return None
 
 
-async def get_analyses_by_user(user_id: str):
+async def get_analysis_owner(analysis_id: str) -> Optional[str]:
+    # El dueño de un análisis no cambia: se cachea aunque la IA siga en curso
+    cached = get_cached("owner", analysis_id)
+    if cached is not None:
+        return cached
+
     db = get_database()
-    cursor = db["plant_analysis"].find({"user_id": ObjectId(user_id)})
-    return [ _serialize(doc) async for doc in cursor ]
+    doc = await db["plant_analysis"].find_one({"_id": ObjectId(analysis_id)}, {"user_id": 1})
+    if not doc:
+        return None
+
+    owner = str(doc["user_id"])
+    set_cached("owner", analysis_id, owner)
+    return owner
 
 
-async def get_all_analyses():
+async def user_has_image(user_id: str, image_id: ObjectId) -> bool:
+    # Con la deduplicación una imagen puede estar en análisis de varios usuarios
     db = get_database()
-    cursor = db["plant_analysis"].find({})
-    return [ _serialize(doc) async for doc in cursor ]
+    doc = await db["plant_analysis"].find_one(
+        {"image_url": image_id, "user_id": ObjectId(user_id)},
+        {"_id": 1}
+    )
+    return doc is not None
+
+
+async def get_analyses_by_user(user_id: str, limit: int = 20, cursor: Optional[str] = None) -> Dict:
+    return await _paginate({"user_id": ObjectId(user_id)}, limit, cursor)
+
+
+async def get_all_analyses(limit: int = 20, cursor: Optional[str] = None) -> Dict:
+    return await _paginate({}, limit, cursor)
+
+
+def encode_cursor(created_at: datetime, analysis_id: ObjectId) -> str:
+    raw = json.dumps([created_at.isoformat(), str(analysis_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    # Lanza ValueError si el cursor no es válido
+    try:
+        created_at, analysis_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), ObjectId(analysis_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+async def _paginate(query: Dict, limit: int, cursor: Optional[str]) -> Dict:
+    """
+    Paginación por keyset sobre (created_at, _id), del más reciente al más
+    antiguo. next_cursor es None cuando no hay más páginas.
+    """
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = {
+            "$and": [
+                query,
+                {
+                    "$or": [
+                        {"created_at": {"$lt": created_at}},
+                        {"created_at": created_at, "_id": {"$lt": last_id}}
+                    ]
+                }
+            ]
+        }
+
+    db = get_database()
+    docs = await db["plant_analysis"].find(query, LIST_PROJECTION) \
+        .sort(LIST_SORT) \
+        .limit(limit + 1) \
+        .to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+
+    return {
+        "items": [serialize_list_item(doc) for doc in docs],
+        "next_cursor": next_cursor
+    }
 
 
 async def get_analyses_by_prediction(prediction: str):
@@ -58,11 +230,20 @@ async def get_analyses_by_date_range(start: datetime, end: datetime):
 
 async def update_prediction(analysis_id: str, new_prediction: str):
     db = get_database()
-    result = await db["plant_analysis"].update_one(
-        {"_id": ObjectId(analysis_id)},
-        {"$set": {"prediction": new_prediction}}
+    # Se pide el documento anterior para mover el conteo de las estadísticas
+    previous = await db["plant_analysis"].find_one_and_update(
+        {"_id": ObjectId(analysis_id), "prediction": {"$ne": new_prediction}},
+        {"$set": {"prediction": new_prediction}},
+        projection={"prediction": 1, "location": 1, "created_at": 1},
+        return_document=ReturnDocument.BEFORE
     )
-    return result.modified_count > 0
+    if not previous:
+        return False
+
+    invalidate_analysis(analysis_id)
+    await record_analysis(previous["prediction"], previous.get("location"), previous["created_at"], -1)
+    await record_analysis(new_prediction, previous.get("location"), previous["created_at"])
+    return True
 
 
 async def add_ai_response(analysis_id: str, ai_response: Dict):
@@ -71,6 +252,7 @@ async def add_ai_response(analysis_id: str, ai_response: Dict):
         {"_id": ObjectId(analysis_id)},
         {"$set": {"ai_response": ai_response}}
     )
+    invalidate_analysis(analysis_id)
     return result.modified_count > 0
 
 
@@ -80,42 +262,103 @@ async def add_ai_summary(analysis_id: str, ai_summary: Dict):
         {"_id": ObjectId(analysis_id)},
         {"$set": {"ai_summary": ai_summary}}
     )
+    invalidate_analysis(analysis_id)
     return result.modified_count > 0
 
 
 async def delete_analysis(analysis_id: str):
     db = get_database()
-    fs = get_gridfs()
 
-    doc = await db["plant_analysis"].find_one({"_id": ObjectId(analysis_id)})
+    # Borra y devuelve solo lo necesario para liberar la imagen y las estadísticas
+    doc = await db["plant_analysis"].find_one_and_delete(
+        {"_id": ObjectId(analysis_id)},
+        projection={"image_url": 1, "prediction": 1, "location": 1, "created_at": 1}
+    )
+    invalidate_analysis(analysis_id)
     if not doc:
         return False
 
     image_id = doc.get("image_url")
     if image_id:
         try:
-            await fs.delete(ObjectId(image_id))
+            # Solo se borra la imagen si ningún otro análisis la usa
+            await release_image(ObjectId(image_id))
         except Exception as e:
             print(f"No se pudo eliminar imagen: {e}")
 
-    result = await db["plant_analysis"].delete_one({"_id": ObjectId(analysis_id)})
-    return result.deleted_count > 0
+    await record_analysis(doc["prediction"], doc.get("location"), doc["created_at"], -1)
+    return True
 
 
 async def get_ai_response_by_analysis_id(analysis_id: str) -> Optional[Dict]:
+    return await _get_ai_field(analysis_id, "ai_response")
+
+
+async def get_ai_summary_by_analysis_id(analysis_id: str) -> Optional[Dict]:
+    return await _get_ai_field(analysis_id, "ai_summary")
+
+
+async def _get_ai_field(analysis_id: str, field: str) -> Optional[Dict]:
+    cached = get_cached(field, analysis_id)
+    if cached is not None:
+        return cached
+
     db = get_database()
-    return await db["plant_analysis"].find_one(
+    doc = await db["plant_analysis"].find_one(
         {"_id": ObjectId(analysis_id)},
-        {"_id": 0, "ai_response": 1}
+        {"_id": 0, field: 1, "ai_generated": 1}
     )
+    # Solo se cachea cuando la IA ya terminó: el contenido ya no cambia
+    if doc and doc.get("ai_generated"):
+        set_cached(field, analysis_id, doc)
+    return doc
 
 
-async def get_ai_summary_by_analysis_id(analysis_id: str) -> Optional[Dict]:
+async def get_ai_status_by_analysis_id(analysis_id: str) -> Optional[Dict]:
+    cached = get_cached("ai_status", analysis_id)
+    if cached is not None:
+        return cached
+
     db = get_database()
-    return await db["plant_analysis"].find_one(
+    doc = await db["plant_analysis"].find_one(
         {"_id": ObjectId(analysis_id)},
-        {"_id": 0, "ai_summary": 1}
+        {"_id": 0, "ai_generated": 1, "ai_status": 1, "ai_attempts": 1, "ai_error": 1}
     )
+    if not doc:
+        return None
+
+    status = {
+        "status": _resolve_ai_status(doc),
+        "ai_generated": doc.get("ai_generated", False),
+        "attempts": doc.get("ai_attempts", 0),
+        "error": doc.get("ai_error")
+    }
+    if _is_ai_settled(doc):
+        set_cached("ai_status", analysis_id, status)
+    return status
+
+
+def _is_ai_settled(doc: dict) -> bool:
+    return _resolve_ai_status(doc) not in ("pending", "running")
+
+
+def _resolve_ai_status(doc: dict) -> str:
+    # Los análisis anteriores a la cola de IA solo tienen el booleano ai_generated
+    if doc.get("ai_status"):
+        return doc["ai_status"]
+    if "ai_generated" in doc:
+        return "done" if doc["ai_generated"] else "failed"
+    return "not_requested"
+
+
+def serialize_list_item(doc: dict) -> dict:
+    return {
+        "_id": str(doc["_id"]),
+        "prediction": doc.get("prediction"),
+        "created_at": str(doc["created_at"]) if "created_at" in doc else None,
+        "image_url": str(doc["image_url"]) if doc.get("image_url") else None,
+        "tema": (doc.get("ai_summary") or {}).get("tema")
+    }
 
 
 def _serialize(doc: dict) -> dict:
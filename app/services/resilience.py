@@ -0,0 +1,149 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: se falla rápido sin llamar al servicio."""
+
+
+class BulkheadFullError(Exception):
+    """Se superó el tiempo de espera por un cupo de concurrencia."""
+
+
+class CircuitBreaker:
+    """
+    Circuito clásico closed -> open -> half_open.
+    Tras `failure_threshold` fallos seguidos se abre durante `reset_timeout`
+    segundos; después deja pasar una sola llamada de prueba.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def is_open(self) -> bool:
+        if self.state != "open":
+            return False
+        return time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            self._probe_in_flight = False
+        # half_open: solo una llamada de prueba a la vez
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def cancel_probe(self):
+        # La llamada se canceló sin resultado (p. ej. el cliente se desconectó)
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": "open" if self.is_open() else ("half_open" if self.state == "open" else self.state),
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class Bulkhead:
+    """Limita las llamadas concurrentes; las demás esperan en cola hasta `queue_timeout`."""
+
+    def __init__(self, max_concurrency: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise BulkheadFullError("Demasiadas llamadas concurrentes a Gemini")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[T]],
+    hedge: Optional[Callable[[], Awaitable[T]]],
+    delay: Optional[float],
+    on_hedge: Optional[Callable[[bool], None]] = None
+) -> T:
+    """
+    Ejecuta `primary` y, si no terminó tras `delay` segundos, lanza `hedge`
+    en paralelo. Devuelve el primer resultado exitoso y cancela el otro.
+    `on_hedge(ganó_hedge)` se llama cuando se lanzó la segunda llamada.
+    """
+    first = asyncio.ensure_future(primary())
+    if hedge is None or delay is None:
+        return await first
+
+    second: Optional[asyncio.Future] = None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        second = asyncio.ensure_future(hedge())
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if on_hedge:
+                        on_hedge(task is second)
+                    return task.result()
+        if on_hedge:
+            on_hedge(False)
+        return first.result()  # ambas fallaron: se propaga el error principal
+    finally:
+        for task in (first, second):
+            if task is not None and not task.done():
+                task.cancel()
@@ -0,0 +1,165 @@
+import math
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+
+from app.database.mongodb import get_database
+
+# Conteos diarios por predicción y región, mantenidos de forma incremental.
+# La región es una celda de STATS_REGION_DEG grados ("lat:lng"), calculable
+# tanto en Python como dentro de una agregación de MongoDB.
+STATS_COLLECTION = "prediction_stats_daily"
+STATS_REGION_DEG = float(os.getenv("STATS_REGION_DEG", "1.0"))
+
+
+def _day(created_at: datetime) -> datetime:
+    return datetime(created_at.year, created_at.month, created_at.day)
+
+
+def region_key(location: Optional[dict]) -> str:
+    lat = (location or {}).get("lat")
+    lng = (location or {}).get("lng")
+    if lat is None or lng is None:
+        return "unknown"
+    return f"{math.floor(lat / STATS_REGION_DEG)}:{math.floor(lng / STATS_REGION_DEG)}"
+
+
+async def ensure_stats_indexes():
+    db = get_database()
+    await db[STATS_COLLECTION].create_index(
+        [("day", ASCENDING), ("prediction", ASCENDING), ("region", ASCENDING)],
+        unique=True
+    )
+
+
+async def record_analysis(prediction: str, location: Optional[dict], created_at: datetime, delta: int = 1):
+    db = get_database()
+    await db[STATS_COLLECTION].update_one(
+        {"day": _day(created_at), "prediction": prediction, "region": region_key(location)},
+        {"$inc": {"count": delta}},
+        upsert=True
+    )
+
+
+async def record_analyses_bulk(docs: List[Dict], delta: int = 1):
+    # Varios análisis a la vez: se agrupan por (día, predicción, región) en un solo bulk_write
+    counts = Counter(
+        (_day(doc["created_at"]), doc["prediction"], region_key(doc.get("location")))
+        for doc in docs
+    )
+    if not counts:
+        return
+
+    db = get_database()
+    await db[STATS_COLLECTION].bulk_write([
+        UpdateOne(
+            {"day": day, "prediction": prediction, "region": region},
+            {"$inc": {"count": count * delta}},
+            upsert=True
+        )
+        for (day, prediction, region), count in counts.items()
+    ], ordered=False)
+
+
+async def get_prediction_stats(
+    start: datetime,
+    end: datetime,
+    by_region: bool = False,
+    region: Optional[str] = None
+) -> List[Dict]:
+    """
+    Lee los conteos precalculados: O(días x predicciones), sin tocar
+    plant_analysis. `end` es inclusivo (día completo).
+    """
+    match: Dict = {"day": {"$gte": _day(start), "$lte": _day(end)}, "count": {"$gt": 0}}
+    if region:
+        match["region"] = region
+
+    group_id = {"day": "$day", "prediction": "$prediction"}
+    if by_region:
+        group_id["region"] = "$region"
+
+    db = get_database()
+    cursor = db[STATS_COLLECTION].aggregate([
+        {"$match": match},
+        {"$group": {"_id": group_id, "count": {"$sum": "$count"}}},
+        {"$sort": {"_id.day": 1, "count": -1}}
+    ])
+
+    rows = []
+    async for doc in cursor:
+        row = {
+            "day": doc["_id"]["day"].date().isoformat(),
+            "prediction": doc["_id"]["prediction"],
+            "count": doc["count"]
+        }
+        if by_region:
+            row["region"] = doc["_id"]["region"]
+        rows.append(row)
+    return rows
+
+
+def _cell_expr(field: str) -> Dict:
+    # Equivalente en agregación a math.floor(valor / STATS_REGION_DEG) de region_key
+    return {"$toString": {"$toLong": {"$floor": {"$divide": [field, STATS_REGION_DEG]}}}}
+
+
+async def rebuild_prediction_stats(start: datetime, end: datetime):
+    """
+    Recalcula los conteos de [start, end] desde plant_analysis.
+    Sirve para reparar la colección o poblarla la primera vez.
+    """
+    first_day = _day(start)
+    after_last_day = _day(end) + timedelta(days=1)
+
+    db = get_database()
+    await db[STATS_COLLECTION].delete_many({"day": {"$gte": first_day, "$lt": after_last_day}})
+
+    await db["plant_analysis"].aggregate([
+        {"$match": {"created_at": {"$gte": first_day, "$lt": after_last_day}}},
+        {
+            "$group": {
+                "_id": {
+                    "day": {
+                        "$dateFromParts": {
+                            "year": {"$year": "$created_at"},
+                            "month": {"$month": "$created_at"},
+                            "day": {"$dayOfMonth": "$created_at"}
+                        }
+                    },
+                    "prediction": "$prediction",
+                    "region": {
+                        "$cond": [
+                            {"$and": [
+                                {"$isNumber": "$location.lat"},
+                                {"$isNumber": "$location.lng"}
+                            ]},
+                            {"$concat": [_cell_expr("$location.lat"), ":", _cell_expr("$location.lng")]},
+                            "unknown"
+                        ]
+                    }
+                },
+                "count": {"$sum": 1}
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "day": "$_id.day",
+                "prediction": "$_id.prediction",
+                "region": "$_id.region",
+                "count": 1
+            }
+        },
+        {
+            "$merge": {
+                "into": STATS_COLLECTION,
+                "on": ["day", "prediction", "region"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }
+        }
+    ]).to_list(None)
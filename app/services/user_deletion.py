@@ -0,0 +1,253 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from app.database.mongodb import get_database
+from app.services.analysis_cache import invalidate_analysis
+from app.services.image_storage import clear_release_marks, release_images
+from app.services.stats_service import record_analyses_bulk
+
+# Borrado en cascada de los datos de un usuario eliminado.
+# Cada trabajo es un documento de user_deletion_jobs (_id = user_id) con
+# un lease, así que si el proceso muere el trabajo se retoma al reiniciar.
+# Cada lote (sus análisis y cuántos usan cada imagen) se guarda en el trabajo
+# (pending_batch) antes de borrarlo, para poder terminarlo al retomarlo.
+USER_DELETION_JOBS = "user_deletion_jobs"
+USER_DELETION_BATCH_SIZE = int(os.getenv("USER_DELETION_BATCH_SIZE", "500"))
+USER_DELETION_LEASE_SECONDS = int(os.getenv("USER_DELETION_LEASE_SECONDS", "300"))
+USER_DELETION_POLL_INTERVAL = int(os.getenv("USER_DELETION_POLL_INTERVAL", "60"))
+USER_DELETION_MAX_ATTEMPTS = int(os.getenv("USER_DELETION_MAX_ATTEMPTS", "5"))
+# Espera antes de reintentar un trabajo fallido: base * 2^(intento - 1) segundos
+USER_DELETION_RETRY_BASE = int(os.getenv("USER_DELETION_RETRY_BASE", "30"))
+
+_ANALYSIS_PROJECTION = {"image_url": 1, "prediction": 1, "location": 1, "created_at": 1}
+
+
+class UserDeletionWorker:
+    task: Optional[asyncio.Task] = None
+    wakeup: Optional[asyncio.Event] = None
+
+user_deletion = UserDeletionWorker()
+
+
+async def ensure_user_deletion_indexes():
+    db = get_database()
+    await db[USER_DELETION_JOBS].create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+
+
+def wake_user_deletion_worker():
+    if user_deletion.wakeup is not None:
+        user_deletion.wakeup.set()
+
+
+async def schedule_user_deletion(user_id: ObjectId, wake: bool = True) -> bool:
+    # Devuelve True si el trabajo no existía
+    db = get_database()
+    result = await db[USER_DELETION_JOBS].update_one(
+        {"_id": user_id},
+        {
+            # Volver a programarlo (p. ej. desde sweep_orphans) reinicia los intentos
+            "$set": {"status": "pending", "attempts": 0},
+            "$unset": {"next_attempt_at": ""},
+            "$setOnInsert": {
+                "created_at": datetime.utcnow(),
+                "analyses_deleted": 0,
+                "images_deleted": 0
+            }
+        },
+        upsert=True
+    )
+    if wake:
+        wake_user_deletion_worker()
+    return result.upserted_id is not None
+
+
+async def cancel_user_deletion(user_id: ObjectId):
+    # Solo un trabajo que no empezó (el usuario no existía)
+    await get_database()[USER_DELETION_JOBS].delete_one({"_id": user_id, "status": "pending"})
+
+
+async def _finish_batch(user_id: ObjectId, batch: Dict, docs: Optional[List[Dict]] = None):
+    db = get_database()
+    analyses = db["plant_analysis"]
+
+    if docs is None:
+        # Lote retomado: solo quedan los análisis que no se alcanzaron a borrar
+        docs = await analyses.find({"_id": {"$in": batch["analysis_ids"]}}, _ANALYSIS_PROJECTION) \
+            .to_list(None)
+
+    analyses_deleted = 0
+    if docs:
+        ids = [doc["_id"] for doc in docs]
+        result = await analyses.delete_many({"_id": {"$in": ids}})
+        analyses_deleted = result.deleted_count
+        for analysis_id in ids:
+            invalidate_analysis(analysis_id)
+        # Si el proceso muere antes de esto, rebuild_stats corrige los conteos
+        await record_analyses_bulk(docs, -1)
+
+    # Se descuentan las referencias de los análisis borrados (no se recuentan:
+    # una subida concurrente puede estar reutilizando la misma imagen)
+    counts = {image["image_id"]: image["count"] for image in batch["images"]}
+    images_deleted = await release_images(batch["_id"], counts)
+
+    await db[USER_DELETION_JOBS].update_one(
+        {"_id": user_id},
+        {
+            "$unset": {"pending_batch": ""},
+            "$inc": {"analyses_deleted": analyses_deleted, "images_deleted": images_deleted}
+        }
+    )
+    await clear_release_marks(batch["_id"], list(counts))
+
+
+async def run_user_deletion(user_id: ObjectId) -> Dict:
+    """
+    Borra por lotes los análisis del usuario (delete_many) y descuenta sus
+    referencias a las imágenes, borrando las que quedan sin uso. Se puede
+    repetir: un lote a medias se termina sin descontar dos veces.
+    """
+    db = get_database()
+    jobs = db[USER_DELETION_JOBS]
+    analyses = db["plant_analysis"]
+
+    # Lote que quedó a medias
+    job = await jobs.find_one({"_id": user_id}, {"pending_batch": 1})
+    if job and job.get("pending_batch"):
+        await _finish_batch(user_id, job["pending_batch"])
+
+    while True:
+        docs = await analyses.find({"user_id": user_id}, _ANALYSIS_PROJECTION) \
+            .limit(USER_DELETION_BATCH_SIZE) \
+            .to_list(USER_DELETION_BATCH_SIZE)
+        if not docs:
+            break
+
+        counts = Counter(doc["image_url"] for doc in docs if doc.get("image_url"))
+        batch = {
+            "_id": ObjectId(),
+            "analysis_ids": [doc["_id"] for doc in docs],
+            "images": [{"image_id": image_id, "count": count} for image_id, count in counts.items()]
+        }
+        await jobs.update_one(
+            {"_id": user_id},
+            {
+                "$set": {
+                    "pending_batch": batch,
+                    "lease_until": datetime.utcnow() + timedelta(seconds=USER_DELETION_LEASE_SECONDS)
+                }
+            }
+        )
+        await _finish_batch(user_id, batch, docs)
+
+    return await jobs.find_one(
+        {"_id": user_id},
+        {"_id": 0, "analyses_deleted": 1, "images_deleted": 1}
+    ) or {}
+
+
+async def claim_user_deletion_job() -> Optional[Dict]:
+    db = get_database()
+    now = datetime.utcnow()
+    return await db[USER_DELETION_JOBS].find_one_and_update(
+        {
+            "$or": [
+                {
+                    "status": "pending",
+                    "$or": [
+                        {"next_attempt_at": {"$exists": False}},
+                        {"next_attempt_at": {"$lte": now}}
+                    ]
+                },
+                # Trabajos que quedaron "running" porque el proceso murió
+                {"status": "running", "lease_until": {"$lte": now}}
+            ]
+        },
+        {
+            "$set": {
+                "status": "running",
+                "lease_until": now + timedelta(seconds=USER_DELETION_LEASE_SECONDS)
+            },
+            "$inc": {"attempts": 1}
+        },
+        projection={"attempts": 1},
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def process_user_deletion_job(job: Dict):
+    db = get_database()
+    jobs = db[USER_DELETION_JOBS]
+    user_id = job["_id"]
+
+    try:
+        result = await run_user_deletion(user_id)
+    except Exception as e:
+        attempts = job.get("attempts", 1)
+        print(f"Error borrando los datos del usuario {user_id}: {e}")
+        update = {"status": "failed", "error": str(e)}
+        if attempts < USER_DELETION_MAX_ATTEMPTS:
+            # Backoff exponencial: una caída breve de MongoDB no agota los intentos
+            delay = USER_DELETION_RETRY_BASE * 2 ** (attempts - 1)
+            update.update({"status": "pending", "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)})
+        await jobs.update_one(
+            {"_id": user_id},
+            {"$set": update, "$unset": {"lease_until": ""}}
+        )
+        return
+
+    await jobs.update_one(
+        {"_id": user_id},
+        {
+            "$set": {"status": "done", "finished_at": datetime.utcnow()},
+            "$unset": {"lease_until": "", "error": "", "next_attempt_at": ""}
+        }
+    )
+    print(f"Datos del usuario {user_id} eliminados: {result}")
+
+
+async def _worker():
+    while True:
+        # Se limpia antes de buscar para no perder un aviso que llegue entre medio
+        user_deletion.wakeup.clear()
+        try:
+            job = await claim_user_deletion_job()
+            if job:
+                await process_user_deletion_job(job)
+                continue
+        except Exception as e:
+            print(f"Error en el borrado de usuarios: {e}")
+
+        try:
+            await asyncio.wait_for(user_deletion.wakeup.wait(), USER_DELETION_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_user_deletion_worker():
+    user_deletion.wakeup = asyncio.Event()
+    user_deletion.task = asyncio.create_task(_worker())
+
+
+async def stop_user_deletion_worker():
+    if user_deletion.task is not None:
+        user_deletion.task.cancel()
+        await asyncio.gather(user_deletion.task, return_exceptions=True)
+    user_deletion.task = None
+    user_deletion.wakeup = None
+
+
+async def get_user_deletion_stats() -> Dict:
+    db = get_database()
+    counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+    async for doc in db[USER_DELETION_JOBS].aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]):
+        counts[doc["_id"]] = doc["count"]
+    return counts
@@ -1,45 +1,64 @@
 from app.models.user import User
+from app.database.indexes import index_state
 from app.database.mongodb import connect_to_mongodb, close_mongodb, get_database
 from app.schemas.user_schemas import UserRegisterSchema, UserLoginSchema, UserResponseSchema
-from app.utils.security import hash_password, verify_password, create_access_token
+from app.services.user_deletion import cancel_user_deletion, schedule_user_deletion, wake_user_deletion_worker
+from app.utils.security import hash_password_async, verify_and_update_password, create_access_token, forget_user_tokens
 from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId  # importa objectId para manejar IDs de MongoDB
 
+# Solo los campos que necesita UserResponseSchema (y el rol para el token)
+USER_RESPONSE_PROJECTION = {"name": 1, "email": 1, "role": 1}
+
+# Campos que el usuario puede cambiar (el rol solo se asigna en la base de datos)
+EDITABLE_USER_FIELDS = ("name", "email", "password")
+
+
+def _token_for(user: dict) -> str:
+    return create_access_token({"user_id": str(user["_id"]), "role": user.get("role", "user")})
+
+
+async def _email_taken(collection, email: str, exclude_id: ObjectId = None) -> bool:
+    # Solo se consulta si el índice único de users.email no existe
+    if index_state.users_email_unique:
+        return False
+    query = {"email": email}
+    if exclude_id is not None:
+        query["_id"] = {"$ne": exclude_id}
+    return await collection.find_one(query, {"_id": 1}) is not None
+
 async def register_user(data_user: UserRegisterSchema) -> UserResponseSchema:
 
     try:
         db= get_database()
         collection = db["users"]
 
-        #verifica si el usuario existe o no
-        user_existing = await collection.find_one({"email": data_user.email}) #no pueden tener el mismo email
-        if user_existing:
-            raise HTTPException(
-                status_code=400,
-                detail="El usuario ya existe con este email"
-            )
         #crea usuario
         user= data_user.model_dump()  # convierte el esquema a un diccionario 
-        user["password"] = hash_password(user["password"])  # hashea la contraseña
-
-        insert = await collection.insert_one(user)  # inserta el usuario en la colección
-
-        # obtener usuario
-        new_user = await collection.find_one({"_id": insert.inserted_id})  # busca el usuario recién insertado 
-
-        if not new_user:
+        user["password"] = await hash_password_async(user["password"])  # hashea la contraseña (en el pool de bcrypt)
+
+        # El índice único de users.email rechaza el duplicado: solo se busca
+        # antes si el índice no se pudo crear al iniciar
+        try:
+            if await _email_taken(collection, user["email"]):
+                raise DuplicateKeyError("users.email")
+            insert = await collection.insert_one(user)  # inserta el usuario en la colección
+        except DuplicateKeyError:
             raise HTTPException(
-                status_code=500,
-                detail="Error al crear el usuario"
+                status_code=400,
+                detail="El usuario ya existe con este email"
             )
 
-
-        token = create_access_token({"user_id": str(new_user["_id"])})
+        # La respuesta se arma con los datos ya validados, sin volver a leer el usuario
+        user_id = str(insert.inserted_id)
+        token = _token_for({"_id": user_id})
 
         return UserResponseSchema(
-            id=str(new_user["_id"]),
-            name=new_user["name"],
-            email=new_user["email"],
+            id=user_id,
+            name=user["name"],
+            email=user["email"],
             token=token
         )
 
@@ -63,12 +82,19 @@ async def login_user(data_user: UserLoginSchema) -> UserResponseSchema:
                 status_code=404,
                 detail={"message": "Correo electrónico incorrecto"}
             )
-        if not verify_password(data_user.password, new_user["password"]):
+        valid, new_hash = await verify_and_update_password(data_user.password, new_user["password"])
+        if not valid:
             raise HTTPException(
                 status_code=404,
                 detail={"message": "Contraseña incorrecta"}
             )
-        token = create_access_token({"user_id": str(new_user["_id"])})
+        if new_hash:
+            # El hash usa un costo antiguo: se actualiza de forma transparente
+            await collection.update_one(
+                {"_id": new_user["_id"]},
+                {"$set": {"password": new_hash}}
+            )
+        token = _token_for(new_user)
 
         return UserResponseSchema(
             id=str(new_user["_id"]),
@@ -85,7 +111,6 @@ async def login_user(data_user: UserLoginSchema) -> UserResponseSchema:
         )
         
 #Daniel Tamara Rivera 
-#TOCA AJUSTARLO PARA QUE CUANDO NO DETECTA NADA NO PRESENTE ERROR 500 Internal.
 async def update_user(user_id: str, updated_data: dict) -> UserResponseSchema:
     try:
         db = get_database()
@@ -93,22 +118,39 @@ async def update_user(user_id: str, updated_data: dict) -> UserResponseSchema:
 
         user_obj_id = ObjectId(user_id)
 
-        if "password" in updated_data:
-            updated_data["password"] = hash_password(updated_data["password"])
+        updated_data = {k: v for k, v in updated_data.items() if k in EDITABLE_USER_FIELDS}
+        if not updated_data:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Solo se pueden actualizar: {', '.join(EDITABLE_USER_FIELDS)}"
+            )
 
-        result = await collection.update_one(
-            {"_id": user_obj_id},
-            {"$set": updated_data}
-        )
+        if "password" in updated_data:
+            updated_data["password"] = await hash_password_async(updated_data["password"])
+
+        # Actualiza y devuelve el usuario actualizado en una sola operación
+        try:
+            if "email" in updated_data and await _email_taken(collection, updated_data["email"], user_obj_id):
+                raise DuplicateKeyError("users.email")
+            updated_user = await collection.find_one_and_update(
+                {"_id": user_obj_id},
+                {"$set": updated_data},
+                projection=USER_RESPONSE_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=400,
+                detail="Ya existe un usuario con este email"
+            )
 
-        if result.modified_count == 0:
+        if not updated_user:
             raise HTTPException(
                 status_code=404,
                 detail="No se pudo actualizar la cuenta. Verifica el ID."
             )
 
-        updated_user = await collection.find_one({"_id": user_obj_id})
-        token = create_access_token({"user_id": str(updated_user["_id"])})
+        token = _token_for(updated_user)
 
         return UserResponseSchema(
             id=str(updated_user["_id"]),
@@ -117,6 +159,8 @@ async def update_user(user_id: str, updated_data: dict) -> UserResponseSchema:
             token=token
         )
 
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -130,16 +174,29 @@ async def delete_user(user_id: str) -> dict:
         collection = db["users"]
 
         user_obj_id = ObjectId(user_id)
+
+        # El trabajo de borrado se guarda antes de borrar al usuario: si el proceso
+        # muere entre medio, sus análisis e imágenes se borran igual al reiniciar.
+        # El worker se despierta después, cuando el usuario ya no existe
+        created = await schedule_user_deletion(user_obj_id, wake=False)
         result = await collection.delete_one({"_id": user_obj_id})
 
         if result.deleted_count == 0:
+            if created:
+                await cancel_user_deletion(user_obj_id)
             raise HTTPException(
                 status_code=404,
                 detail="No se encontró el usuario para eliminar"
             )
 
+        # Sus análisis e imágenes se borran en segundo plano
+        forget_user_tokens(user_id)
+        wake_user_deletion_worker()
+
         return {"message": "Usuario eliminado correctamente"}
 
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(
             status_code=500,
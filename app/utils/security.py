@@ -1,14 +1,49 @@
+import asyncio
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from bson import ObjectId
+from cachetools import LRUCache
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 
+from app.database.mongodb import get_database
+
+# Costo de bcrypt (configurable). Los hashes con un costo menor se marcan
+# como desactualizados y se vuelven a generar cuando el usuario inicia sesión
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
 # contexto de encriptación que usa el algoritmo bcrypt, hashea las contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS
+)
+
+# bcrypt libera el GIL, así que un pool de hilos evita bloquear el event loop.
+# Se crea al primer uso: así un segundo lifespan en el mismo proceso tiene pool
+_password_pool: Optional[ThreadPoolExecutor] = None
+_password_stats = {"pending": 0, "max_pending": 0, "completed": 0, "busy_seconds": 0.0}
 
 # Clave secreta para firmar los tokens JWT 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "passwordKey")  # Usa la misma clave que en Node.js
 ALGORITHM = "HS256" # Algoritmo de encriptación,es el más común en estos casos
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
+ADMIN_ROLE = "admin"
+
+# Tokens ya verificados (token -> claims): evita repetir la verificación de la
+# firma en clientes que hacen muchas peticiones. La expiración se revisa igual.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+_token_cache: LRUCache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+_token_stats = {"hits": 0, "misses": 0, "rejected": 0}
+
+bearer_scheme = HTTPBearer(auto_error=False)
 
 
 def hash_password(password: str) -> str: #hashea la contraseña usando pwd_contexto que usa bycript
@@ -18,8 +53,167 @@ def hash_password(password: str) -> str: #hashea la contraseña usando pwd_conte
 def verify_password(escrita: str, guardada: str) -> bool:
     return pwd_context.verify(escrita, guardada) #toma la contraseña texto plano que escribe el usuario y la vuelve a hashear con el mismo algoritmo HS256 para compararla con la hasheada guardada en la base de datos, si conside es true el bool
  
+def _get_password_pool() -> ThreadPoolExecutor:
+    global _password_pool
+    if _password_pool is None:
+        _password_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _password_pool
+
+
+async def _run_password_task(fn, *args):
+    _password_stats["pending"] += 1
+    _password_stats["max_pending"] = max(_password_stats["max_pending"], _password_stats["pending"])
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        return await loop.run_in_executor(_get_password_pool(), fn, *args)
+    finally:
+        _password_stats["pending"] -= 1
+        _password_stats["completed"] += 1
+        _password_stats["busy_seconds"] += loop.time() - started
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_task(hash_password, password)
+
+
+# Devuelve (coincide, nuevo_hash); nuevo_hash no es None si hay que actualizar el guardado
+async def verify_and_update_password(escrita: str, guardada: str) -> Tuple[bool, Optional[str]]:
+    return await _run_password_task(pwd_context.verify_and_update, escrita, guardada)
+
+
+def get_password_pool_stats() -> dict:
+    completed = _password_stats["completed"]
+    return {
+        **_password_stats,
+        "workers": PASSWORD_HASH_WORKERS,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "avg_seconds": round(_password_stats["busy_seconds"] / completed, 4) if completed else 0.0,
+    }
+
+
+def shutdown_password_pool():
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=False)
+        _password_pool = None
+
 #crea un token de acceso JWT con los datos proporcionados
-def create_access_token(data: dict): #recine un diccionario de datos que se van a incluir en el token
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None): #recine un diccionario de datos que se van a incluir en el token
     to_encode = data.copy() #copia los datos para no modificar el original
+    now = datetime.utcnow()
+    to_encode.update({
+        "iat": now,
+        "exp": now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    })
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM) # agrega la clave secreta y el algoritmo de encriptación al token
     return encoded_jwt
+
+
+#verifica la firma y la expiración del token y devuelve sus claims (lanza JWTError si no es válido)
+def decode_access_token(token: str) -> Dict:
+    claims = _token_cache.get(token)
+    if claims is not None:
+        if claims["exp"] > time.time():
+            _token_stats["hits"] += 1
+            return claims
+        _token_cache.pop(token, None)
+
+    _token_stats["misses"] += 1
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require_exp": True})
+        if not claims.get("user_id"):
+            raise JWTError("El token no tiene user_id")
+    except JWTError:
+        _token_stats["rejected"] += 1
+        raise
+
+    _token_cache[token] = claims
+    return claims
+
+
+def user_id_from_token(token: Optional[str]) -> Optional[str]:
+    # Para WebSocket y <img>, que no pueden enviar la cabecera Authorization
+    if not token:
+        return None
+    try:
+        return decode_access_token(token)["user_id"]
+    except JWTError:
+        return None
+
+
+#dependencia de FastAPI: devuelve los claims del token "Authorization: Bearer <token>"
+async def get_current_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> Dict:
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No autenticado",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    try:
+        return decode_access_token(credentials.credentials)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido o expirado",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+#dependencia de FastAPI: devuelve el user_id del token
+async def get_current_user_id(claims: Dict = Depends(get_current_claims)) -> str:
+    return claims["user_id"]
+
+
+#dependencia de FastAPI para las rutas que crean datos: el token de una cuenta
+#borrada sigue siendo válido hasta exp, pero ya no puede guardar análisis nuevos
+#(quedarían huérfanos porque el borrado en cascada ya terminó)
+async def get_active_user_id(user_id: str = Depends(get_current_user_id)) -> str:
+    exists = ObjectId.is_valid(user_id) and await get_database()["users"].find_one(
+        {"_id": ObjectId(user_id)}, {"_id": 1}
+    )
+    if not exists:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="La cuenta ya no existe",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return user_id
+
+
+def forget_user_tokens(user_id: str):
+    # Al borrar la cuenta sus tokens dejan de servirse desde el caché
+    for token, claims in list(_token_cache.items()):
+        if claims.get("user_id") == user_id:
+            _token_cache.pop(token, None)
+
+
+# El rol sale del campo "role" del usuario al iniciar sesión (por defecto "user")
+def is_admin(claims: Dict) -> bool:
+    return claims.get("role") == ADMIN_ROLE
+
+
+#dependencia de FastAPI: solo administradores (exportaciones, métricas)
+async def require_admin(claims: Dict = Depends(get_current_claims)) -> Dict:
+    if not is_admin(claims):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Se requiere rol de administrador")
+    return claims
+
+
+def ensure_same_user(user_id: Optional[str], current_user_id: str) -> str:
+    # user_id enviado por el cliente (ruta o formulario) debe ser el del token
+    if user_id is not None and str(user_id) != current_user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado para este usuario")
+    return current_user_id
+
+
+def get_token_cache_stats() -> Dict:
+    lookups = _token_stats["hits"] + _token_stats["misses"]
+    return {
+        **_token_stats,
+        "hit_ratio": round(_token_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "entries": len(_token_cache),
+        "expire_minutes": ACCESS_TOKEN_EXPIRE_MINUTES,
+    }
@@ -0,0 +1,53 @@
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+
+class LatencyProbe:
+    """
+    Simula lecturas baratas (p. ej. GET /analysis/{id} con caché) mientras
+    corre la carga: cada lectura pide dormir `interval` segundos y se mide
+    cuánto más tardó. Si el event loop está bloqueado, ese retraso crece.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.delays: List[float] = []
+        self._task = None
+        self._started = 0.0
+
+    async def _run(self):
+        while True:
+            self._started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.delays.append(time.perf_counter() - self._started - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, float]:
+        # La lectura en curso también cuenta: si el loop estuvo bloqueado
+        # todo el tiempo es la única y la más lenta
+        pending = time.perf_counter() - self._started - self.interval
+        if pending > 0:
+            self.delays.append(pending)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return percentiles(self.delays)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(values)
+    return {
+        "n": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def print_row(name: str, row: Dict):
+    print(f"{name:<12} " + "  ".join(f"{k}={v}" for k, v in row.items()))
@@ -0,0 +1,95 @@
+"""
+Latencia del event loop con llamadas a Gemini en curso.
+
+Compara la llamada síncrona del SDK dentro de la corrutina (como antes:
+client.models.generate_content bloquea el loop mientras espera la red) con
+client.aio, que usa GeminiClient ahora. Gemini se reemplaza por un SDK falso
+que tarda --latency segundos; no se hace ninguna petición real.
+
+Uso:
+    python -m bench.bench_event_loop [--calls 32] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.services import gemini_client
+from app.services.gemini_client import GeminiClient
+from bench._common import LatencyProbe, print_row
+
+RESPONSE = json.dumps({"mensaje": "ok", "descargo": "d", "tema": "t", "resumen": "r"})
+
+
+class _Response:
+    text = RESPONSE
+
+
+class _SyncModels:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def generate_content(self, model, contents, config):
+        time.sleep(self.latency)
+        return _Response()
+
+
+class _AsyncModels:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def generate_content(self, model, contents, config):
+        await asyncio.sleep(self.latency)
+        return _Response()
+
+
+class FakeSDK:
+    def __init__(self, latency: float):
+        self.models = _SyncModels(latency)
+        self.aio = type("Aio", (), {"models": _AsyncModels(latency)})()
+
+
+async def _blocking_generate_json(self, contents, config, model):
+    # Lo que hacía GeminiClient antes de usar client.aio
+    res = self.client.models.generate_content(model=model, contents=contents, config=config)
+    return json.loads(res.text)
+
+
+async def _run(client: GeminiClient, calls: int):
+    probe = LatencyProbe()
+    probe.start()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(client.generate_combined(f"consulta {i}") for i in range(calls)))
+    elapsed = time.perf_counter() - started
+    reads = await probe.stop()
+
+    assert all(response["mensaje"] == "ok" for response, _ in results)
+    return {"calls_per_s": round(calls / elapsed, 1), **{f"read_{k}": v for k, v in reads.items()}}
+
+
+def _client(latency: float, calls: int) -> GeminiClient:
+    client = GeminiClient(api_key="bench-key", model="bench")
+    client.client = FakeSDK(latency)
+    # Se mide el event loop, no el bulkhead
+    client.bulkhead = gemini_client.Bulkhead(calls, gemini_client.GEMINI_QUEUE_TIMEOUT)
+    return client
+
+
+async def main(calls: int, latency: float):
+    # El timeout no debe cortar la variante bloqueante (tarda calls * latency)
+    gemini_client.GEMINI_TIMEOUT = calls * latency * 2 + 1
+    print(f"calls={calls} latency={latency}s")
+
+    blocking = _client(latency, calls)
+    blocking._generate_json = _blocking_generate_json.__get__(blocking)
+    print_row("sync-sdk", await _run(blocking, calls))
+    print_row("aio", await _run(_client(latency, calls), calls))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.calls, args.latency))
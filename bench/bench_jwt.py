@@ -0,0 +1,66 @@
+"""
+Costo por petición de verificar el token JWT.
+
+Compara jwt.decode en cada petición (como antes) con decode_access_token,
+que guarda los tokens ya verificados en un LRU, y con la dependencia
+get_current_claims completa que usan las rutas. Con --tokens distintos se
+simulan varios clientes; si superan TOKEN_CACHE_SIZE el caché deja de ayudar.
+
+Uso:
+    python -m bench.bench_jwt [--requests 20000] [--tokens 100]
+"""
+import argparse
+import time
+
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+from app.utils import security
+from bench._common import print_row
+
+
+def _tokens(count: int):
+    return [security.create_access_token({"user_id": f"user-{i}", "role": "user"}) for i in range(count)]
+
+
+def _time_per_call(fn, tokens, requests: int) -> dict:
+    started = time.perf_counter()
+    for i in range(requests):
+        fn(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - started
+    return {"us_per_request": round(elapsed / requests * 1e6, 2), "requests_per_s": round(requests / elapsed)}
+
+
+def _raw_decode(token: str):
+    return jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM], options={"require_exp": True})
+
+
+def _dependency(token: str):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    coro = security.get_current_claims(credentials)
+    # La dependencia no espera nada: se ejecuta sin event loop
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+
+
+def main(requests: int, tokens: int):
+    sample = _tokens(tokens)
+    print(f"requests={requests} tokens={tokens} cache_size={security.TOKEN_CACHE_SIZE}")
+
+    print_row("jwt.decode", _time_per_call(_raw_decode, sample, requests))
+
+    security._token_cache.clear()
+    print_row("cache", _time_per_call(security.decode_access_token, sample, requests))
+    print_row("dependency", _time_per_call(_dependency, sample, requests))
+    print_row("stats", security.get_token_cache_stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    main(args.requests, args.tokens)
@@ -0,0 +1,67 @@
+"""
+Rendimiento de inicio de sesión frente a la latencia de lecturas concurrentes.
+
+Compara bcrypt en el event loop (como antes) con el pool de hilos de
+app.utils.security. Para cada modo se lanzan --logins verificaciones
+con --concurrency a la vez y, en paralelo, lecturas simuladas que miden
+cuánto se retrasa el event loop.
+
+Uso:
+    python -m bench.bench_login [--logins 40] [--concurrency 8]
+
+BCRYPT_ROUNDS y PASSWORD_HASH_WORKERS se leen del entorno como en la app.
+"""
+import argparse
+import asyncio
+import time
+
+from app.utils import security
+from bench._common import LatencyProbe, print_row
+
+PASSWORD = "contraseña-de-prueba"
+
+
+async def _inline_login(stored: str):
+    # Lo que hacía login_user antes: bcrypt directamente en el event loop
+    return security.pwd_context.verify_and_update(PASSWORD, stored)
+
+
+async def _pooled_login(stored: str):
+    return await security.verify_and_update_password(PASSWORD, stored)
+
+
+async def _run(login, stored: str, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            valid, _ = await login(stored)
+            assert valid
+
+    probe = LatencyProbe()
+    probe.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    reads = await probe.stop()
+
+    return {"logins_per_s": round(logins / elapsed, 1), **{f"read_{k}": v for k, v in reads.items()}}
+
+
+async def main(logins: int, concurrency: int):
+    stored = security.hash_password(PASSWORD)
+    print(f"bcrypt rounds={security.BCRYPT_ROUNDS} workers={security.PASSWORD_HASH_WORKERS} "
+          f"logins={logins} concurrency={concurrency}")
+
+    print_row("event-loop", await _run(_inline_login, stored, logins, concurrency))
+    print_row("pool", await _run(_pooled_login, stored, logins, concurrency))
+    security.shutdown_password_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.logins, args.concurrency))
@@ -0,0 +1,93 @@
+"""
+Memoria pico de muchas subidas de imágenes grandes a la vez.
+
+Compara leer el archivo completo con image.read() antes de guardarlo (como
+antes) con store_upload, que copia el spool de UploadFile por bloques de
+UPLOAD_CHUNK_SIZE. El almacenamiento se reemplaza por uno que solo descarta
+los bloques, así que se mide la memoria de la app y no la de MongoDB.
+
+Uso:
+    python -m bench.bench_upload_memory [--uploads 16] [--mb 8]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from bson import ObjectId
+from fastapi import UploadFile
+
+from app.services import image_storage
+from bench._common import print_row
+
+
+class _NullFiles:
+    async def find_one_and_update(self, *args, **kwargs):
+        return None  # nunca hay una imagen igual: siempre se escribe
+
+
+class NullBlobStore:
+    files = _NullFiles()
+
+    async def write(self, filename, chunks, metadata, blob_id=None) -> ObjectId:
+        async for chunk in chunks:
+            await asyncio.sleep(0)  # como una escritura de red: cede el loop
+        return ObjectId()
+
+
+def _uploads(count: int, size: int):
+    files = []
+    for _ in range(count):
+        spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        # Contenido distinto por archivo sin generar todos los bytes en memoria
+        block = os.urandom(1024 * 1024)
+        for _ in range(size // len(block)):
+            spool.write(block)
+        spool.seek(0)
+        files.append(UploadFile(spool, size=size, filename="hoja.jpg"))
+    return files
+
+
+async def _read_whole(image: UploadFile) -> ObjectId:
+    # Lo que hacían las rutas antes: el archivo completo en memoria
+    data = await image.read()
+
+    async def one_chunk():
+        yield data
+
+    return await image_storage.get_blob_store().write(image.filename, one_chunk(), {})
+
+
+async def _run(store, count: int, size: int):
+    uploads = _uploads(count, size)
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(store(upload) for upload in uploads))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for upload in uploads:
+        upload.file.close()
+    return {"peak_mb": round(peak / 1024 / 1024, 1), "seconds": round(elapsed, 3)}
+
+
+async def main(count: int, mb: int):
+    size = mb * 1024 * 1024
+    image_storage.MAX_UPLOAD_BYTES = max(image_storage.MAX_UPLOAD_BYTES, size)
+    image_storage.get_blob_store = lambda: NullBlobStore()
+    print(f"uploads={count} size={mb}MB chunk={image_storage.UPLOAD_CHUNK_SIZE}")
+
+    print_row("read-whole", await _run(_read_whole, count, size))
+    print_row("chunked", await _run(image_storage.store_upload, count, size))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=16)
+    parser.add_argument("--mb", type=int, default=8)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.uploads, args.mb))
@@ -1,22 +1,47 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import os
+from dotenv import load_dotenv
+
+# Se carga el .env antes de importar los módulos que leen su configuración al importarse
+load_dotenv()
+
 from app.routes.auth import auth_router
 from app.database.mongodb import connect_to_mongodb, close_mongodb
-from dotenv import load_dotenv
+from app.database.indexes import ensure_indexes
+from app.services.gemini_client import init_gemini_client, close_gemini_client
+from app.services.ai_jobs import start_ai_workers, stop_ai_workers
+from app.services.user_deletion import start_user_deletion_worker, stop_user_deletion_worker
+from app.services.analysis_events import analysis_hub
+from app.services.image_variants import shutdown_variant_pool
+from app.services.blob_store import init_blob_store
+from app.utils.security import shutdown_password_pool
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes.plant import router as plant_router 
 from app.routes.image_router import router as image
-
-load_dotenv()
+from app.routes.metrics import router as metrics_router
+from app.routes.ws import router as ws_router
+from app.routes.stats import router as stats_router
 
 #evento, permite que se inicie la conexión a la base de datos al iniciar la aplicación
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Esto corre al iniciar
     await connect_to_mongodb()
+    init_blob_store()
+    await ensure_indexes()
+    await init_gemini_client()
+    await start_ai_workers()
+    start_user_deletion_worker()
+    analysis_hub.start()
     yield
     #Esto corre al cerrar
+    await analysis_hub.stop()
+    shutdown_variant_pool()
+    shutdown_password_pool()
+    await stop_ai_workers()
+    await stop_user_deletion_worker()
+    await close_gemini_client()
     await close_mongodb()
 
 app = FastAPI(lifespan=lifespan)
@@ -33,6 +58,9 @@ app.add_middleware(CORSMiddleware,
 app.include_router(auth_router, prefix="/auth", tags=["auth"]) 
 app.include_router(plant_router, tags=["plant"])  
 app.include_router(image, tags=["image"])           
+app.include_router(metrics_router, tags=["metrics"])
+app.include_router(ws_router, tags=["ws"])
+app.include_router(stats_router, tags=["stats"])
 
 
 @app.get("/")
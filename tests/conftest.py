@@ -0,0 +1,37 @@
+import contextlib
+import os
+from uuid import uuid4
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+
+from app.database import mongodb
+from app.services.blob_store import init_blob_store
+
+# Las pruebas que necesitan un MongoDB real se saltan si no hay uno configurado
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI")
+
+requires_mongo = pytest.mark.skipif(
+    not TEST_MONGO_URI,
+    reason="TEST_MONGO_URI no está definida (se necesita un MongoDB de prueba)"
+)
+
+
+@contextlib.asynccontextmanager
+async def mongo_test_database():
+    """Base de datos temporal: se conecta como la app y se borra al terminar."""
+    client = AsyncIOMotorClient(TEST_MONGO_URI)
+    name = f"guyp_test_{uuid4().hex[:8]}"
+
+    mongodb.db.client = client
+    mongodb.db.database = client[name]
+    mongodb.db.fs = AsyncIOMotorGridFSBucket(mongodb.db.database)
+    init_blob_store()
+    try:
+        yield mongodb.db.database
+    finally:
+        await client.drop_database(name)
+        client.close()
+        mongodb.db.client = None
+        mongodb.db.database = None
+        mongodb.db.fs = None
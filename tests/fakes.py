@@ -0,0 +1,288 @@
+"""
+Base de datos falsa en memoria con la parte de la API de Motor que usan
+los servicios. Cuenta cada operación como una ida y vuelta a MongoDB.
+"""
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_MISSING = object()
+
+
+def _get(doc: Dict, path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _matches_value(value: Any, condition: Any) -> bool:
+    # Como en MongoDB, una condición sobre un arreglo se cumple si la cumple algún elemento
+    if isinstance(value, list) and not isinstance(condition, list):
+        if isinstance(condition, dict) and set(condition) == {"$ne"}:
+            return condition["$ne"] not in value
+        if not (isinstance(condition, dict) and "$exists" in condition):
+            return any(_matches_value(item, condition) for item in value)
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif value is _MISSING:
+                if op != "$ne":
+                    return False
+            elif op == "$ne" and value == arg:
+                return False
+            elif op == "$in" and value not in arg:
+                return False
+            elif op == "$gt" and not value > arg:
+                return False
+            elif op == "$gte" and not value >= arg:
+                return False
+            elif op == "$lt" and not value < arg:
+                return False
+            elif op == "$lte" and not value <= arg:
+                return False
+        return True
+    return value is not _MISSING and value == condition
+
+
+def matches(doc: Dict, query: Dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif not _matches_value(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _project(doc: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k.split(".")[0] for k, v in projection.items() if v and k != "_id"}
+    out = {k: copy.deepcopy(v) for k, v in doc.items() if k in include}
+    if projection.get("_id", 1) and "_id" in doc:
+        out["_id"] = doc["_id"]
+    return out
+
+
+def _set_path(doc: Dict, path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _apply_update(doc: Dict, update: Dict):
+    for path, value in update.get("$set", {}).items():
+        _set_path(doc, path, value)
+    for path in update.get("$unset", {}):
+        parts = path.split(".")
+        target = doc
+        for part in parts[:-1]:
+            target = target.get(part, {})
+        target.pop(parts[-1], None)
+    for path, delta in update.get("$inc", {}).items():
+        current = _get(doc, path)
+        _set_path(doc, path, (0 if current is _MISSING else current) + delta)
+    for path, value in update.get("$addToSet", {}).items():
+        current = _get(doc, path)
+        items = [] if current is _MISSING else current
+        for item in value["$each"] if isinstance(value, dict) and "$each" in value else [value]:
+            if item not in items:
+                items.append(item)
+        _set_path(doc, path, items)
+    for path, value in update.get("$pull", {}).items():
+        current = _get(doc, path)
+        if current is not _MISSING:
+            _set_path(doc, path, [item for item in current if not _matches_value(item, value)])
+
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict]):
+        self._docs = docs
+
+    def limit(self, count: int) -> "FakeCursor":
+        self._docs = self._docs[:count] if count else self._docs
+        return self
+
+    def batch_size(self, size: int) -> "FakeCursor":
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        return self._docs[:length] if length else list(self._docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+
+class FakeInsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class FakeUpdateResult:
+    def __init__(self, matched: int, modified: int, upserted_id=None):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.upserted_id = upserted_id
+
+
+class FakeDeleteResult:
+    def __init__(self, deleted: int):
+        self.deleted_count = deleted
+
+
+class FakeCollection:
+    def __init__(self, db: "FakeDatabase", name: str, unique: Tuple[str, ...] = ()):
+        self.db = db
+        self.name = name
+        self.unique = unique
+        self.docs: List[Dict] = []
+
+    def _trip(self, op: str):
+        self.db.calls.append((self.name, op))
+
+    def _check_unique(self, doc: Dict, ignore: Optional[Dict] = None):
+        for field in self.unique:
+            value = _get(doc, field)
+            if value is _MISSING:
+                continue
+            for other in self.docs:
+                if other is not ignore and _get(other, field) == value:
+                    raise DuplicateKeyError(f"E11000 duplicate key: {field}")
+
+    def _find(self, query: Dict) -> Optional[Dict]:
+        return next((doc for doc in self.docs if matches(doc, query)), None)
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> FakeCursor:
+        self._trip("find")
+        return FakeCursor([_project(doc, projection) for doc in self.docs if matches(doc, query or {})])
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None):
+        self._trip("find_one")
+        doc = self._find(query or {})
+        return _project(doc, projection) if doc else None
+
+    async def insert_one(self, doc: Dict):
+        self._trip("insert_one")
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self.docs.append(copy.deepcopy(doc))
+        return FakeInsertOneResult(doc["_id"])
+
+    async def insert_many(self, docs: List[Dict], ordered: bool = True):
+        self._trip("insert_many")
+        errors = []
+        for index, doc in enumerate(docs):
+            doc.setdefault("_id", ObjectId())
+            try:
+                self._check_unique(doc)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            self.docs.append(copy.deepcopy(doc))
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        self._trip("update_one")
+        return self._update_one(query, update, upsert)
+
+    def _update_one(self, query: Dict, update: Dict, upsert: bool = False) -> FakeUpdateResult:
+        doc = self._find(query)
+        if doc is None:
+            if not upsert:
+                return FakeUpdateResult(0, 0)
+            doc = {k: v for k, v in query.items() if not k.startswith("$")}
+            doc.setdefault("_id", ObjectId())
+            _apply_update(doc, update)
+            self.docs.append(doc)
+            return FakeUpdateResult(0, 0, doc["_id"])
+        before = copy.deepcopy(doc)
+        _apply_update(doc, update)
+        return FakeUpdateResult(1, int(doc != before))
+
+    async def update_many(self, query: Dict, update: Dict):
+        self._trip("update_many")
+        docs = [doc for doc in self.docs if matches(doc, query)]
+        for doc in docs:
+            _apply_update(doc, update)
+        return FakeUpdateResult(len(docs), len(docs))
+
+    async def bulk_write(self, requests: List, ordered: bool = True):
+        # Solo UpdateOne, que es lo que usan los servicios
+        self._trip("bulk_write")
+        for request in requests:
+            self._update_one(request._filter, request._doc, request._upsert)
+
+    async def find_one_and_update(
+        self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+        return_document=ReturnDocument.BEFORE, **kwargs
+    ):
+        self._trip("find_one_and_update")
+        doc = self._find(query)
+        if doc is None:
+            return None
+        before = copy.deepcopy(doc)
+        candidate = copy.deepcopy(doc)
+        _apply_update(candidate, update)
+        self._check_unique(candidate, ignore=doc)
+        _apply_update(doc, update)
+        return _project(doc if return_document == ReturnDocument.AFTER else before, projection)
+
+    async def find_one_and_delete(self, query: Dict, projection: Optional[Dict] = None, **kwargs):
+        self._trip("find_one_and_delete")
+        doc = self._find(query)
+        if doc is None:
+            return None
+        self.docs.remove(doc)
+        return _project(doc, projection)
+
+    async def delete_many(self, query: Dict):
+        self._trip("delete_many")
+        docs = [doc for doc in self.docs if matches(doc, query)]
+        for doc in docs:
+            self.docs.remove(doc)
+        return FakeDeleteResult(len(docs))
+
+    async def delete_one(self, query: Dict):
+        self._trip("delete_one")
+        doc = self._find(query)
+        if doc is None:
+            return FakeDeleteResult(0)
+        self.docs.remove(doc)
+        return FakeDeleteResult(1)
+
+
+class FakeDatabase:
+    def __init__(self, unique: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self.calls: List[Tuple[str, str]] = []
+        self._unique = unique or {}
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self, name, self._unique.get(name, ()))
+        return self._collections[name]
+
+    def round_trips(self, collection: Optional[str] = None) -> int:
+        return sum(1 for name, _ in self.calls if collection is None or name == collection)
+
+    def reset_calls(self):
+        self.calls.clear()
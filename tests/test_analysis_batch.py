@@ -0,0 +1,167 @@
+import asyncio
+import io
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from pymongo.errors import AutoReconnect
+from starlette.datastructures import UploadFile
+
+from app.routes import plant
+from app.schemas.plant_schemas import BatchItemSchema
+from app.services import analysis_batch, plant_analysis_service, stats_service
+from app.services.analysis_batch import save_analysis_batch
+from app.utils.security import create_access_token, get_active_user_id
+from tests.fakes import FakeDatabase
+
+USER_ID = str(ObjectId())
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    db = FakeDatabase()
+    for module in (plant_analysis_service, stats_service):
+        monkeypatch.setattr(module, "get_database", lambda: db)
+
+    state = {"db": db, "stored": {}, "released": [], "queued": []}
+
+    async def store_upload(image):
+        await asyncio.sleep(0.01 if image.filename == "lenta.jpg" else 0)
+        if image.filename == "grande.jpg":
+            raise HTTPException(status_code=413, detail="La imagen supera el tamaño máximo")
+        image_id = ObjectId()
+        state["stored"][image.filename] = image_id
+        return image_id
+
+    async def release_image(image_id):
+        state["released"].append(image_id)
+        return True
+
+    monkeypatch.setattr(analysis_batch, "store_upload", store_upload)
+    monkeypatch.setattr(analysis_batch, "release_image", release_image)
+    monkeypatch.setattr(analysis_batch, "enqueue_ai_job", state["queued"].append)
+    return state
+
+
+def _images(*names):
+    return [UploadFile(io.BytesIO(b"img"), filename=name) for name in names]
+
+
+def _items(*predictions):
+    return [BatchItemSchema(prediction=p, lat=4.6, lng=-74.0) for p in predictions]
+
+
+def test_partial_upload_failure_keeps_item_order(batch):
+    result = asyncio.run(save_analysis_batch(
+        USER_ID, _images("lenta.jpg", "grande.jpg", "c.jpg"), _items("a", "b", "c")
+    ))
+
+    assert (result["saved"], result["failed"]) == (2, 1)
+    assert [item["index"] for item in result["items"]] == [0, 1, 2]
+    assert [item["status"] for item in result["items"]] == ["saved", "error", "saved"]
+    assert result["items"][1]["error"] == "La imagen supera el tamaño máximo"
+    saved = {doc["_id"]: doc["image_url"] for doc in batch["db"]["plant_analysis"].docs}
+    assert saved[ObjectId(result["items"][0]["id"])] == batch["stored"]["lenta.jpg"]
+    assert saved[ObjectId(result["items"][2]["id"])] == batch["stored"]["c.jpg"]
+
+
+def test_failed_insert_releases_only_that_image(batch):
+    # La segunda predicción repetida viola el índice único: falla solo ese documento
+    batch["db"]["plant_analysis"].unique = ("prediction",)
+
+    result = asyncio.run(save_analysis_batch(
+        USER_ID, _images("a.jpg", "b.jpg", "c.jpg"), _items("a", "a", "c")
+    ))
+
+    assert [item["status"] for item in result["items"]] == ["saved", "error", "saved"]
+    assert batch["released"] == [batch["stored"]["b.jpg"]]
+
+
+def test_unknown_insert_outcome_releases_every_image(batch, monkeypatch):
+    analyses = batch["db"]["plant_analysis"]
+
+    async def unreachable(*args, **kwargs):
+        raise AutoReconnect("sin conexión")
+
+    def find_unreachable(*args, **kwargs):
+        raise AutoReconnect("sin conexión")
+
+    monkeypatch.setattr(analyses, "insert_many", unreachable)
+    monkeypatch.setattr(analyses, "find", find_unreachable)
+
+    result = asyncio.run(save_analysis_batch(USER_ID, _images("a.jpg", "b.jpg"), _items("a", "b")))
+
+    assert result["saved"] == 0
+    assert all(item["error"] == "No se pudo guardar el análisis" for item in result["items"])
+    assert sorted(batch["released"]) == sorted(batch["stored"].values())
+
+
+def test_images_of_analyses_saved_before_a_timeout_are_kept(batch, monkeypatch):
+    analyses = batch["db"]["plant_analysis"]
+    insert_many = analyses.insert_many
+
+    async def saved_then_timeout(docs, ordered=True):
+        # El servidor guardó el primer documento y la respuesta se perdió
+        await insert_many(docs[:1], ordered)
+        raise AutoReconnect("timeout")
+
+    monkeypatch.setattr(analyses, "insert_many", saved_then_timeout)
+
+    result = asyncio.run(save_analysis_batch(USER_ID, _images("a.jpg", "b.jpg"), _items("a", "b")))
+
+    assert [item["status"] for item in result["items"]] == ["saved", "error"]
+    assert batch["released"] == [batch["stored"]["b.jpg"]]
+
+
+def test_with_ai_enqueues_by_prediction(batch):
+    result = asyncio.run(save_analysis_batch(
+        USER_ID, _images("a.jpg", "b.jpg", "c.jpg", "d.jpg"), _items("tizón", "mildiu", "tizón", "mildiu"),
+        with_ai=True
+    ))
+
+    ids = [item["id"] for item in result["items"]]
+    assert all(item["ai_status"] == "pending" for item in result["items"])
+    assert [batch["queued"].index(i) // 2 for i in ids] == [1, 0, 1, 0]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def save_analysis_batch(user_id, images, items, with_ai):
+        return {"saved": len(images), "failed": 0, "items": [], "with_ai": with_ai}
+
+    monkeypatch.setattr(plant, "save_analysis_batch", save_analysis_batch)
+    app = FastAPI()
+    app.include_router(plant.router)
+    app.dependency_overrides[get_active_user_id] = lambda: USER_ID
+    return TestClient(app, headers={"Authorization": f"Bearer {create_access_token({'user_id': USER_ID})}"})
+
+
+def _files(count: int):
+    return [("images", (f"{i}.jpg", b"img", "image/jpeg")) for i in range(count)]
+
+
+def test_items_count_must_match_images(client):
+    items = '[{"prediction": "a", "lat": 4.6, "lng": -74.0}]'
+    response = client.post("/analysis/batch", files=_files(2), data={"items": items})
+    assert response.status_code == 400
+
+
+def test_batch_form_is_parsed(client):
+    items = '[{"prediction": "a", "lat": 4.6, "lng": -74.0}]'
+    response = client.post("/analysis/batch", files=_files(1), data={"items": items, "with_ai": "true"})
+    assert response.status_code == 200
+    assert response.json()["with_ai"] is True
+
+
+def test_too_many_images_are_rejected(client):
+    response = client.post(
+        "/analysis/batch", files=_files(analysis_batch.BATCH_MAX_ITEMS + 1), data={"items": "[]"}
+    )
+    assert response.status_code == 413
+
+
+def test_oversized_body_is_rejected_before_parsing(client, monkeypatch):
+    monkeypatch.setattr(plant, "BATCH_MAX_BYTES", 10)
+    response = client.post("/analysis/batch", files=_files(1), data={"items": "[]"})
+    assert response.status_code == 413
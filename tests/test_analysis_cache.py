@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from cachetools import TTLCache
+
+from app.services import analysis_cache, analysis_orchestrator, plant_analysis_service, stats_service
+from app.services.analysis_orchestrator import store_ai_result
+from app.services.plant_analysis_service import (
+    add_ai_response,
+    delete_analysis,
+    get_ai_response_by_analysis_id,
+    get_ai_status_by_analysis_id,
+    get_analysis_by_id,
+    update_prediction,
+)
+from tests.fakes import FakeDatabase
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(
+        analysis_cache, "_cache",
+        TTLCache(maxsize=100, ttl=analysis_cache.ANALYSIS_CACHE_TTL, timer=clock)
+    )
+    return clock
+
+
+@pytest.fixture
+def db(monkeypatch, clock):
+    db = FakeDatabase()
+    for module in (plant_analysis_service, analysis_orchestrator, stats_service):
+        monkeypatch.setattr(module, "get_database", lambda: db)
+
+    async def release_image(image_id):
+        return False
+
+    monkeypatch.setattr(plant_analysis_service, "release_image", release_image)
+    return db
+
+
+def _insert(db, **fields) -> str:
+    doc = {
+        "_id": ObjectId(),
+        "user_id": ObjectId(),
+        "prediction": "Septoria_leaf_spot",
+        "location": {"lat": 4.6, "lng": -74.0},
+        "image_url": ObjectId(),
+        "created_at": datetime(2025, 1, 1),
+        **fields
+    }
+    db["plant_analysis"].docs.append(doc)
+    return str(doc["_id"])
+
+
+def _raw(db, analysis_id: str) -> dict:
+    return next(d for d in db["plant_analysis"].docs if str(d["_id"]) == analysis_id)
+
+
+def test_repeated_reads_hit_the_cache(db):
+    analysis_id = _insert(db)
+
+    async def run():
+        first = await get_analysis_by_id(analysis_id)
+        second = await get_analysis_by_id(analysis_id)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first == second
+    assert db.calls.count(("plant_analysis", "find_one")) == 1
+
+
+def test_update_prediction_invalidates(db):
+    analysis_id = _insert(db)
+
+    async def run():
+        await get_analysis_by_id(analysis_id)
+        assert await update_prediction(analysis_id, "Early_blight")
+        return await get_analysis_by_id(analysis_id)
+
+    assert asyncio.run(run())["prediction"] == "Early_blight"
+
+
+def test_add_ai_response_invalidates(db):
+    analysis_id = _insert(db, ai_generated=True, ai_response={"mensaje": "viejo"})
+
+    async def run():
+        await get_ai_response_by_analysis_id(analysis_id)
+        await add_ai_response(analysis_id, {"mensaje": "nuevo"})
+        return await get_ai_response_by_analysis_id(analysis_id)
+
+    assert asyncio.run(run())["ai_response"] == {"mensaje": "nuevo"}
+
+
+def test_delete_invalidates(db):
+    analysis_id = _insert(db)
+
+    async def run():
+        assert await get_analysis_by_id(analysis_id)
+        assert await delete_analysis(analysis_id)
+        return await get_analysis_by_id(analysis_id)
+
+    assert asyncio.run(run()) is None
+
+
+def test_in_progress_ai_is_not_cached(db):
+    analysis_id = _insert(db, ai_status="running")
+
+    async def run():
+        assert (await get_ai_status_by_analysis_id(analysis_id))["status"] == "running"
+        await get_analysis_by_id(analysis_id)
+        await get_analysis_by_id(analysis_id)
+        await store_ai_result(ObjectId(analysis_id), {"mensaje": "ok"}, {"tema": "t"}, True)
+        return await get_ai_status_by_analysis_id(analysis_id)
+
+    assert asyncio.run(run())["status"] == "done"
+    # Mientras la IA estaba en curso cada lectura fue a MongoDB
+    assert db.calls.count(("plant_analysis", "find_one")) == 4
+
+
+def test_write_from_another_worker_is_stale_at_most_ttl(db, clock):
+    analysis_id = _insert(db)
+
+    async def read():
+        return await get_analysis_by_id(analysis_id)
+
+    asyncio.run(read())
+    # Otro worker escribe sin pasar por la invalidación de este proceso
+    _raw(db, analysis_id)["prediction"] = "Early_blight"
+
+    clock.now = analysis_cache.ANALYSIS_CACHE_TTL - 1
+    assert asyncio.run(read())["prediction"] == "Septoria_leaf_spot"
+
+    clock.now = analysis_cache.ANALYSIS_CACHE_TTL + 1
+    assert asyncio.run(read())["prediction"] == "Early_blight"
+
+
+def test_callers_cannot_mutate_cached_entry(db):
+    analysis_id = _insert(db)
+
+    async def run():
+        first = await get_analysis_by_id(analysis_id)
+        first["prediction"] = "modificado"
+        return await get_analysis_by_id(analysis_id)
+
+    assert asyncio.run(run())["prediction"] == "Septoria_leaf_spot"
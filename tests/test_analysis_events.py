@@ -0,0 +1,105 @@
+import asyncio
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from app.services import analysis_events
+from app.services.analysis_events import AnalysisEventHub
+
+USER_ID = ObjectId()
+
+
+class FakeStream:
+    def __init__(self, changes, error=None):
+        self.changes = changes
+        self.error = error
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for i, change in enumerate(self.changes):
+            self.resume_token = {"_data": str(i)}
+            yield change
+        if self.error:
+            raise self.error
+        await asyncio.Event().wait()  # sin más cambios: queda abierto
+
+
+class FakeCollection:
+    def __init__(self, streams):
+        self.streams = streams
+        self.resume_tokens = []
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resume_tokens.append(resume_after)
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        return stream
+
+
+def _change():
+    analysis_id = ObjectId()
+    return {
+        "documentKey": {"_id": analysis_id},
+        "fullDocument": {"user_id": USER_ID, "ai_status": "done", "ai_generated": True}
+    }
+
+
+def _run_hub(monkeypatch, streams, events: int):
+    collection = FakeCollection(streams)
+    monkeypatch.setattr(analysis_events, "get_database", lambda: {"plant_analysis": collection})
+
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds):
+        await real_sleep(0)  # sin esperar el segundo entre reintentos
+
+    async def main():
+        hub = AnalysisEventHub()
+        polled = asyncio.Event()
+
+        async def poll():
+            hub.mode = "polling"
+            polled.set()
+
+        hub._poll = poll
+        queue = hub.subscribe(str(USER_ID))
+        monkeypatch.setattr(analysis_events.asyncio, "sleep", sleep)
+        hub.start()
+        received = [await asyncio.wait_for(queue.get(), 1) for _ in range(events)]
+        if not events:
+            await asyncio.wait_for(polled.wait(), 1)
+        await hub.stop()
+        return hub.mode, received
+
+    mode, received = asyncio.run(main())
+    return mode, received, collection.resume_tokens
+
+
+def test_lost_history_reopens_the_stream_without_resume_token(monkeypatch):
+    lost = OperationFailure("Resume of change stream was not possible", code=286,
+                            details={"codeName": "ChangeStreamHistoryLost"})
+    streams = [FakeStream([_change()], error=lost), FakeStream([_change()])]
+
+    mode, received, tokens = _run_hub(monkeypatch, streams, events=2)
+
+    assert mode == "change_stream"
+    assert len(received) == 2
+    assert tokens == [None, None]
+
+
+def test_standalone_server_falls_back_to_polling(monkeypatch):
+    unsupported = OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    mode, received, _ = _run_hub(monkeypatch, [unsupported], events=0)
+
+    assert mode == "polling"
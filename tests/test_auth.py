@@ -0,0 +1,151 @@
+from datetime import timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import JWTError
+
+from app.routes import metrics, plant, stats
+from app.utils import security
+from app.utils.security import create_access_token, decode_access_token, forget_user_tokens
+from tests.fakes import FakeDatabase
+
+USER_ID = str(ObjectId())
+
+
+def _headers(role: str = "user", user_id: str = USER_ID) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'user_id': user_id, 'role': role})}"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    async def get_all_analyses(limit, cursor):
+        calls.append(("all", None))
+        return {"items": [], "next_cursor": None}
+
+    async def get_analyses_by_user(user_id, limit, cursor):
+        calls.append(("user", user_id))
+        return {"items": [], "next_cursor": None}
+
+    monkeypatch.setattr(plant, "get_all_analyses", get_all_analyses)
+    monkeypatch.setattr(plant, "get_analyses_by_user", get_analyses_by_user)
+
+    app = FastAPI()
+    app.include_router(plant.router)
+    app.include_router(metrics.router)
+    app.include_router(stats.router)
+    test_client = TestClient(app)
+    test_client.calls = calls
+    return test_client
+
+
+def test_expired_token_is_rejected():
+    token = create_access_token({"user_id": USER_ID}, expires_delta=timedelta(seconds=-1))
+    with pytest.raises(JWTError):
+        decode_access_token(token)
+
+
+def test_verified_tokens_are_cached(monkeypatch):
+    token = create_access_token({"user_id": USER_ID})
+    decode_access_token(token)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("no debería verificar la firma otra vez")
+
+    monkeypatch.setattr(security.jwt, "decode", fail)
+    assert decode_access_token(token)["user_id"] == USER_ID
+
+
+def test_cached_token_still_expires(monkeypatch):
+    token = create_access_token({"user_id": USER_ID})
+    claims = decode_access_token(token)
+    monkeypatch.setattr(security.time, "time", lambda: claims["exp"] + 1)
+
+    # Tras expirar se vuelve a verificar la firma (y jose rechaza el token)
+    def expired(*args, **kwargs):
+        raise JWTError("Signature has expired.")
+
+    monkeypatch.setattr(security.jwt, "decode", expired)
+    with pytest.raises(JWTError):
+        decode_access_token(token)
+
+
+def test_listing_is_scoped_to_the_caller(client):
+    assert client.get("/analysis/").status_code == 401
+
+    assert client.get("/analysis/", headers=_headers()).status_code == 200
+    assert client.get("/analysis/", headers=_headers("admin")).status_code == 200
+    assert client.calls == [("user", USER_ID), ("all", None)]
+
+
+def test_other_users_history_is_forbidden(client):
+    other = str(ObjectId())
+    assert client.get(f"/user/{other}/analysis", headers=_headers()).status_code == 403
+
+
+def test_export_requires_admin(client):
+    assert client.get("/analysis/export", headers=_headers()).status_code == 403
+
+
+def test_metrics_require_admin(client):
+    assert client.get("/metrics/auth-tokens").status_code == 401
+    assert client.get("/metrics/auth-tokens", headers=_headers()).status_code == 403
+    assert client.get("/metrics/auth-tokens", headers=_headers("admin")).status_code == 200
+
+
+def test_stats_require_authentication(client):
+    assert client.get("/stats/predictions?from=2025-01-01&to=2025-01-31").status_code == 401
+
+
+def test_forgotten_tokens_are_verified_again(monkeypatch):
+    token = create_access_token({"user_id": USER_ID})
+    other = create_access_token({"user_id": str(ObjectId())})
+    decode_access_token(token)
+    decode_access_token(other)
+
+    forget_user_tokens(USER_ID)
+    assert token not in security._token_cache
+    assert other in security._token_cache
+
+
+def test_deleted_account_cannot_create_analyses(client, monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(security, "get_database", lambda: db)
+
+    response = client.post(
+        "/analysis/",
+        data={"prediction": "a", "lat": 4.6, "lng": -74.0},
+        files={"image": ("hoja.jpg", b"img", "image/jpeg")},
+        headers=_headers()
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "La cuenta ya no existe"
+
+
+def test_stats_accept_mixed_timezones(client, monkeypatch):
+    calls = []
+
+    async def get_prediction_stats(start, end, by_region, region):
+        calls.append((start, end))
+        return []
+
+    monkeypatch.setattr(stats, "get_prediction_stats", get_prediction_stats)
+
+    response = client.get(
+        "/stats/predictions",
+        params={"from": "2025-01-01T05:00:00+05:00", "to": "2025-01-31T00:00:00"},
+        headers=_headers()
+    )
+    assert response.status_code == 200
+    start, end = calls[0]
+    assert start.tzinfo is None and start.hour == 0
+
+    reversed_range = client.get(
+        "/stats/predictions",
+        params={"from": "2025-02-01T00:00:00", "to": "2025-01-31T00:00:00Z"},
+        headers=_headers()
+    )
+    assert reversed_range.status_code == 400
@@ -0,0 +1,42 @@
+import asyncio
+import os
+
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError
+
+from app.services import blob_store
+from app.services.blob_store import BlobExistsError, LocalBlobStore
+
+
+class FailingBlobs:
+    def __init__(self, error):
+        self.error = error
+
+    async def insert_one(self, doc):
+        raise self.error
+
+
+async def _chunks():
+    yield b"hoja"
+
+
+def _write(monkeypatch, tmp_path, error):
+    monkeypatch.setattr(blob_store, "get_database", lambda: {"blobs": FailingBlobs(error)})
+    store = LocalBlobStore(str(tmp_path))
+    asyncio.run(store.write("hoja.jpg", _chunks(), {"sha256": "abc"}))
+
+
+def _files_on_disk(root):
+    return [name for _, _, names in os.walk(root) for name in names]
+
+
+def test_duplicate_blob_removes_the_file(monkeypatch, tmp_path):
+    with pytest.raises(BlobExistsError):
+        _write(monkeypatch, tmp_path, DuplicateKeyError("E11000"))
+    assert _files_on_disk(tmp_path) == []
+
+
+def test_failed_metadata_insert_removes_the_file(monkeypatch, tmp_path):
+    with pytest.raises(AutoReconnect):
+        _write(monkeypatch, tmp_path, AutoReconnect("sin conexión"))
+    assert _files_on_disk(tmp_path) == []
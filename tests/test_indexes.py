@@ -0,0 +1,138 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.database.indexes import ensure_indexes
+from app.services.plant_analysis_service import LIST_SORT
+from tests.conftest import mongo_test_database, requires_mongo
+
+pytestmark = requires_mongo
+
+
+def _winning_plan(explain) -> tuple:
+    """Índices y etapas del plan ganador (se ignoran los planes rechazados)."""
+    indexes, stages = set(), set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "stage" in node:
+                stages.add(node["stage"])
+            if "indexName" in node:
+                indexes.add(node["indexName"])
+            for key, value in node.items():
+                if key != "rejectedPlans":
+                    walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(explain)
+    return indexes, stages
+
+
+async def _seed(db):
+    now = datetime.utcnow()
+    users = [ObjectId() for _ in range(3)]
+    await db["plant_analysis"].insert_many([
+        {
+            "user_id": users[i % 3],
+            "prediction": ["Septoria_leaf_spot", "Early_blight"][i % 2],
+            "location": {"lat": 4.6 + i / 100, "lng": -74.0},
+            "geo": {"type": "Point", "coordinates": [-74.0, 4.6 + i / 100]},
+            "image_url": ObjectId(),
+            "created_at": now - timedelta(hours=i)
+        }
+        for i in range(50)
+    ])
+    await db["users"].insert_one({"name": "Ana", "email": "ana@example.com", "password": "x"})
+    return users[0], now
+
+
+def _run(check):
+    async def run():
+        async with mongo_test_database() as db:
+            await ensure_indexes()
+            user_id, now = await _seed(db)
+            await check(db, user_id, now)
+
+    asyncio.run(run())
+
+
+def test_user_history_uses_index_without_sort():
+    async def check(db, user_id, now):
+        explain = await db["plant_analysis"].find({"user_id": user_id}).sort(LIST_SORT).limit(21).explain()
+        indexes, stages = _winning_plan(explain)
+        assert "user_id_1_created_at_-1__id_-1" in indexes
+        assert "SORT" not in stages and "COLLSCAN" not in stages
+
+    _run(check)
+
+
+def test_global_listing_uses_created_at_index():
+    async def check(db, user_id, now):
+        explain = await db["plant_analysis"].find({}).sort(LIST_SORT).limit(21).explain()
+        indexes, stages = _winning_plan(explain)
+        assert "created_at_-1__id_-1" in indexes
+        assert "SORT" not in stages
+
+    _run(check)
+
+
+def test_prediction_range_uses_prediction_index():
+    async def check(db, user_id, now):
+        explain = await db["plant_analysis"].find({
+            "prediction": "Early_blight",
+            "created_at": {"$gte": now - timedelta(days=1), "$lte": now}
+        }).explain()
+        indexes, stages = _winning_plan(explain)
+        assert any(name.startswith("prediction_1_created_at") for name in indexes)
+        assert "COLLSCAN" not in stages
+
+    _run(check)
+
+
+def test_login_lookup_uses_unique_email_index():
+    async def check(db, user_id, now):
+        explain = await db["users"].find({"email": "ana@example.com"}).limit(1).explain()
+        indexes, stages = _winning_plan(explain)
+        assert "email_1" in indexes
+        assert "COLLSCAN" not in stages
+
+    _run(check)
+
+
+def test_nearby_uses_2dsphere_index():
+    async def check(db, user_id, now):
+        explain = await db.command(
+            "explain",
+            {
+                "aggregate": "plant_analysis",
+                "pipeline": [{
+                    "$geoNear": {
+                        "near": {"type": "Point", "coordinates": [-74.0, 4.6]},
+                        "key": "geo",
+                        "distanceField": "distance_m",
+                        "maxDistance": 5000,
+                        "spherical": True
+                    }
+                }],
+                "cursor": {}
+            }
+        )
+        indexes, stages = _winning_plan(explain)
+        assert "geo_2dsphere" in indexes
+        assert "COLLSCAN" not in stages
+
+    _run(check)
+
+
+def test_export_filtered_by_prediction_does_not_sort_in_memory():
+    async def check(db, user_id, now):
+        explain = await db["plant_analysis"].find({"prediction": "Early_blight"}) \
+            .sort([("created_at", 1), ("_id", 1)]).explain()
+        indexes, stages = _winning_plan(explain)
+        assert "prediction_1_created_at_-1__id_-1" in indexes
+        assert "SORT" not in stages
+
+    _run(check)
@@ -0,0 +1,185 @@
+import asyncio
+
+import pytest
+from tenacity import wait_none
+
+from app.services import gemini_client
+from app.services.gemini_client import GeminiClient, fallback_response
+from app.services.resilience import Bulkhead, BulkheadFullError, CircuitBreaker
+
+OK = {"mensaje": "ok", "descargo": "d"}
+
+
+class FakeUpstream:
+    """Reemplaza GeminiClient._generate_json: cada modelo puede tardar o fallar."""
+
+    def __init__(self, delays=None, fail=False):
+        self.delays = delays or {}
+        self.fail = fail
+        self.calls = []
+
+    async def __call__(self, contents, config, model):
+        self.calls.append(model)
+        await asyncio.sleep(self.delays.get(model, 0))
+        if self.fail:
+            raise RuntimeError("Gemini no disponible")
+        return {**OK, "model": model}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_TIMEOUT", 0.2)
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_AFTER", None)
+    c = GeminiClient(api_key="test-key", model="primary")
+    c.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    return c
+
+
+def test_timeout_returns_fallback(client):
+    client._generate_json = FakeUpstream(delays={"primary": 1})
+
+    assert asyncio.run(client.generate("p")) == fallback_response()
+    assert client.metrics["timeouts"] == 1
+
+
+def test_breaker_opens_and_fails_fast(client):
+    upstream = FakeUpstream(fail=True)
+    client._generate_json = upstream
+
+    async def run():
+        return [await client.generate("p") for _ in range(4)]
+
+    results = asyncio.run(run())
+
+    assert all(result == fallback_response() for result in results)
+    assert len(upstream.calls) == 2  # las dos últimas no llegan a Gemini
+    assert client.metrics["short_circuited"] == 2
+    assert client.breaker.stats()["state"] == "open"
+
+
+def test_half_open_probe_closes_breaker(client):
+    upstream = FakeUpstream(fail=True)
+    client._generate_json = upstream
+
+    async def run():
+        await client.generate("p")
+        await client.generate("p")
+        assert client.breaker.stats()["state"] == "open"
+
+        await asyncio.sleep(0.15)  # pasa reset_timeout: se permite una prueba
+        upstream.fail = False
+        return await client.generate("p")
+
+    assert asyncio.run(run())["mensaje"] == "ok"
+    assert client.breaker.stats()["state"] == "closed"
+    assert client.breaker.stats()["consecutive_failures"] == 0
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow() is True
+    assert breaker.allow() is False  # la prueba sigue en curso
+    breaker.cancel_probe()
+    assert breaker.allow() is True
+
+
+def test_bulkhead_rejects_when_full(client):
+    client.bulkhead = Bulkhead(max_concurrency=1, queue_timeout=0.01)
+    client._generate_json = FakeUpstream(delays={"primary": 0.1})
+
+    async def run():
+        return await asyncio.gather(client.generate("a"), client.generate("b"))
+
+    first, second = asyncio.run(run())
+
+    assert first["mensaje"] == "ok"
+    assert second == fallback_response()
+    assert client.bulkhead.stats()["rejected"] == 1
+
+
+def test_bulkhead_raises_bulkhead_full_error():
+    bulkhead = Bulkhead(max_concurrency=1, queue_timeout=0.01)
+
+    async def run():
+        async with bulkhead:
+            with pytest.raises(BulkheadFullError):
+                async with bulkhead:
+                    pass
+
+    asyncio.run(run())
+
+
+def test_hedge_wins_when_primary_is_slow(client, monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_AFTER", 0.02)
+    client.hedge_model = "backup"
+    upstream = FakeUpstream(delays={"primary": 0.15, "backup": 0.01})
+    client._generate_json = upstream
+
+    result = asyncio.run(client.generate("p"))
+
+    assert result["model"] == "backup"
+    assert upstream.calls == ["primary", "backup"]
+    assert client.metrics["hedged"] == 1
+    assert client.metrics["hedge_wins"] == 1
+
+
+def test_no_hedge_when_primary_is_fast(client, monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_AFTER", 0.05)
+    client.hedge_model = "backup"
+    upstream = FakeUpstream()
+    client._generate_json = upstream
+
+    assert asyncio.run(client.generate("p"))["model"] == "primary"
+    assert upstream.calls == ["primary"]
+    assert client.metrics["hedged"] == 0
+
+
+class FakeSDK:
+    """Reemplaza client.client: cada llamada toma el siguiente retraso de la lista."""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.calls = 0
+        self.aio = self
+        self.models = self
+
+    async def generate_content(self, model, contents, config):
+        self.calls += 1
+        await asyncio.sleep(self.delays.pop(0))
+        return type("Response", (), {"text": '{"mensaje": "ok", "descargo": "d"}'})()
+
+    async def generate_content_stream(self, model, contents, config):
+        async def chunks():
+            yield type("Chunk", (), {"text": '{"mensaje": "'})()
+            await asyncio.sleep(self.delays.pop(0))
+            yield type("Chunk", (), {"text": 'ok"}'})()
+        return chunks()
+
+
+def test_slow_attempt_leaves_budget_for_the_retry(client, monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_TIMEOUT", 0.4)
+    monkeypatch.setattr(gemini_client, "GEMINI_RETRIES", 1)
+    monkeypatch.setattr(gemini_client, "wait_exponential_jitter", lambda **kwargs: wait_none())
+    client.client = FakeSDK(delays=[5, 0])
+
+    assert asyncio.run(client.generate("p"))["mensaje"] == "ok"
+    assert client.client.calls == 2
+    assert client.metrics["timeouts"] == 0
+
+
+def test_stream_is_cut_when_chunks_stop(client, monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_STREAM_IDLE_TIMEOUT", 0.05)
+    client.client = FakeSDK(delays=[5])
+
+    async def consume():
+        received = []
+        with pytest.raises(asyncio.TimeoutError):
+            async for text in client.generate_stream("p"):
+                received.append(text)
+        return received
+
+    assert asyncio.run(consume()) == ['{"mensaje": "']
+    assert client.metrics["timeouts"] == 1
+    assert client.breaker.stats()["consecutive_failures"] == 1
@@ -0,0 +1,32 @@
+import asyncio
+
+from app.utils import security
+
+
+def test_password_pool_survives_a_second_lifespan(monkeypatch):
+    # Costo mínimo para que la prueba sea rápida
+    monkeypatch.setattr(security, "pwd_context", security.pwd_context.copy(bcrypt__rounds=4, bcrypt__min_rounds=4))
+
+    async def lifespan_cycle():
+        stored = await security.hash_password_async("contraseña-1")
+        valid, _ = await security.verify_and_update_password("contraseña-1", stored)
+        security.shutdown_password_pool()  # lo que hace el cierre del lifespan
+        return valid
+
+    assert asyncio.run(lifespan_cycle())
+    assert asyncio.run(lifespan_cycle())
+
+
+def test_lower_cost_hash_is_upgraded_on_login(monkeypatch):
+    monkeypatch.setattr(security, "pwd_context", security.pwd_context.copy(bcrypt__rounds=5, bcrypt__min_rounds=5))
+    old_hash = security.pwd_context.hash("contraseña-1", rounds=4)
+
+    async def login():
+        result = await security.verify_and_update_password("contraseña-1", old_hash)
+        security.shutdown_password_pool()
+        return result
+
+    valid, new_hash = asyncio.run(login())
+
+    assert valid
+    assert new_hash is not None and new_hash.startswith("$2b$05$")
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from app.services import analysis_orchestrator
+from app.services.single_flight import SingleFlight
+
+LOCATION = {"lat": 4.61, "lng": -74.08}
+
+
+class FakeGemini:
+    """Cliente falso: cuenta las llamadas y tarda lo suficiente para que se solapen."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"mensaje": f"respuesta {self.calls}", "descargo": "d"}
+
+    async def generate_summary(self, ai_response):
+        return {"tema": "Tema", "resumen": ai_response["mensaje"], "descargo": "d"}
+
+
+@pytest.fixture(autouse=True)
+def no_ai_cache(monkeypatch):
+    # Sin caché de IA: cada clave que no esté en vuelo llega a Gemini
+    async def get_cached(key):
+        return None
+
+    async def set_cached(key, ai_response, ai_summary):
+        pass
+
+    monkeypatch.setattr(analysis_orchestrator, "get_cached_ai_content", get_cached)
+    monkeypatch.setattr(analysis_orchestrator, "set_cached_ai_content", set_cached)
+    monkeypatch.delenv("GEMINI_SINGLE_CALL", raising=False)
+
+
+def test_concurrent_identical_requests_make_one_upstream_call():
+    gemini = FakeGemini()
+
+    async def run():
+        return await asyncio.gather(*(
+            analysis_orchestrator.get_or_generate_ai_content(gemini, "Septoria_leaf_spot", LOCATION)
+            for _ in range(10)
+        ))
+
+    results = asyncio.run(run())
+
+    assert gemini.calls == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_different_keys_are_not_coalesced():
+    gemini = FakeGemini()
+
+    async def run():
+        await asyncio.gather(
+            analysis_orchestrator.get_or_generate_ai_content(gemini, "Septoria_leaf_spot", LOCATION),
+            analysis_orchestrator.get_or_generate_ai_content(gemini, "Early_blight", LOCATION),
+        )
+
+    asyncio.run(run())
+
+    assert gemini.calls == 2
+
+
+def test_error_reaches_every_waiter_and_key_is_released():
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("falló")
+
+    async def run():
+        results = await asyncio.gather(
+            *(flight.do("k", failing) for _ in range(5)), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        # La clave se libera: la siguiente llamada vuelve a ejecutar la función
+        with pytest.raises(RuntimeError):
+            await flight.do("k", failing)
+
+    asyncio.run(run())
+
+    assert calls == 2
+    assert flight.stats() == {"leaders": 2, "followers": 4, "in_flight": 0}
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run()) == "ok"
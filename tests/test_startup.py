@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.services import gemini_client
+from app.utils.security import create_access_token
+
+
+@pytest.fixture
+def app_without_gemini_key(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr(gemini_client.gemini_holder, "client", None)
+
+    # Lo que necesita MongoDB no es lo que se prueba aquí
+    async def noop(*args, **kwargs):
+        return None
+
+    for name in ("connect_to_mongodb", "close_mongodb", "ensure_indexes", "start_ai_workers", "stop_ai_workers"):
+        monkeypatch.setattr(main, name, noop)
+    for name in ("init_blob_store", "start_user_deletion_worker"):
+        monkeypatch.setattr(main, name, lambda: None)
+    monkeypatch.setattr(main.analysis_hub, "start", lambda: None)
+    monkeypatch.setattr(main.analysis_hub, "stop", noop)
+    return main.app
+
+
+def test_app_starts_without_gemini_key(app_without_gemini_key):
+    with TestClient(app_without_gemini_key) as client:
+        assert client.get("/").status_code == 200
+        assert gemini_client.gemini_holder.client is None
+
+        # Solo lo que usa Gemini informa que falta la clave
+        token = create_access_token({"user_id": "admin", "role": "admin"})
+        response = client.get("/metrics/gemini", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 503
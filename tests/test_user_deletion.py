@@ -0,0 +1,160 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.services import image_storage, image_variants, stats_service, user_deletion
+from app.services.user_deletion import USER_DELETION_JOBS, run_user_deletion
+from tests.fakes import FakeDatabase
+
+
+class FakeBlobStore:
+    def __init__(self, db: FakeDatabase):
+        self.files = db["fs.files"]
+        self.data_deleted = []
+
+    async def delete_data_many(self, blob_ids):
+        self.data_deleted.extend(blob_ids)
+
+    async def delete_many(self, blob_ids):
+        await self.files.delete_many({"_id": {"$in": blob_ids}})
+        await self.delete_data_many(blob_ids)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase()
+    store = FakeBlobStore(db)
+    for module in (user_deletion, image_storage, stats_service):
+        monkeypatch.setattr(module, "get_database", lambda: db)
+    for module in (image_storage, image_variants):
+        monkeypatch.setattr(module, "get_blob_store", lambda: store)
+    db.store = store
+    return db
+
+
+def _image(db, ref_count=1) -> ObjectId:
+    image_id = ObjectId()
+    db["fs.files"].docs.append({"_id": image_id, "metadata": {"sha256": str(image_id), "ref_count": ref_count}})
+    return image_id
+
+
+def _analysis(db, user_id, image_id) -> ObjectId:
+    analysis_id = ObjectId()
+    db["plant_analysis"].docs.append({
+        "_id": analysis_id,
+        "user_id": user_id,
+        "prediction": "Septoria_leaf_spot",
+        "location": {"lat": 4.6, "lng": -74.0},
+        "image_url": image_id,
+        "created_at": datetime(2025, 1, 1),
+    })
+    return analysis_id
+
+
+def _file(db, image_id):
+    return db["fs.files"]._find({"_id": image_id})
+
+
+def _schedule(db, user_id):
+    db[USER_DELETION_JOBS].docs.append({"_id": user_id, "analyses_deleted": 0, "images_deleted": 0})
+
+
+def test_unused_images_are_deleted(db):
+    user_id = ObjectId()
+    shared = _image(db, ref_count=2)
+    own = _image(db)
+    _analysis(db, user_id, shared)
+    _analysis(db, user_id, shared)
+    _analysis(db, user_id, own)
+    _schedule(db, user_id)
+
+    result = asyncio.run(run_user_deletion(user_id))
+
+    assert result == {"analyses_deleted": 3, "images_deleted": 2}
+    assert db["plant_analysis"].docs == []
+    assert db["fs.files"].docs == []
+    assert sorted(db.store.data_deleted) == sorted([shared, own])
+
+
+def test_image_reused_by_a_concurrent_upload_is_kept(db):
+    user_id = ObjectId()
+    image_id = _image(db)
+    _analysis(db, user_id, image_id)
+    _schedule(db, user_id)
+    # Otra subida ya reutilizó la imagen (ref_count 2) pero aún no guardó su análisis
+    asyncio.run(image_storage._reuse_existing(str(image_id)))
+
+    result = asyncio.run(run_user_deletion(user_id))
+
+    assert result["images_deleted"] == 0
+    doc = _file(db, image_id)
+    assert doc["metadata"]["ref_count"] == 1
+    assert doc["metadata"]["released_by"] == []
+    assert "last_reused_at" in doc["metadata"]
+
+
+def test_resumed_batch_is_not_released_twice(db):
+    user_id = ObjectId()
+    image_id = _image(db, ref_count=2)
+    _analysis(db, ObjectId(), image_id)
+    # El proceso murió tras borrar el análisis y descontar la imagen,
+    # antes de quitar el lote del trabajo
+    batch_id = ObjectId()
+    _file(db, image_id)["metadata"].update({"ref_count": 1, "released_by": [batch_id]})
+    _schedule(db, user_id)
+    db[USER_DELETION_JOBS].docs[0]["pending_batch"] = {
+        "_id": batch_id,
+        "analysis_ids": [ObjectId()],
+        "images": [{"image_id": image_id, "count": 1}]
+    }
+
+    asyncio.run(run_user_deletion(user_id))
+
+    assert _file(db, image_id)["metadata"] == {"sha256": str(image_id), "ref_count": 1, "released_by": []}
+    assert "pending_batch" not in db[USER_DELETION_JOBS].docs[0]
+
+
+def test_batch_interrupted_before_delete_is_finished(db):
+    user_id = ObjectId()
+    image_id = _image(db)
+    analysis_id = _analysis(db, user_id, image_id)
+    _schedule(db, user_id)
+    db[USER_DELETION_JOBS].docs[0]["pending_batch"] = {
+        "_id": ObjectId(),
+        "analysis_ids": [analysis_id],
+        "images": [{"image_id": image_id, "count": 1}]
+    }
+
+    result = asyncio.run(run_user_deletion(user_id))
+
+    assert result == {"analyses_deleted": 1, "images_deleted": 1}
+    assert db["plant_analysis"].docs == []
+    assert db["fs.files"].docs == []
+
+
+def test_failed_job_waits_before_the_next_attempt(db, monkeypatch):
+    user_id = ObjectId()
+    asyncio.run(user_deletion.schedule_user_deletion(user_id))
+
+    async def mongo_down(user_id):
+        raise RuntimeError("MongoDB no disponible")
+
+    monkeypatch.setattr(user_deletion, "run_user_deletion", mongo_down)
+
+    async def claim_and_fail():
+        job = await user_deletion.claim_user_deletion_job()
+        await user_deletion.process_user_deletion_job(job)
+        # El worker vuelve a buscar enseguida: no debe retomar el mismo trabajo
+        return await user_deletion.claim_user_deletion_job()
+
+    assert asyncio.run(claim_and_fail()) is None
+    job = db[USER_DELETION_JOBS].docs[0]
+    assert job["status"] == "pending"
+    assert job["attempts"] == 1
+    assert (job["next_attempt_at"] - datetime.utcnow()).total_seconds() > user_deletion.USER_DELETION_RETRY_BASE - 5
+
+    # Cumplido el plazo se reintenta
+    job["next_attempt_at"] = datetime.utcnow()
+    assert asyncio.run(user_deletion.claim_user_deletion_job())["attempts"] == 2
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.database.indexes import index_state
+from app.schemas.user_schemas import UserRegisterSchema
+from app.services import plant_analysis_service, stats_service, user_deletion, user_service
+from app.services.plant_analysis_service import delete_analysis
+from app.services.user_service import delete_user, register_user, update_user
+from tests.fakes import FakeDatabase
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase(unique={"users": ("email",)})
+    for module in (user_service, user_deletion, plant_analysis_service, stats_service):
+        monkeypatch.setattr(module, "get_database", lambda: db)
+
+    # bcrypt no es lo que se mide aquí
+    async def hash_password_async(password):
+        return f"hash:{password}"
+
+    async def release_image(image_id):
+        return False
+
+    monkeypatch.setattr(user_service, "hash_password_async", hash_password_async)
+    monkeypatch.setattr(plant_analysis_service, "release_image", release_image)
+    monkeypatch.setattr(index_state, "users_email_unique", True)
+    return db
+
+
+def _register(email: str = "ana@example.com"):
+    return asyncio.run(register_user(UserRegisterSchema(name="Ana", email=email, password="secreta123")))
+
+
+def test_register_is_a_single_insert(db):
+    _register()
+    assert db.calls == [("users", "insert_one")]
+
+
+def test_duplicate_email_is_rejected_by_the_index(db):
+    _register()
+    db.reset_calls()
+
+    with pytest.raises(HTTPException) as error:
+        _register()
+    assert error.value.status_code == 400
+    assert db.calls == [("users", "insert_one")]
+
+
+def test_without_the_index_the_email_is_checked_first(db, monkeypatch):
+    # Sin índice único la base de datos aceptaría el duplicado
+    db["users"].unique = ()
+    monkeypatch.setattr(index_state, "users_email_unique", False)
+    _register()
+    db.reset_calls()
+
+    with pytest.raises(HTTPException) as error:
+        _register()
+    assert error.value.status_code == 400
+    assert db.calls == [("users", "find_one")]
+    assert len(db["users"].docs) == 1
+
+
+def test_update_is_a_single_find_one_and_update(db):
+    user_id = _register().id
+    db.reset_calls()
+
+    response = asyncio.run(update_user(user_id, {"name": "Ana María", "role": "admin"}))
+    assert response.name == "Ana María"
+    assert db.calls == [("users", "find_one_and_update")]
+    assert "role" not in db["users"].docs[0]
+
+
+def test_update_to_a_taken_email_is_rejected(db):
+    _register("otra@example.com")
+    user_id = _register().id
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(update_user(user_id, {"email": "otra@example.com"}))
+    assert error.value.status_code == 400
+
+
+def test_delete_user_is_one_users_round_trip(db):
+    user_id = _register().id
+    db.reset_calls()
+
+    asyncio.run(delete_user(user_id))
+    assert db.round_trips("users") == 1
+    assert db["users"].docs == []
+    # El resto de sus datos se borra en segundo plano; el trabajo se guarda primero
+    assert db.calls == [("user_deletion_jobs", "update_one"), ("users", "delete_one")]
+    assert db["user_deletion_jobs"].docs[0]["status"] == "pending"
+
+
+def test_deleting_a_missing_user_leaves_no_job(db):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(delete_user(str(ObjectId())))
+    assert error.value.status_code == 404
+    assert db["user_deletion_jobs"].docs == []
+
+
+def test_delete_analysis_is_one_round_trip(db):
+    analysis_id = ObjectId()
+    db["plant_analysis"].docs.append({
+        "_id": analysis_id,
+        "user_id": ObjectId(),
+        "prediction": "Septoria_leaf_spot",
+        "location": {"lat": 4.6, "lng": -74.0},
+        "image_url": ObjectId(),
+        "created_at": datetime(2025, 1, 1),
+    })
+
+    assert asyncio.run(delete_analysis(str(analysis_id)))
+    assert db.round_trips("plant_analysis") == 1
+    assert db["plant_analysis"].docs == []